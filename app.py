@@ -1,16 +1,26 @@
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+from contextlib import asynccontextmanager
+import asyncio
 from urllib.parse import urlparse
-from fastapi import FastAPI, HTTPException, Body, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import logging
+import os
 from datetime import datetime
 from codebase_map import CodebaseMapper
-from github_reader import fetch_github_files
-from llm_handler import generate_initial_diagram, generate_question_diagram
+from github_reader import iter_github_files, repo_slug, resolve_commit
+from snapshot_cache import SnapshotCache
+from llm_handler import (
+    generate_initial_diagram_async, generate_question_diagram_async,
+    stream_initial_diagram, stream_question_diagram
+)
+from utils.concurrency import run_blocking, shutdown_blocking_pool
 from raw_document import RawDocument
-from ingestor import GitHubIngestor
-from processor import GitHubProcessor
+from indexing_job_dao import IndexingJobDAO
 from embedding_manager import OpenAIEmbedder
+from embedding_cache import CachedEmbedder
+from retrieval_cache import ALL_REPOS, RetrievalCache
 from processed_document_dao import ProcessedDocumentDAO
 import json
 from dotenv import load_dotenv
@@ -21,7 +31,21 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# App-scoped DAO sharing one Postgres pool and one Qdrant client, set up in lifespan()
+document_dao: Optional[ProcessedDocumentDAO] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global document_dao
+    document_dao = ProcessedDocumentDAO(embedder=embedder)
+    try:
+        yield
+    finally:
+        await document_dao.aclose()
+        document_dao = None
+        shutdown_blocking_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -34,70 +58,115 @@ app.add_middleware(
 
 # Initialize CodebaseMapper
 codebase_mapper = CodebaseMapper()
+repo_map_token_budget = int(os.getenv("REPO_MAP_TOKEN_BUDGET", "2048"))
 
-# Add a global variable to track processing status for repositories
-processing_status = {}
+# Repository snapshots shared by the diagram path and background ingestion
+snapshot_cache = SnapshotCache()
 
-def process_repo_background(url: str):
-    """
-    Background function to handle the time-consuming processing steps.
-    """
-    try:
-        logger.info(f"Starting background processing for {url}")
-        processing_status[url] = "processing"
-        
-        # Process and store files for future questions
-        github_ingestor = GitHubIngestor(url=url) 
-        raw_docs = github_ingestor.ingest()
-        
-        processor = GitHubProcessor(embedder=OpenAIEmbedder())
-        processed_docs = processor.process(raw_docs)
-        
-        processing_status[url] = "completed"
-        logger.info(f"Background processing completed for {url}")
-    except Exception as e:
-        processing_status[url] = "failed"
-        logger.error(f"Background processing failed for {url}: {str(e)}")
+# Embeddings are content-addressed, so unchanged chunks skip the API
+embedder = CachedEmbedder(OpenAIEmbedder())
+# Questions bypass the persistent chunk cache, where every unique one would push out a chunk
+# vector; repeated questions are served by the retrieval cache instead
+query_embedder = embedder.embedder
+# Keyed on the index version recorded by the indexing workers
+retrieval_cache = RetrievalCache(version_source=IndexingJobDAO.index_version)
 
-def query_embeddings(query: str) -> List[Dict]:
+# Per-endpoint limits on in-flight requests; extra requests wait for a slot
+generate_diagram_limit = asyncio.Semaphore(int(os.getenv("GENERATE_DIAGRAM_CONCURRENCY", "16")))
+ask_question_limit = asyncio.Semaphore(int(os.getenv("ASK_QUESTION_CONCURRENCY", "32")))
+
+async def query_embeddings(query: str, top_k: int = 5, repo_id: Optional[str] = None) -> List[Dict]:
     """
     Retrieves relevant documents from the vector database based on the query.
+    Repeated questions are answered from the retrieval cache until the index changes.
+    :param repo_id: Only search chunks of this repository ('owner/repo'); all repositories when omitted
     """
     try:
-        dao = ProcessedDocumentDAO(embedder=OpenAIEmbedder())
-        results = dao.search(query, top_k=5)
+        key = await run_blocking(retrieval_cache.results_key, query, top_k, repo_id or ALL_REPOS)
+        results = retrieval_cache.get_results(key)
+        if results is not None:
+            return results
+
+        async def embed_query():
+            query_vector = retrieval_cache.get_embedding(query_embedder.model, query_embedder.dimensions, query)
+            if query_vector is None:
+                query_vector = (await query_embedder.embed_texts_async([query]))[0]
+                retrieval_cache.set_embedding(query_embedder.model, query_embedder.dimensions, query, query_vector)
+            return query_vector
+
+        filters = {"repo_id": repo_id} if repo_id else {}
+        # BM25 and vector results fused; questions naming a defined symbol skip the embedding
+        results = await document_dao.hybrid_search_async(query, embed_query, top_k=top_k, **filters)
+        if results:
+            retrieval_cache.set_results(key, results)
         return results
     except Exception as e:
         logger.error(f"Error querying embeddings: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_repo_map(url: str, revision: Tuple[str, str]) -> str:
+    """Fetch a repository snapshot and map it; blocking, so callers run it in the thread pool"""
+    # Stream GitHub files straight into the mapper
+    files = iter_github_files(repo_url=url, cache=snapshot_cache, revision=revision)
+
+    # Generate codebase map from the most central definitions that fit the budget
+    return codebase_mapper.generate_repo_map(files, token_budget=repo_map_token_budget)
+
+def _validate_github_url(url: str) -> None:
+    parsed_url = urlparse(url)
+    if not all([parsed_url.scheme, parsed_url.netloc]) or 'github.com' not in parsed_url.netloc:
+        raise HTTPException(status_code=400, detail="Invalid GitHub URL")
+
+def _schedule_processing(url: str, revision: Tuple[str, str]) -> str:
+    """
+    Queue the commit for the indexing workers; a commit that is already queued,
+    running or indexed is not queued again. Returns the job's status.
+    """
+    try:
+        branch, commit = revision
+        job = IndexingJobDAO.enqueue(repo_id=repo_slug(url), repo_url=url, branch=branch, commit=commit)
+        return job["status"]
+    except Exception as e:
+        # The diagram does not depend on indexing, so it is still returned
+        logger.error(f"Could not queue indexing for {url}: {str(e)}")
+        return "failed"
+
+def _repo_filter(repo: Optional[str]) -> Optional[str]:
+    """Repository ID for a GitHub URL or 'owner/repo' given to a question endpoint"""
+    if not repo:
+        return None
+    try:
+        return repo_slug(repo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    # Disable proxy buffering so each event reaches the browser as soon as it is written
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/generate_diagram")
-async def generate_diagram(url: str = Body(..., embed=True), background_tasks: BackgroundTasks = None):
+async def generate_diagram(url: str = Body(..., embed=True)):
     """
     Endpoint to generate an initial diagram from a GitHub repository URL.
-    This endpoint now returns the diagram immediately while processing in the background.
+    Indexing for questions is queued first and runs in the worker pool meanwhile.
     """
     try:
-        # Validate URL
-        parsed_url = urlparse(url)  
-        if not all([parsed_url.scheme, parsed_url.netloc]) or 'github.com' not in parsed_url.netloc:
-            raise HTTPException(status_code=400, detail="Invalid GitHub URL")
+        _validate_github_url(url)
 
-        # Fetch GitHub files
-        files = fetch_github_files(repo_url=url)
-        
-        # Generate codebase map
-        repo_map = codebase_mapper.generate_repo_map(files)
-        
-        # Generate initial diagram immediately using only the codebase map
-        diagram_code = generate_initial_diagram(repo_map)
-        
-        # Start background processing if not already in progress
-        if url not in processing_status or processing_status[url] == "failed":
-            # Add the background task
-            background_tasks.add_task(process_repo_background, url)
+        async with generate_diagram_limit:
+            revision = await run_blocking(resolve_commit, url)
+            status = await run_blocking(_schedule_processing, url, revision)
+            repo_map = await run_blocking(build_repo_map, url, revision)
+
+            # Generate initial diagram immediately using only the codebase map
+            diagram_code = await generate_initial_diagram_async(repo_map)
         
-        return {"diagram_code": diagram_code, "processing_status": processing_status.get(url, "starting")}
+        return {"diagram_code": diagram_code, "processing_status": status}
 
     except HTTPException:
         raise
@@ -105,28 +174,79 @@ async def generate_diagram(url: str = Body(..., embed=True), background_tasks: B
         logger.error(f"Error in generate_diagram: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate_diagram/stream")
+async def generate_diagram_stream(url: str = Body(..., embed=True)):
+    """
+    Streaming variant of /generate_diagram. Sends `status` events while the
+    repository is mapped, `delta` events with Mermaid text as the model writes
+    it, then a final `done` (or `error`) event.
+    """
+    _validate_github_url(url)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async with generate_diagram_limit:
+                yield sse_event("status", {"stage": "mapping"})
+                revision = await run_blocking(resolve_commit, url)
+                status = await run_blocking(_schedule_processing, url, revision)
+                repo_map = await run_blocking(build_repo_map, url, revision)
+                yield sse_event("status", {"stage": "generating"})
+                async for text in stream_initial_diagram(repo_map):
+                    yield sse_event("delta", {"text": text})
+            yield sse_event("done", {"processing_status": status})
+        except Exception as e:
+            logger.error(f"Error in generate_diagram_stream: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return sse_response(events())
+
 @app.get("/processing_status")
 async def get_processing_status(url: str):
     """
-    New endpoint to check the status of background processing.
-    Uses a query parameter instead of a path parameter.
+    Status of the latest indexing job for a repository, with per-stage progress
+    percentages. `indexed` is true once any commit of it has been indexed, so
+    questions can be answered while a newer commit is still being indexed.
     """
-    # URL is now a query parameter
-    status = processing_status.get(url, "not_started")
-    return {"status": status}
+    try:
+        repo_id = repo_slug(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await run_blocking(IndexingJobDAO.latest_for_repo, repo_id)
+    if job is None:
+        return {"status": "not_started", "indexed": False}
+    indexed = job["status"] == "completed" or await run_blocking(IndexingJobDAO.index_version, repo_id) is not None
+    return {
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "indexed": indexed
+    }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Connection pool and cache counters"""
+    return {
+        **document_dao.metrics(),
+        "embedding_cache": embedder.cache.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "snapshot_cache": {"hits": snapshot_cache.hits, "misses": snapshot_cache.misses},
+    }
 
 @app.post("/ask_question")
-async def ask_question(question: str = Body(..., embed=True)):
+async def ask_question(question: str = Body(..., embed=True), repo: Optional[str] = Body(None, embed=True)):
     """
     Endpoint to handle follow-up questions and generate new diagrams.
+    :param repo: GitHub URL or 'owner/repo' to answer from; searches every indexed repository when omitted
     """
+    repo_id = _repo_filter(repo)
     try:
-        # Search for relevant code sections using the question
-        relevant_docs = query_embeddings(question)
-        
-        # Generate new diagram based on question and relevant code
-        diagram_code = generate_question_diagram(question, relevant_docs)
+        async with ask_question_limit:
+            # Search for relevant code sections using the question
+            relevant_docs = await query_embeddings(question, repo_id=repo_id)
+
+            # Generate new diagram based on question and relevant code
+            diagram_code = await generate_question_diagram_async(question, relevant_docs)
         
         return {"diagram_code": diagram_code}
 
@@ -134,4 +254,27 @@ async def ask_question(question: str = Body(..., embed=True)):
         raise
     except Exception as e:
         logger.error(f"Error in ask_question: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ask_question/stream")
+async def ask_question_stream(question: str = Body(..., embed=True), repo: Optional[str] = Body(None, embed=True)):
+    """
+    Streaming variant of /ask_question, with the same events as /generate_diagram/stream.
+    """
+    repo_id = _repo_filter(repo)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async with ask_question_limit:
+                yield sse_event("status", {"stage": "searching"})
+                relevant_docs = await query_embeddings(question, repo_id=repo_id)
+                yield sse_event("status", {"stage": "generating"})
+                async for text in stream_question_diagram(question, relevant_docs):
+                    yield sse_event("delta", {"text": text})
+            yield sse_event("done", {})
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Error in ask_question_stream: {detail}")
+            yield sse_event("error", {"detail": detail})
+
+    return sse_response(events())
@@ -0,0 +1,103 @@
+"""
+Compare the linear-time chunker against the original quadratic one.
+
+Run from the repository root (tree-sitter grammars are loaded from vendor/):
+    python -m benchmarks.bench_chunker
+    python -m benchmarks.bench_chunker --file path/to/large_generated_file.py
+"""
+import argparse
+import time
+from typing import List
+from tree_sitter import Node, Tree
+from chunking import Span, chunker, get_line_number, non_whitespace_len
+from utils.tree_sitter_utils import TreeSitterManager
+
+SAMPLE = '''
+class Widget{i}:
+    """Synthetic class number {i}  with a non-breaking space"""
+
+    def __init__(self, value: int = {i}):
+        self.value = value
+        self.items = [x * {i} for x in range(10)]
+
+    def render(self) -> str:
+        if self.value > 10:
+            return f"<widget id={{self.value}}>"
+        return "<empty/>"
+
+'''
+
+def legacy_chunker(tree: Tree, source_code: bytes, max_chars: int = 512 * 3, coalesce: int = 50) -> List[Span]:
+    """The chunker as it was before the SourceIndex rewrite, kept as the baseline"""
+    def chunk_node(node: Node) -> List[Span]:
+        chunks: List[Span] = []
+        current_chunk = Span(node.start_byte, node.start_byte)
+        for child in node.children:
+            if child.end_byte - child.start_byte > max_chars:
+                chunks.append(current_chunk)
+                current_chunk = Span(child.end_byte, child.end_byte)
+                chunks.extend(chunk_node(child))
+            elif child.end_byte - child.start_byte + len(current_chunk) > max_chars:
+                chunks.append(current_chunk)
+                current_chunk = Span(child.start_byte, child.end_byte)
+            else:
+                current_chunk += Span(child.start_byte, child.end_byte)
+        chunks.append(current_chunk)
+        return chunks
+
+    chunks = chunk_node(tree.root_node)
+    for prev, curr in zip(chunks[:-1], chunks[1:]):
+        prev.end = curr.start
+    if chunks:
+        chunks[-1].end = tree.root_node.end_byte
+
+    new_chunks = []
+    current_chunk = Span(0, 0)
+    for chunk in chunks:
+        current_chunk += chunk
+        if (non_whitespace_len(current_chunk.extract(source_code)) > coalesce and
+            b'\n' in current_chunk.extract(source_code)):
+            new_chunks.append(current_chunk)
+            current_chunk = Span(chunk.end, chunk.end)
+    if len(current_chunk) > 0:
+        new_chunks.append(current_chunk)
+
+    line_chunks = [
+        Span(get_line_number(chunk.start, source_code), get_line_number(chunk.end, source_code))
+        for chunk in new_chunks
+    ]
+    return [chunk for chunk in line_chunks if len(chunk) > 0]
+
+def _time(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run(file_name: str, content: str, ts_manager: TreeSitterManager) -> None:
+    source = content.encode('utf-8')
+    tree = ts_manager.parse_file(file_name, content)
+    legacy, legacy_seconds = _time(legacy_chunker, tree, source)
+    current, current_seconds = _time(chunker, tree, source)
+    assert legacy == current, "chunker output diverged from the legacy implementation"
+    print(f"{file_name:>28} {len(source) / 1024:10.0f} KiB {len(current):7} spans "
+          f"legacy {legacy_seconds * 1000:10.1f} ms  indexed {current_seconds * 1000:8.1f} ms  "
+          f"x{legacy_seconds / max(current_seconds, 1e-9):.1f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="benchmark a real file instead of synthetic Python")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000],
+                        help="number of synthetic classes per generated file")
+    args = parser.parse_args()
+
+    ts_manager = TreeSitterManager()
+    if args.file:
+        with open(args.file, encoding='utf-8') as file:
+            run(args.file, file.read(), ts_manager)
+        return
+    for size in args.sizes:
+        content = "".join(SAMPLE.format(i=i) for i in range(size))
+        run(f"synthetic_{size}.py", content, ts_manager)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Compare the memory held by indexing a large repository with the old document
+representation (a __dict__ per document, one float64 array per embedding, every
+vector turned into a list before the Qdrant upsert) against slotted documents
+whose embeddings are rows of one float32 EmbeddingBatch, sliced into lists one
+upsert batch at a time.
+
+No services are needed: the embeddings API response is simulated, and the
+upsert payloads are built and dropped.
+
+Run from the repository root:
+    python -m benchmarks.bench_documents --chunks 20000 --dimensions 1536
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from embedding_batch import EmbeddingBatch
+from processed_document import ProcessedDocument
+
+class LegacyDocument:
+    """ProcessedDocument as it was before __slots__"""
+    def __init__(self, content, file_name, file_size, timestamp=None, original_file=None, chunk_metadata=None,
+                 embedding=None):
+        self.content = content
+        self.file_name = file_name
+        self.file_size = file_size
+        self.timestamp = timestamp
+        self.original_file = original_file
+        self.embedding = embedding
+        self.chunk_metadata = chunk_metadata
+
+def api_responses(count: int, dimensions: int, per_request: int):
+    """Embedding lists as the OpenAI client hands them over, one request at a time"""
+    rng = np.random.default_rng(0)
+    for start in range(0, count, per_request):
+        yield rng.standard_normal((min(per_request, count - start), dimensions)).tolist()
+
+def make_documents(document_class, count: int):
+    timestamp = datetime.now().isoformat()
+    return [
+        document_class(
+            content=f"def handler_{i}(request):\n    return render(request, 'index.html')\n",
+            file_name=f"src/module_{i // 10}.py",
+            file_size=64,
+            timestamp=timestamp,
+            original_file=f"src/module_{i // 10}.py",
+            chunk_metadata={"repo_id": "bench/repo", "commit": "0" * 40, "language": "python",
+                            "chunk_index": i % 10, "start_line": 1, "end_line": 2}
+        ) for i in range(count)
+    ]
+
+def legacy(count: int, dimensions: int, per_request: int, upsert_batch: int) -> dict:
+    documents = make_documents(LegacyDocument, count)
+    embeddings = []
+    for response in api_responses(count, dimensions, per_request):
+        embeddings.extend(np.array(embedding) for embedding in response)
+    del response
+    for doc, embedding in zip(documents, embeddings):
+        doc.embedding = embedding
+    del embeddings
+    retained = tracemalloc.get_traced_memory()[0]
+    # Every point was built, vector list included, before being split into upsert batches
+    points = [{"id": i, "vector": np.asarray(doc.embedding).tolist()} for i, doc in enumerate(documents)]
+    batches = [points[start:start + upsert_batch] for start in range(0, len(points), upsert_batch)]
+    del points, batches
+    return {"retained": retained, "documents": documents}
+
+def compact(count: int, dimensions: int, per_request: int, upsert_batch: int) -> dict:
+    documents = make_documents(ProcessedDocument, count)
+    matrix = np.empty((count, dimensions), dtype=np.float32)
+    start = 0
+    for response in api_responses(count, dimensions, per_request):
+        batch = EmbeddingBatch(np.array(response, dtype=np.float32))
+        matrix[start:start + len(batch)] = batch.matrix
+        start += len(batch)
+    del response, batch
+    embeddings = EmbeddingBatch(matrix)
+    for doc, embedding in zip(documents, embeddings):
+        doc.embedding = embedding
+    del embeddings, matrix
+    retained = tracemalloc.get_traced_memory()[0]
+    vectors = EmbeddingBatch.from_vectors([doc.embedding for doc in documents])
+    for start in range(0, len(vectors), upsert_batch):
+        vectors.matrix[start:start + upsert_batch].tolist()
+    return {"retained": retained, "documents": documents, "shared": vectors.matrix.base is not None}
+
+def measure(name, run, args) -> None:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = run(args.chunks, args.dimensions, args.per_request, args.upsert_batch)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    extra = f", upsert reused the document matrix: {result['shared']}" if "shared" in result else ""
+    print(f"{name:>8}: retained {result['retained'] / 2**20:8.1f} MiB, peak {peak / 2**20:8.1f} MiB, "
+          f"{elapsed:6.2f} s{extra}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--per-request", type=int, default=1000, help="Embeddings per API response")
+    parser.add_argument("--upsert-batch", type=int, default=256, help="Points per Qdrant upsert")
+    args = parser.parse_args()
+    print(f"{args.chunks} chunks x {args.dimensions} dimensions")
+    measure("legacy", legacy, args)
+    measure("compact", compact, args)
+
+if __name__ == "__main__":
+    main()
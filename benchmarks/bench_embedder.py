@@ -0,0 +1,95 @@
+"""
+Measure OpenAIEmbedder throughput against a local stand-in embeddings server,
+and check that outputs come back in input order.
+
+The stand-in speaks the /v1/embeddings wire format (float and base64 encodings),
+sleeps a fixed latency per request and returns vectors whose first component
+is the input's length, so ordering mistakes are detected.
+
+Run from the repository root:
+    python -m benchmarks.bench_embedder --texts 5000 --latency 0.2
+    python -m benchmarks.bench_embedder --serve 8089   # only run the stand-in server
+"""
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+class StubEmbeddingsHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        dimensions = body.get('dimensions', 1536)
+        time.sleep(self.latency)
+        type(self).requests += 1
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = np.zeros(dimensions, dtype=np.float32)
+            vector[0] = len(text)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.tobytes()).decode('ascii')
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        payload = json.dumps({
+            "object": "list",
+            "data": data,
+            "model": body.get('model'),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(port: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    StubEmbeddingsHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubEmbeddingsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per request")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--serve", type=int, help="only run the stand-in server on this port")
+    args = parser.parse_args()
+
+    if args.serve:
+        start_stub_server(args.serve, args.latency)
+        print(f"Stand-in embeddings server on http://127.0.0.1:{args.serve}/v1")
+        threading.Event().wait()
+
+    from embedding_manager import OpenAIEmbedder
+
+    server = start_stub_server(latency=args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    texts = [f"def function_{i}():\n    return {'x' * (i % 300)}" for i in range(args.texts)]
+
+    os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+    embedder = OpenAIEmbedder(base_url=base_url, max_concurrency=args.concurrency)
+    start = time.perf_counter()
+    embeddings = embedder.embed_texts(texts)
+    elapsed = time.perf_counter() - start
+
+    assert all(int(embedding[0]) == len(text) for embedding, text in zip(embeddings, texts)), "output order mismatch"
+    print(f"{len(texts)} texts in {StubEmbeddingsHandler.requests} requests, {elapsed:.2f} s "
+          f"({len(texts) / elapsed:.0f} texts/s)")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare Postgres write throughput of the old row-by-row inserts (execute_batch
+with embeddings as float8 lists) against binary COPY (embeddings as pgvector, or
+real[] without the extension), for processed_documents-shaped and
+raw_documents-shaped rows.
+
+Everything is written to temporary tables, so the real tables are untouched.
+
+Run from the repository root with the POSTGRES_* settings of the app:
+    python -m benchmarks.bench_pg_load --rows 20000 --dimensions 1536
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+from psycopg2.extras import execute_batch
+from processed_document import ProcessedDocument
+from processed_document_dao import copy_processed_documents
+from utils.pg_copy import copy_rows
+from utils.pg_pool import PostgresPool
+
+def make_documents(count: int, dimensions: int):
+    rng = np.random.default_rng(0)
+    timestamp = datetime.now().isoformat()
+    content = "def handler(request):\n    return render(request, 'index.html')\n" * 8
+    documents = [
+        ProcessedDocument(
+            content=content,
+            file_name=f"src/module_{i}.py_chunk_0",
+            file_size=len(content),
+            timestamp=timestamp,
+            original_file=f"src/module_{i}.py",
+            chunk_metadata={"repo_id": "bench/repo", "chunk_index": 0, "start_line": 1, "end_line": 16},
+            embedding=rng.standard_normal(dimensions).astype(np.float32)
+        ) for i in range(count)
+    ]
+    return [str(uuid.uuid4()) for _ in documents], documents
+
+def create_tables(cur, embedding_type: str) -> None:
+    for name, embedding in (("bench_processed_legacy", "float8[]"), ("bench_processed_copy", embedding_type)):
+        cur.execute(f"""
+            CREATE TEMP TABLE {name} (
+                point_id UUID PRIMARY KEY, repo_id TEXT, content TEXT, file_name TEXT, file_size INTEGER,
+                timestamp TEXT, original_file TEXT, embedding {embedding}
+            )
+        """)
+    for name in ("bench_raw_legacy", "bench_raw_copy"):
+        cur.execute(f"""
+            CREATE TEMP TABLE {name} (
+                id SERIAL PRIMARY KEY, content VARCHAR, file_name VARCHAR, file_size INTEGER,
+                timestamp TIMESTAMP, original_file VARCHAR, chunk_metadata JSON
+            )
+        """)
+
+def legacy_processed(cur, point_ids, documents) -> None:
+    execute_batch(cur, """
+        INSERT INTO bench_processed_legacy
+        (point_id, repo_id, content, file_name, file_size, timestamp, original_file, embedding)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (point_id) DO UPDATE SET embedding = EXCLUDED.embedding
+    """, [
+        (point_id, doc.chunk_metadata["repo_id"], doc.content, doc.file_name, doc.file_size,
+         doc.timestamp, doc.original_file, doc.embedding.tolist())
+        for point_id, doc in zip(point_ids, documents)
+    ])
+
+def legacy_raw(cur, documents) -> None:
+    cur.executemany("""
+        INSERT INTO bench_raw_legacy (content, file_name, file_size, timestamp, original_file, chunk_metadata)
+        VALUES (%s, %s, %s, %s, %s, %s::json)
+    """, [
+        (doc.content, doc.file_name, doc.file_size, datetime.fromisoformat(doc.timestamp),
+         doc.original_file, json.dumps(doc.chunk_metadata))
+        for doc in documents
+    ])
+
+def copy_raw(cur, documents, batch_size: int) -> None:
+    copy_rows(cur, "bench_raw_copy",
+              ["content", "file_name", "file_size", "timestamp", "original_file", "chunk_metadata"], (
+        (doc.content, doc.file_name, doc.file_size, datetime.fromisoformat(doc.timestamp),
+         doc.original_file, doc.chunk_metadata)
+        for doc in documents
+    ), batch_size=batch_size)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per COPY")
+    args = parser.parse_args()
+
+    point_ids, documents = make_documents(args.rows, args.dimensions)
+    pool = PostgresPool.from_env()
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_available_extensions WHERE name = 'vector'")
+        embedding_type = "vector" if cur.fetchone()[0] else "real[]"
+        if embedding_type == "vector":
+            cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        create_tables(cur, embedding_type)
+
+        runs = [
+            ("processed, execute_batch float8[]", lambda: legacy_processed(cur, point_ids, documents),
+             "bench_processed_legacy"),
+            (f"processed, COPY binary {embedding_type}",
+             lambda: copy_processed_documents(cur, point_ids, documents, table="bench_processed_copy",
+                                              batch_size=args.batch_size),
+             "bench_processed_copy"),
+            ("raw, executemany", lambda: legacy_raw(cur, documents), "bench_raw_legacy"),
+            ("raw, COPY binary", lambda: copy_raw(cur, documents, args.batch_size), "bench_raw_copy"),
+        ]
+        print(f"{args.rows} rows, {args.dimensions}-dimension embeddings")
+        for label, run, table in runs:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            cur.execute(f"SELECT pg_total_relation_size('{table}')")
+            size_mb = cur.fetchone()[0] / 1024 ** 2
+            print(f"{label:<40} {args.rows / elapsed:>10.0f} rows/s {size_mb:>9.1f} MB")
+        conn.rollback()
+    pool.close()
+
+if __name__ == "__main__":
+    main()
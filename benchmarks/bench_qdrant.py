@@ -0,0 +1,109 @@
+"""
+Measure recall@k and query latency of Qdrant collection settings (int8
+quantization with and without rescoring, on-disk vectors, HNSW m / ef_construct
+/ ef) against exact search.
+
+Ground truth is brute-force cosine similarity in NumPy. Each setting gets its
+own scratch collection, which is dropped afterwards. Vectors are synthetic
+clustered unit vectors unless --vectors points at an (n, d) .npy file of real
+embeddings, e.g. a dump of processed_documents.embedding.
+
+Run from the repository root against a running Qdrant (QDRANT_URL):
+    python -m benchmarks.bench_qdrant --points 100000 --queries 200 --k 10
+    python -m benchmarks.bench_qdrant --vectors embeddings.npy
+"""
+import argparse
+import os
+import time
+import uuid
+from typing import Dict, List
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from collection_config import CollectionConfig
+
+SETTINGS: Dict[str, Dict] = {
+    "float32": {},
+    "float32 m=32 ef=128": {"hnsw_m": 32, "hnsw_ef_construct": 200, "hnsw_ef": 128},
+    "int8 no rescore": {"quantization": "int8", "rescore": False},
+    "int8 rescore": {"quantization": "int8"},
+    "int8 rescore on_disk": {"quantization": "int8", "on_disk": True},
+    "int8 rescore on_disk ef=128": {"quantization": "int8", "on_disk": True, "hnsw_ef": 128},
+}
+
+def synthetic_vectors(count: int, dimensions: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random centroids, roughly like embeddings of a code base"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    scores = queries @ vectors.T
+    return [set(row) for row in np.argpartition(-scores, k, axis=1)[:, :k].tolist()]
+
+def load_collection(client: QdrantClient, name: str, config: CollectionConfig, vectors: np.ndarray,
+                    batch_size: int = 512) -> None:
+    client.recreate_collection(collection_name=name, **config.create_kwargs())
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        client.upsert(
+            collection_name=name,
+            points=models.Batch(ids=list(range(start, start + len(batch))), vectors=batch.tolist())
+        )
+    # Wait for HNSW and quantization to be built, so searches do not fall back to full scans
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(0.5)
+
+def run_queries(client: QdrantClient, name: str, queries: np.ndarray, k: int,
+                params: models.SearchParams) -> tuple:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = client.query_points(collection_name=name, query=query.tolist(), limit=k, search_params=params)
+        latencies.append(time.perf_counter() - start)
+        results.append({point.id for point in response.points})
+    return results, np.array(latencies) * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=50_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--vectors", help=".npy file of embeddings to use instead of synthetic vectors")
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        vectors = synthetic_vectors(args.points, args.dimensions)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed stored vectors, so each has genuine near neighbours
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL", "http://localhost:6333"), api_key=os.getenv("QDRANT_API_KEY"))
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    print(f"{'setting':<30} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, overrides in SETTINGS.items():
+        config = CollectionConfig(size=vectors.shape[1], **overrides)
+        name = f"bench_{uuid.uuid4().hex[:8]}"
+        try:
+            load_collection(client, name, config, vectors)
+            if label == "float32":
+                _, latencies = run_queries(client, name, queries, args.k, config.search_params(exact=True))
+                print(f"{'exact (full scan)':<30} {1.0:>9.3f} {np.percentile(latencies, 50):>8.2f} "
+                      f"{np.percentile(latencies, 95):>8.2f}")
+            results, latencies = run_queries(client, name, queries, args.k, config.search_params())
+            recall = np.mean([len(found & expected) / args.k for found, expected in zip(results, truth)])
+            print(f"{label:<30} {recall:>9.3f} {np.percentile(latencies, 50):>8.2f} "
+                  f"{np.percentile(latencies, 95):>8.2f}")
+        finally:
+            client.delete_collection(name)
+
+if __name__ == "__main__":
+    main()
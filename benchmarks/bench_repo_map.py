@@ -0,0 +1,62 @@
+"""
+Time repo-map generation with and without the compiled query cache and the
+per-file line index, on a local checkout (a large TypeScript repo is the
+intended workload).
+
+Run from the repository root (grammars and queries are loaded from vendor/ and queries/):
+    python -m benchmarks.bench_repo_map /path/to/typescript/checkout
+"""
+import argparse
+import time
+from typing import Dict, List
+from codebase_map import CodebaseMapper
+from ingestor import LocalDirectoryIngestor
+
+class LegacyCodebaseMapper(CodebaseMapper):
+    """Recompiles the query for every file and re-splits the file for every capture"""
+    def _process_file(self, file: Dict) -> List[str]:
+        lang_name = self.ts_manager.get_language(file['name'])
+        query = self.query_map.get(lang_name, "")
+        if not query or not self.ts_manager.supports(lang_name):
+            return []
+        try:
+            tree = self.ts_manager.parse_file(file['name'], file['content'])
+            captures = self.ts_manager.language_map[lang_name].query(query).captures(tree.root_node)
+        except Exception:
+            return []
+        symbols = []
+        seen = set()
+        for node, tag in captures:
+            snippet = self._get_code_snippet(file['content'].split('\n'), node)
+            if snippet not in seen:
+                symbols.append(f"{tag}: {snippet}")
+                seen.add(snippet)
+        return symbols
+
+def _time_map(mapper: CodebaseMapper, files: List[Dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mapper.generate_repo_map(files)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="local checkout to map")
+    parser.add_argument("--extensions", nargs="+", default=[".ts", ".tsx"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ingestor = LocalDirectoryIngestor(args.path)
+    files = [file for file in ingestor.iter_files() if file['name'].endswith(tuple(args.extensions))]
+    size = sum(len(file['content']) for file in files)
+    print(f"{len(files)} files, {size / 1024 / 1024:.1f} MiB")
+
+    legacy = _time_map(LegacyCodebaseMapper(workers=1), files, args.repeat)
+    current = _time_map(CodebaseMapper(workers=1), files, args.repeat)
+    print(f"legacy  {legacy * 1000:10.1f} ms")
+    print(f"cached  {current * 1000:10.1f} ms  x{legacy / max(current, 1e-9):.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import logging
-from typing import List, Dict
+from bisect import bisect_left
+from typing import List, Dict, Optional, TYPE_CHECKING
 from dataclasses import dataclass
-from tree_sitter import Tree, Node, Parser, Language
+import numpy as np
+from tree_sitter import Tree, Node
 import re
+from utils.tree_sitter_utils import TreeSitterManager
+
+if TYPE_CHECKING:
+    from codebase_map import CodebaseMapper
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +41,45 @@ def non_whitespace_len(text: bytes) -> int:
     decoded = text.decode('utf-8')
     return len(re.sub(r'\s', '', decoded))
 
+# Byte -> 1 if it starts a non-whitespace character. ASCII follows str.isspace (the same
+# set re's \s matches), UTF-8 continuation bytes never start a character.
+_NON_WHITESPACE_TABLE = bytes(
+    (0 if chr(b).isspace() else 1) if b < 0x80 else (0 if b < 0xC0 else 1)
+    for b in range(256)
+)
+# UTF-8 encodings of the non-ASCII characters for which str.isspace() is true;
+# their lead bytes are cleared after the table lookup
+_UNICODE_WHITESPACE = re.compile(b"|".join(
+    re.escape(chr(c).encode('utf-8'))
+    for c in (0x85, 0xA0, 0x1680, *range(0x2000, 0x200B), 0x2028, 0x2029, 0x202F, 0x205F, 0x3000)
+))
+
+class SourceIndex:
+    """
+    Precomputed lookups over a source file so the chunker runs in linear time:
+    sorted newline offsets for byte -> line conversion by binary search, and a
+    prefix sum of non-whitespace characters indexed by byte offset.
+    """
+    def __init__(self, source_code: bytes):
+        self.newlines = [match.start() for match in re.finditer(b'\n', source_code)]
+        flags = bytearray(source_code.translate(_NON_WHITESPACE_TABLE))
+        if not source_code.isascii():
+            for match in _UNICODE_WHITESPACE.finditer(source_code):
+                flags[match.start()] = 0
+        self.non_whitespace_prefix = np.zeros(len(source_code) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(flags, dtype=np.uint8), out=self.non_whitespace_prefix[1:])
+
+    def line_number(self, byte_offset: int) -> int:
+        """Same result as get_line_number, in O(log lines)"""
+        return bisect_left(self.newlines, byte_offset) + 1
+
+    def non_whitespace_len(self, span: 'Span') -> int:
+        """Same result as non_whitespace_len on the span's bytes, in O(1)"""
+        return int(self.non_whitespace_prefix[span.end] - self.non_whitespace_prefix[span.start])
+
+    def has_newline(self, span: 'Span') -> bool:
+        return bisect_left(self.newlines, span.end) > bisect_left(self.newlines, span.start)
+
 def chunker(
     tree: Tree,
     source_code: bytes,
@@ -69,12 +114,13 @@ def chunker(
         chunks[-1].end = tree.root_node.end_byte
 
     # 3. Combine small chunks
+    index = SourceIndex(source_code)
     new_chunks = []
     current_chunk = Span(0, 0)
     for chunk in chunks:
         current_chunk += chunk
-        if (non_whitespace_len(current_chunk.extract(source_code)) > coalesce and 
-            b'\n' in current_chunk.extract(source_code)):
+        if (index.non_whitespace_len(current_chunk) > coalesce and 
+            index.has_newline(current_chunk)):
             new_chunks.append(current_chunk)
             current_chunk = Span(chunk.end, chunk.end)
     if len(current_chunk) > 0:
@@ -83,8 +129,8 @@ def chunker(
     # 4. Convert to line numbers
     line_chunks = [
         Span(
-            get_line_number(chunk.start, source_code),
-            get_line_number(chunk.end, source_code)
+            index.line_number(chunk.start),
+            index.line_number(chunk.end)
         ) for chunk in new_chunks
     ]
 
@@ -93,31 +139,76 @@ def chunker(
 
     return line_chunks
 
+def line_chunker(
+    lines: List[str],
+    max_chars: int = 512 * 3,
+    coalesce: int = 50
+) -> List[Span]:
+    """
+    Fallback for languages without a tree-sitter grammar: pack whole lines into
+    chunks of at most max_chars, merging a small trailing chunk into its predecessor.
+    Returns 1-based inclusive line spans, like chunker().
+    """
+    chunks: List[Span] = []
+    start = 0
+    size = 0
+    for i, line in enumerate(lines):
+        line_size = len(line) + 1
+        if size and size + line_size > max_chars:
+            chunks.append(Span(start + 1, i))
+            start, size = i, 0
+        size += line_size
+    if start < len(lines):
+        tail = Span(start + 1, len(lines))
+        tail_text = "".join(lines[start:])
+        if chunks and len(re.sub(r'\s', '', tail_text)) <= coalesce:
+            chunks[-1] = chunks[-1] + tail
+        else:
+            chunks.append(tail)
+    return chunks
+
 def chunk_file(
     file_info: Dict,
-    parser: Parser,
+    ts_manager: TreeSitterManager,
     max_chars: int = 1500,
-    coalesce: int = 50
-) -> List[Dict]:
-    """Wrapper function that handles file parsing and chunk formatting."""
+    coalesce: int = 50,
+    tagger: Optional['CodebaseMapper'] = None
+) -> Optional[List[Dict]]:
+    """
+    Wrapper function that handles file parsing and chunk formatting.
+    The parser is picked by file extension; files in languages without a
+    grammar are chunked by lines instead, and carry no symbols. Returns None
+    when the file could not be parsed, so callers can tell it from an empty file.
+    :param tagger: Finds the names each chunk defines with the repo map's tag queries; no symbols when omitted
+    """
     if 'name' not in file_info or 'content' not in file_info:
         logger.warning("file_info missing 'name' or 'content'. Skipping...")
         return []
 
     file_name = file_info['name']
     content = file_info['content']
-    source_bytes = content.encode('utf-8')
+    # Split once; re-splitting per chunk made this quadratic in file size
+    lines = content.splitlines()
 
+    definitions = []
     try:
-        tree = parser.parse(source_bytes)
-        chunks = chunker(tree, source_bytes, max_chars, coalesce)
+        parser = ts_manager.get_file_parser(file_name)
+        if parser is None:
+            chunks = line_chunker(lines, max_chars, coalesce)
+        else:
+            source_bytes = content.encode('utf-8')
+            tree = parser.parse(source_bytes)
+            chunks = chunker(tree, source_bytes, max_chars, coalesce)
+            if tagger is not None:
+                definitions = tagger.defined_names(file_info, tree)
     except Exception as e:
         logger.error(f"Failed to parse {file_name}: {str(e)}")
-        return []
+        return None
 
+    definition_lines = [line for _, line in definitions]
     result_chunks = []
     for i, chunk in enumerate(chunks):
-        chunk_content = "\n".join(content.splitlines()[chunk.start-1:chunk.end])
+        chunk_content = "\n".join(lines[chunk.start-1:chunk.end])
         if not chunk_content.strip():
             continue
 
@@ -126,8 +217,15 @@ def chunk_file(
             'file_name': file_name,
             'chunk_index': i,
             'original_file': file_name,
+            'commit': file_info.get('commit'),
             'start_line': chunk.start,
-            'end_line': chunk.end
+            'end_line': chunk.end,
+            # Names defined in the chunk, for the lexical index
+            'symbols': list(dict.fromkeys(
+                name for name, _ in definitions[
+                    bisect_left(definition_lines, chunk.start):bisect_left(definition_lines, chunk.end + 1)
+                ]
+            ))
         })
 
     return result_chunks
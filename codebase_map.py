@@ -1,10 +1,16 @@
 import os
+import math
+import threading
+from collections import Counter, defaultdict
 from pathlib import Path
-from tree_sitter import Node
-from typing import Dict, List
+from tree_sitter import Node, Tree
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import warnings
 import logging
+import numpy as np
+import tiktoken
 from utils.tree_sitter_utils import TreeSitterManager
+from utils.parallel import default_workers, ordered_map
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -13,10 +19,51 @@ logger = logging.getLogger(__name__)
 # Suppress Tree-sitter warnings 
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# Compiled tag queries, shared by every mapper for the lifetime of the process
+_query_cache: Dict[str, Any] = {}
+_query_cache_lock = threading.Lock()
+
+# Per-process mapper used by pool workers; each worker owns its own TreeSitterManager
+_worker_mapper: Optional['CodebaseMapper'] = None
+
+def _init_map_worker() -> None:
+    global _worker_mapper
+    _worker_mapper = CodebaseMapper(workers=1)
+
+def _map_file_worker(file: Dict) -> Tuple[str, List[str]]:
+    return file['name'], _worker_mapper._process_file(file)
+
+def _tag_file_worker(file: Dict) -> Tuple[str, Optional[Dict]]:
+    return file['name'], _worker_mapper._extract_tags(file)
+
+def _pagerank(nodes: List[str], edges: Dict[Tuple[str, str], float],
+              damping: float = 0.85, max_iter: int = 100, tol: float = 1e-8) -> Dict[str, float]:
+    """Weighted PageRank by sparse power iteration; dangling nodes spread their rank uniformly"""
+    n = len(nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    src = np.fromiter((index[s] for s, _ in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((index[d] for _, d in edges), dtype=np.int64, count=len(edges))
+    weights = np.fromiter(edges.values(), dtype=np.float64, count=len(edges))
+    out_weight = np.bincount(src, weights=weights, minlength=n)
+    transition = weights / out_weight[src]
+    dangling = out_weight == 0
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        flow = np.bincount(dst, weights=rank[src] * transition, minlength=n)
+        new_rank = (1 - damping) / n + damping * (flow + rank[dangling].sum() / n)
+        converged = np.abs(new_rank - rank).sum() < n * tol
+        rank = new_rank
+        if converged:
+            break
+    return {node: float(rank[i]) for node, i in index.items()}
+
 class CodebaseMapper:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, ts_manager: Optional[TreeSitterManager] = None):
         logger.debug("Initializing RepoMapper")
-        self.ts_manager = TreeSitterManager()
+        # Parsing and tag queries are CPU-bound, so they scale across processes
+        self.workers = workers or default_workers()
+        self.ts_manager = ts_manager or TreeSitterManager()
         self.query_map = self._load_queries()
         logger.debug(f"Loaded queries: {list(self.query_map.keys())}")
         
@@ -37,15 +84,31 @@ class CodebaseMapper:
             
         return queries
     
-    def _get_code_snippet(self, content: str, node: Node) -> str:
-        """Extract relevant code snippet with context"""
-        start_line = node.start_point[0]
-        end_line = node.end_point[0]
-        lines = content.split('\n')
-        
+    def _get_query(self, lang_name: str) -> Any:
+        """Compile the language's tag query once per process"""
+        query = _query_cache.get(lang_name)
+        if query is None:
+            with _query_cache_lock:
+                query = _query_cache.get(lang_name)
+                if query is None:
+                    query = self.ts_manager.language_map[lang_name].query(self.query_map[lang_name])
+                    _query_cache[lang_name] = query
+        return query
+
+    def _get_code_snippet(self, lines: List[str], node: Node) -> str:
+        """Extract relevant code snippet with context from the file's pre-split lines"""
+        return self._format_snippet(lines, node.start_point[0], node.end_point[0])
+
+    def _format_snippet(self, lines: Union[List[str], Dict[int, str]], start_line: int, end_line: int,
+                        line_count: Optional[int] = None) -> str:
+        """
+        Format 0-based lines start_line..end_line with surrounding context.
+        lines is either the whole file or the {line number: text} kept by
+        _definition_lines, in which case line_count is the file's length.
+        """
         # Show 2 lines before and after
         context_start = max(0, start_line - 2)
-        context_end = min(len(lines), end_line + 3)
+        context_end = min(len(lines) if line_count is None else line_count, end_line + 3)
         
         snippet = []
         for i in range(context_start, context_end):
@@ -55,38 +118,47 @@ class CodebaseMapper:
             
         return '\n'.join(snippet)
     
-    def _process_file(self, file: Dict) -> List[str]:
-        """Process a single file to extract key symbols"""
+    def _get_captures(self, file: Dict, tree: Optional[Tree] = None) -> Optional[List[Tuple[Node, str]]]:
+        """Parse a file (unless its tree is given) and run its language's tag query, or return None on failure"""
         lang_name = self.ts_manager.get_language(file['name'])
         logger.debug(f"Processing file {file['name']} with language {lang_name}")
         
-        try:
-            tree = self.ts_manager.parse_file(file['name'], file['content'])
-            logger.debug(f"Successfully parsed {file['name']}")
-        except ValueError as e:
-            logger.error(f"Error processing file {file['name']}: {str(e)}")
-            return []
-        except Exception as e:
-            logger.error(f"Error parsing {file['name']}: {str(e)}")
-            return []
+        if tree is None:
+            try:
+                tree = self.ts_manager.parse_file(file['name'], file['content'])
+                logger.debug(f"Successfully parsed {file['name']}")
+            except ValueError as e:
+                logger.error(f"Error processing file {file['name']}: {str(e)}")
+                return None
+            except Exception as e:
+                logger.error(f"Error parsing {file['name']}: {str(e)}")
+                return None
         
         # Get language-specific query
-        query = self.query_map.get(lang_name, "")
-        if not query:
+        if not self.query_map.get(lang_name):
             logger.warning(f"No query available for language {lang_name}")
-            return []
+            return None
             
         try:
-            captures = self.ts_manager.language_map[lang_name].query(query).captures(tree.root_node)
+            captures = self._get_query(lang_name).captures(tree.root_node)
             logger.debug(f"Found {len(captures)} captures in {file['name']}")
         except Exception as e:
             logger.error(f"Error querying {file['name']}: {str(e)}")
+            return None
+        return captures
+
+    def _process_file(self, file: Dict) -> List[str]:
+        """Process a single file to extract key symbols"""
+        captures = self._get_captures(file)
+        if not captures:
             return []
         
         symbols = []
         seen = set()
+        # One line index per file instead of one split per capture
+        lines = file['content'].split('\n')
         for node, tag in captures:
-            snippet = self._get_code_snippet(file['content'], node)
+            snippet = self._get_code_snippet(lines, node)
             if snippet not in seen:
                 # Add both snippet and tag type
                 symbols.append(f"{tag}: {snippet}")
@@ -95,22 +167,186 @@ class CodebaseMapper:
         logger.debug(f"Extracted {len(symbols)} symbols from {file['name']}")
         return symbols
     
-    def generate_repo_map(self, files: List[Dict]) -> str:
-        """Main entry point to generate repo map"""
+    def _map_files(self, files: Iterable[Dict]) -> Iterable[Tuple[str, List[str]]]:
+        """Extract symbols per file in input order, on a process pool when configured"""
+        non_empty = (file for file in files if file['content'].strip())
+        if self.workers <= 1:
+            return ((file['name'], self._process_file(file)) for file in non_empty)
+        return ordered_map(_map_file_worker, non_empty, workers=self.workers, initializer=_init_map_worker)
+
+    def _extract_tags(self, file: Dict, tree: Optional[Tree] = None) -> Optional[Dict]:
+        """
+        Collect a file's definitions and references without formatting snippets.
+        Definitions are (identifier, tag, start_line, end_line) from @name.definition.*
+        captures; references are identifiers from @name.reference.* captures.
+        """
+        captures = self._get_captures(file, tree)
+        if not captures:
+            return None
+
+        source = file['content'].encode('utf-8')
+        lines = None
+        definitions = []
+        fallback_definitions = []
+        references = []
+        for node, tag in captures:
+            if tag.startswith('name.definition'):
+                identifier = source[node.start_byte:node.end_byte].decode('utf-8', errors='replace')
+                definitions.append((identifier, tag, node.start_point[0], node.end_point[0]))
+            elif tag.startswith('name.reference'):
+                references.append(source[node.start_byte:node.end_byte].decode('utf-8', errors='replace'))
+            elif 'reference' not in tag:
+                lines = lines or file['content'].split('\n')
+                identifier = lines[node.start_point[0]].strip()
+                fallback_definitions.append((identifier, tag, node.start_point[0], node.end_point[0]))
+
+        # Queries without the name.* convention still contribute their captures
+        return {'definitions': definitions or fallback_definitions, 'references': references}
+
+    def defined_names(self, file: Dict, tree: Optional[Tree] = None) -> List[Tuple[str, int]]:
+        """(identifier, 1-based line) of the names a file defines, ordered by line"""
+        tags = self._extract_tags(file, tree)
+        if not tags:
+            return []
+        return sorted(
+            ((identifier, start_line + 1) for identifier, tag, start_line, _ in tags['definitions']
+             if tag.startswith('name.definition')),
+            key=lambda item: item[1]
+        )
+
+    def _tag_files(self, files: Iterable[Dict]) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """Extract tags per file in input order, on a process pool when configured"""
+        if self.workers <= 1:
+            return ((file['name'], self._extract_tags(file)) for file in files)
+        return ordered_map(_tag_file_worker, files, workers=self.workers, initializer=_init_map_worker)
+
+    @staticmethod
+    def _definition_lines(content: str, definitions: List[Tuple[str, str, int, int]]) -> Tuple[int, Dict[int, str]]:
+        """The file's line count and the lines _format_snippet needs for its definitions"""
+        lines = content.split('\n')
+        wanted = {}
+        for _, _, start_line, end_line in definitions:
+            for i in range(max(0, start_line - 2), min(len(lines), end_line + 3)):
+                wanted[i] = lines[i]
+        return len(lines), wanted
+
+    def _rank_definitions(self, file_tags: Dict[str, Dict]) -> List[Tuple[str, str, str, int, int]]:
+        """
+        Rank definitions by how central they are to the codebase.
+        Files are nodes and references are edges to the files defining the
+        referenced identifier; PageRank over that graph scores files, and each
+        file's score flows to the definitions it references.
+        """
+        definers = defaultdict(set)
+        for file_name, tags in file_tags.items():
+            for identifier, _, _, _ in tags['definitions']:
+                definers[identifier].add(file_name)
+
+        edges: Dict[Tuple[str, str], float] = defaultdict(float)
+        edge_identifiers = defaultdict(Counter)
+        for referencer, tags in file_tags.items():
+            for identifier, count in Counter(tags['references']).items():
+                for definer in definers.get(identifier, ()):
+                    if definer == referencer:
+                        continue
+                    # Damp repeated references and identifiers defined all over the place
+                    weight = math.sqrt(count) / len(definers[identifier])
+                    edge_identifiers[(referencer, definer)][identifier] += weight
+                    edges[(referencer, definer)] += weight
+
+        file_ranks = _pagerank(list(file_tags), edges)
+
+        out_weights = defaultdict(float)
+        for (referencer, _), weight in edges.items():
+            out_weights[referencer] += weight
+        definition_ranks = defaultdict(float)
+        for (referencer, definer), identifiers in edge_identifiers.items():
+            for identifier, weight in identifiers.items():
+                definition_ranks[(definer, identifier)] += \
+                    file_ranks[referencer] * weight / out_weights[referencer]
+
+        ranked = []
+        for order, (file_name, tags) in enumerate(file_tags.items()):
+            definitions = tags['definitions']
+            for identifier, tag, start_line, end_line in definitions:
+                # Unreferenced definitions keep a sliver of their file's rank as a tie-breaker
+                score = definition_ranks.get((file_name, identifier), 0.0) + \
+                    1e-3 * file_ranks[file_name] / len(definitions)
+                ranked.append((-score, order, start_line, file_name, identifier, tag, end_line))
+        ranked.sort()
+        return [(file_name, identifier, tag, start_line, end_line)
+                for _, _, start_line, file_name, identifier, tag, end_line in ranked]
+
+    def _generate_ranked_map(self, files: Iterable[Dict], token_budget: int) -> str:
+        """Fill token_budget with the highest ranked definitions, grouped by file"""
+        encoder = tiktoken.get_encoding("cl100k_base")
+
+        # Contents are only held until a file's tags come back, which keeps at most the
+        # files in flight on the pool; after that only the lines around definitions stay
+        contents = {}
+        def non_empty(files: Iterable[Dict]) -> Iterator[Dict]:
+            for file in files:
+                if file['content'].strip():
+                    contents[file['name']] = file['content']
+                    yield file
+
+        file_tags = {}
+        definition_lines: Dict[str, Tuple[int, Dict[int, str]]] = {}
+        for name, tags in self._tag_files(non_empty(files)):
+            content = contents.pop(name, None)
+            if tags and tags['definitions'] and content is not None:
+                file_tags[name] = tags
+                definition_lines[name] = self._definition_lines(content, tags['definitions'])
+        if not file_tags:
+            return ""
+
+        selected: Dict[str, List[Tuple[int, str]]] = {}
+        seen = set()
+        used_tokens = 0
+        misses = 0
+        for file_name, identifier, tag, start_line, end_line in self._rank_definitions(file_tags):
+            line_count, lines = definition_lines[file_name]
+            snippet = self._format_snippet(lines, start_line, end_line, line_count)
+            entry = f"{tag}: {snippet}"
+            if (file_name, entry) in seen:
+                continue
+            cost = len(encoder.encode(entry)) + 1
+            if file_name not in selected:
+                cost += len(encoder.encode(f"\n{file_name}:\n"))
+            if used_tokens + cost > token_budget:
+                # Keep trying smaller snippets for a while, then stop extracting altogether
+                misses += 1
+                if misses >= 20 or token_budget - used_tokens < 16:
+                    break
+                continue
+            seen.add((file_name, entry))
+            selected.setdefault(file_name, []).append((start_line, entry))
+            used_tokens += cost
+
+        repo_map = [
+            f"\n{file_name}:\n" + '\n'.join(entry for _, entry in sorted(entries))
+            for file_name, entries in selected.items()
+        ]
+        logger.info(f"Generated ranked repo map with {len(repo_map)} files and ~{used_tokens} tokens")
+        return '\n'.join(repo_map)
+
+    def generate_repo_map(self, files: Iterable[Dict], token_budget: Optional[int] = None) -> str:
+        """
+        Main entry point to generate repo map.
+        With a token_budget, definitions are ranked across the repository and the
+        map is filled with the most central ones until the budget is spent.
+        """
+        if token_budget:
+            return self._generate_ranked_map(files, token_budget)
         
         repo_map = []
         
-        for file in files:
-            if not file['content'].strip():
-                logger.debug(f"Skipping empty file {file['name']}")
-                continue
-                
-            symbols = self._process_file(file)
+        for name, symbols in self._map_files(files):
             if not symbols:
-                logger.debug(f"No symbols found in {file['name']}")
+                logger.debug(f"No symbols found in {name}")
                 continue
                 
-            header = f"\n{file['name']}:\n"
+            header = f"\n{name}:\n"
             repo_map.append(header + '\n'.join(symbols))
             
         result = '\n'.join(repo_map)
@@ -0,0 +1,91 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+from qdrant_client.http import models
+from embedding_manager import EMBEDDING_DIMENSIONS
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+@dataclass
+class CollectionConfig:
+    """
+    Storage and index settings for the Qdrant collection, read from the
+    environment by from_env().
+
+    With int8 quantization the quantized vectors stay in RAM and drive the HNSW
+    search, while the original float vectors can live on disk (on_disk) and are
+    only read to rescore the oversampled candidates. That cuts vector RAM by
+    roughly 4x at a small recall cost, which rescoring mostly recovers.
+    """
+    size: int = EMBEDDING_DIMENSIONS
+    distance: models.Distance = models.Distance.COSINE
+    quantization: str = "none"  # "none" or "int8"
+    quantile: float = 0.99
+    on_disk: bool = False
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    hnsw_ef: Optional[int] = None  # None leaves the server default (ef = top_k)
+    rescore: bool = True
+    oversampling: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> 'CollectionConfig':
+        hnsw_ef = os.getenv("QDRANT_HNSW_EF")
+        return cls(
+            quantization=os.getenv("QDRANT_QUANTIZATION", "none").lower(),
+            quantile=float(os.getenv("QDRANT_QUANTILE", "0.99")),
+            on_disk=_env_flag("QDRANT_ON_DISK", "false"),
+            hnsw_m=int(os.getenv("QDRANT_HNSW_M", "16")),
+            hnsw_ef_construct=int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100")),
+            hnsw_ef=int(hnsw_ef) if hnsw_ef else None,
+            rescore=_env_flag("QDRANT_RESCORE", "true"),
+            oversampling=float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+        )
+
+    def __post_init__(self):
+        if self.quantization not in ("none", "int8"):
+            raise ValueError(f"Unsupported quantization {self.quantization!r}, expected 'none' or 'int8'")
+
+    def vectors_config(self) -> models.VectorParams:
+        return models.VectorParams(size=self.size, distance=self.distance, on_disk=self.on_disk)
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self) -> Optional[models.ScalarQuantization]:
+        if self.quantization != "int8":
+            return None
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=self.quantile,
+                always_ram=True
+            )
+        )
+
+    def create_kwargs(self) -> dict:
+        """Keyword arguments for create_collection / recreate_collection"""
+        return dict(
+            vectors_config=self.vectors_config(),
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config()
+        )
+
+    def update_kwargs(self) -> dict:
+        """Keyword arguments for update_collection, to apply changed settings to an existing collection"""
+        return dict(
+            vectors_config={"": models.VectorParamsDiff(on_disk=self.on_disk)},
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config() or models.Disabled.DISABLED
+        )
+
+    def search_params(self, exact: bool = False) -> models.SearchParams:
+        """Per-query parameters: HNSW ef, and rescoring of quantized candidates with the original vectors"""
+        quantization = None
+        if self.quantization != "none":
+            quantization = models.QuantizationSearchParams(
+                rescore=self.rescore,
+                oversampling=self.oversampling if self.rescore else None
+            )
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, exact=exact, quantization=quantization)
@@ -0,0 +1,74 @@
+from typing import Iterator, Optional, Sequence, Union
+import numpy as np
+
+class EmbeddingBatch(Sequence):
+    """
+    The embeddings of a batch of texts as one contiguous (n, dimensions) float32
+    matrix. Indexing yields row views, so documents hold their embedding without
+    a copy of their own, and vector stores are handed the matrix itself.
+    """
+    __slots__ = ("matrix",)
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if self.matrix.ndim != 2:
+            raise ValueError(f"Expected an (n, dimensions) matrix, got shape {self.matrix.shape}")
+
+    @classmethod
+    def from_vectors(cls, vectors: Sequence[np.ndarray], dimensions: Optional[int] = None) -> 'EmbeddingBatch':
+        """
+        Batch for a sequence of vectors. Consecutive rows of one float32 matrix
+        (e.g. the embeddings of documents processed together) are used as they
+        are; anything else is copied into a new matrix once.
+        """
+        if isinstance(vectors, EmbeddingBatch):
+            return vectors
+        if len(vectors) == 0:
+            return cls(np.empty((0, dimensions or 0), dtype=np.float32))
+        shared = _shared_rows(vectors)
+        if shared is not None:
+            return cls(shared)
+        matrix = np.empty((len(vectors), len(vectors[0])), dtype=np.float32)
+        for row, vector in zip(matrix, vectors):
+            row[:] = vector
+        return cls(matrix)
+
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[np.ndarray, 'EmbeddingBatch']:
+        if isinstance(index, slice):
+            return EmbeddingBatch(self.matrix[index])
+        return self.matrix[index]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.matrix)
+
+    def __repr__(self) -> str:
+        return f"EmbeddingBatch({len(self)} x {self.dimensions})"
+
+def _shared_rows(vectors: Sequence[np.ndarray]) -> Optional[np.ndarray]:
+    """The slice of a float32 matrix whose rows are exactly vectors, in order, if there is one"""
+    first = vectors[0]
+    base = first.base if isinstance(first, np.ndarray) else None
+    if (base is None or not isinstance(base, np.ndarray) or base.ndim != 2 or base.dtype != np.float32
+            or not base.flags.c_contiguous or base.shape[1] != first.shape[-1]):
+        return None
+    row_bytes = base.strides[0]
+    base_address = base.__array_interface__['data'][0]
+    start, remainder = divmod(first.__array_interface__['data'][0] - base_address, row_bytes)
+    if remainder or start < 0 or start + len(vectors) > base.shape[0]:
+        return None
+    for i, vector in enumerate(vectors):
+        if (not isinstance(vector, np.ndarray) or vector.base is not base or vector.shape != first.shape
+                or vector.__array_interface__['data'][0] != base_address + (start + i) * row_bytes):
+            return None
+    return base[start:start + len(vectors)]
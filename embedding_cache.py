@@ -0,0 +1,231 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from embedding_batch import EmbeddingBatch
+from embedding_manager import BaseEmbedder
+from embedding_job import EmbeddingJobError
+from utils.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed store of embedding vectors.
+
+    Keys are hashes of (model, dimensions, text), so identical chunks share one
+    vector across re-indexes, forks and vendored code in different repos.
+    Vectors live in a memory-mapped float32 file with one fixed-width row per
+    slot; a small SQLite index maps keys to slots and tracks last use for LRU
+    eviction once max_entries is reached. Every batch runs under SQLite's write
+    lock, so several worker processes can share one cache directory.
+    """
+    def __init__(self, dimensions: int, cache_dir: Optional[str] = None, max_entries: Optional[int] = None):
+        self.dimensions = dimensions
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 1_000_000))
+        self.cache_dir = Path(cache_dir or os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings"))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # Autocommit mode; _transaction() issues BEGIN IMMEDIATE itself
+        self._db = sqlite3.connect(self.cache_dir / f"index-{dimensions}.sqlite3", timeout=60,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+        self._vectors_path = self.cache_dir / f"vectors-{dimensions}.f32"
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        with self._transaction():
+            self._map_vectors(max(self._slot_count(), 1024))
+
+    @staticmethod
+    def key(model: str, dimensions: int, text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{dimensions}\0{text}".encode('utf-8')).digest()
+
+    def _slot_count(self) -> int:
+        row = self._db.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()
+        return row[0]
+
+    def _map_vectors(self, capacity: int) -> None:
+        """(Re)map the vector file, growing it to at least capacity rows"""
+        row_bytes = self.dimensions * 4
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        capacity = max(capacity, size // row_bytes)
+        if size < capacity * row_bytes:
+            with open(self._vectors_path, 'ab') as vectors_file:
+                vectors_file.truncate(capacity * row_bytes)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimensions))
+        self._capacity = capacity
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """
+        Hold the cache exclusively, across threads and processes. Slots are only
+        read, allocated or overwritten in here, so no reader can see a slot that
+        another writer is reusing.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, int]:
+        slots = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            slots.update((bytes(key), slot) for key, slot in rows)
+        return slots
+
+    def _touch(self, keys: List[bytes], now: float) -> None:
+        self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in keys])
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Batch lookup; returns copies of the vectors found, keyed by cache key"""
+        with self._transaction():
+            slots = self._lookup(list(dict.fromkeys(keys)))
+            if slots and max(slots.values()) >= self._capacity:
+                # Another process grew the vector file since we mapped it
+                self._map_vectors(0)
+            found = {key: np.array(self._vectors[slot]) for key, slot in slots.items()}
+            if found:
+                self._touch(list(found), time.time())
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Dict[bytes, np.ndarray]) -> None:
+        """Store vectors, evicting the least recently used entries beyond max_entries"""
+        if not items:
+            return
+        if len(items) > self.max_entries:
+            items = dict(list(items.items())[-self.max_entries:])
+        with self._transaction():
+            now = time.time()
+            slots = self._lookup(list(items))
+            # Entries being rewritten must not be picked for eviction below
+            self._touch(list(slots), now)
+            new_keys = [key for key in items if key not in slots]
+            next_slot = self._slot_count()
+
+            # Reuse slots of evicted entries before growing the file
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            overflow = count + len(new_keys) - self.max_entries
+            free_slots = []
+            if overflow > 0:
+                evicted = self._db.execute(
+                    "SELECT key, slot FROM entries WHERE last_used < ? ORDER BY last_used LIMIT ?", (now, overflow)
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                free_slots = [slot for _, slot in evicted]
+                logger.info(f"Evicted {len(evicted)} cached embeddings")
+            rows = []
+            for key in new_keys:
+                if free_slots:
+                    slot = free_slots.pop()
+                else:
+                    slot = next_slot
+                    next_slot += 1
+                slots[key] = slot
+                rows.append((key, slot, now))
+
+            needed = max(next_slot, max(slots.values()) + 1)
+            if needed > self._capacity:
+                self._map_vectors(max(needed, self._capacity * 2))
+            for key, vector in items.items():
+                self._vectors[slots[key]] = np.asarray(vector, dtype=np.float32)
+            self._vectors.flush()
+            self._db.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", rows)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "max_entries": self.max_entries}
+
+class CachedEmbedder(BaseEmbedder):
+    """
+    Wraps any BaseEmbedder with an EmbeddingCache, so only texts that have never
+    been embedded with this model and dimensionality are sent to the API.
+    """
+    def __init__(self, embedder: BaseEmbedder, cache: Optional[EmbeddingCache] = None):
+        self.embedder = embedder
+        self.model = getattr(embedder, 'model', type(embedder).__name__)
+        self.dimensions = getattr(embedder, 'dimensions', None)
+        self.cache = cache or EmbeddingCache(dimensions=self.dimensions)
+
+    def _partition(self, texts: List[str]) -> Tuple[List[bytes], Dict[bytes, np.ndarray], Dict[bytes, str]]:
+        """Cache keys for texts, the cached vectors, and each distinct missing text once"""
+        keys = [EmbeddingCache.key(self.model, self.dimensions, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        miss_texts: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                miss_texts.setdefault(key, text)
+        if miss_texts:
+            logger.info(f"Embedding cache: {len(texts) - len(miss_texts)} of {len(texts)} texts cached, "
+                        f"embedding {len(miss_texts)}")
+        return keys, cached, miss_texts
+
+    def _merge(self, keys: List[bytes], cached: Dict[bytes, np.ndarray], miss_keys: List[bytes],
+               embeddings: List[Optional[np.ndarray]]) -> List[Optional[np.ndarray]]:
+        """Store newly computed vectors and return one vector per key, None where still missing"""
+        computed = {
+            key: np.asarray(vector, dtype=np.float32)
+            for key, vector in zip(miss_keys, embeddings) if vector is not None
+        }
+        self.cache.put_many(computed)
+        cached.update(computed)
+        return [cached.get(key) for key in keys]
+
+    @staticmethod
+    def _raise_missing(e: EmbeddingJobError, embeddings: List[Optional[np.ndarray]]) -> None:
+        # Report the partial result against the caller's indices
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        raise EmbeddingJobError(str(e), embeddings, missing) from e
+
+    def embed_texts(self, texts: List[str]) -> EmbeddingBatch:
+        keys, cached, miss_texts = self._partition(texts)
+        if not miss_texts:
+            return EmbeddingBatch.from_vectors([cached[key] for key in keys], self.dimensions)
+        try:
+            embeddings = self.embedder.embed_texts(list(miss_texts.values()))
+        except EmbeddingJobError as e:
+            self._raise_missing(e, self._merge(keys, cached, list(miss_texts), e.embeddings))
+        return EmbeddingBatch.from_vectors(self._merge(keys, cached, list(miss_texts), embeddings), self.dimensions)
+
+    async def embed_texts_async(self, texts: List[str]) -> EmbeddingBatch:
+        keys, cached, miss_texts = await run_blocking(self._partition, texts)
+        if not miss_texts:
+            return EmbeddingBatch.from_vectors([cached[key] for key in keys], self.dimensions)
+        try:
+            embeddings = await self.embedder.embed_texts_async(list(miss_texts.values()))
+        except EmbeddingJobError as e:
+            self._raise_missing(e, await run_blocking(self._merge, keys, cached, list(miss_texts), e.embeddings))
+        merged = await run_blocking(self._merge, keys, cached, list(miss_texts), embeddings)
+        return EmbeddingBatch.from_vectors(merged, self.dimensions)
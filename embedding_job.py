@@ -0,0 +1,106 @@
+import os
+import hashlib
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingJobError(Exception):
+    """
+    Raised when some texts could not be embedded after retries.
+    Carries everything that did succeed so callers can keep it, and the
+    indices of the texts that are still missing.
+    """
+    def __init__(self, message: str, embeddings: List[Optional[np.ndarray]], missing: List[int]):
+        super().__init__(message)
+        self.embeddings = embeddings
+        self.missing = missing
+
+class EmbeddingCheckpoint:
+    """
+    Durable record of the completed batches of one embedding job.
+
+    A job is identified by the model, the dimensions and the exact list of
+    inputs, so a restarted worker embedding the same chunks reopens the same
+    checkpoint and only requests what is still missing. Each completed batch
+    is written atomically to its own file. Jobs that fail and are never rerun
+    leave their directory behind until expire() removes it.
+    """
+    # Seconds after its last write that a job directory counts as abandoned
+    ttl = float(os.getenv("EMBEDDING_CHECKPOINT_TTL", str(24 * 3600)))
+    # Minimum seconds between two expiry scans in one process
+    expire_interval = 600.0
+    _last_expired = 0.0
+
+    def __init__(self, job_id: str, num_inputs: int, root_dir: Optional[str] = None):
+        self.num_inputs = num_inputs
+        self.job_dir = self.root(root_dir) / job_id
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def root(root_dir: Optional[str] = None) -> Path:
+        return Path(root_dir or os.getenv("EMBEDDING_CHECKPOINT_DIR", ".cache/embedding_jobs"))
+
+    @classmethod
+    def expire(cls, root_dir: Optional[str] = None) -> int:
+        """Remove job directories not written to for ttl seconds; scans at most once per expire_interval"""
+        now = time.time()
+        if now - cls._last_expired < cls.expire_interval:
+            return 0
+        cls._last_expired = now
+        root = cls.root(root_dir)
+        if not root.is_dir():
+            return 0
+        removed = 0
+        for job_dir in root.iterdir():
+            try:
+                if job_dir.is_dir() and now - job_dir.stat().st_mtime > cls.ttl:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    removed += 1
+            except FileNotFoundError:
+                continue  # removed by another worker
+        if removed:
+            logger.info(f"Removed {removed} abandoned embedding checkpoints from {root}")
+        return removed
+
+    @staticmethod
+    def job_id(model: str, dimensions: int, inputs: List[str]) -> str:
+        digest = hashlib.sha256(f"{model}\0{dimensions}\0{len(inputs)}".encode('utf-8'))
+        for text in inputs:
+            digest.update(hashlib.sha256(text.encode('utf-8')).digest())
+        return digest.hexdigest()
+
+    def load(self) -> List[Optional[np.ndarray]]:
+        """Embeddings recorded so far, with None for inputs not embedded yet"""
+        embeddings: List[Optional[np.ndarray]] = [None] * self.num_inputs
+        for batch_file in sorted(self.job_dir.glob("*.npz")):
+            try:
+                with np.load(batch_file) as batch:
+                    for index, vector in zip(batch['indices'], batch['vectors']):
+                        embeddings[int(index)] = vector
+            except Exception as e:
+                # A torn or corrupt file only costs re-embedding that batch
+                logger.warning(f"Ignoring unreadable checkpoint {batch_file}: {str(e)}")
+        return embeddings
+
+    def save_batch(self, indices: List[int], embeddings: List[np.ndarray]) -> None:
+        """Persist one completed batch; the rename makes it all-or-nothing"""
+        fd, tmp_name = tempfile.mkstemp(dir=self.job_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                np.savez(tmp, indices=np.asarray(indices, dtype=np.int64), vectors=np.stack(embeddings))
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_name, self.job_dir / f"{indices[0]:08d}-{len(indices)}.npz")
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+    def clear(self) -> None:
+        shutil.rmtree(self.job_dir, ignore_errors=True)
@@ -2,26 +2,67 @@ import os
 import logging
 import numpy as np
 from abc import ABC, abstractmethod
-from typing import List
-from openai import OpenAI
-from tenacity import retry, wait_random_exponential, stop_after_attempt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Sequence, Tuple
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, wait_random_exponential, stop_after_attempt
 import tiktoken
-import time
+from embedding_batch import EmbeddingBatch
+from embedding_job import EmbeddingCheckpoint, EmbeddingJobError
+from utils.rate_limiter import RateLimiter
+from utils.concurrency import run_blocking
 
 logger = logging.getLogger(__name__)
 
+# Errors worth retrying a single batch for; anything else fails the batch immediately
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Embedding size used by the embedder, the Qdrant collection, Postgres and the caches.
+# text-embedding-3 models accept 256-3072; 512 cuts vector memory and search cost by 3x.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
+def supports_truncation(model: str) -> bool:
+    """text-embedding-3 vectors stay meaningful when cut to a prefix and re-normalised"""
+    return model.startswith("text-embedding-3")
+
+def truncate_embedding(vector: np.ndarray, dimensions: int) -> np.ndarray:
+    """Keep the first dimensions components of an embedding, re-normalised to unit length"""
+    truncated = np.asarray(vector[:dimensions], dtype=np.float32)
+    norm = np.linalg.norm(truncated)
+    return truncated / norm if norm else truncated
+
 class BaseEmbedder(ABC):
     @abstractmethod
-    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
-        pass
+    def embed_texts(self, texts: List[str]) -> Sequence[np.ndarray]:
+        """One vector per text, in order; an EmbeddingBatch where the embedder can build one"""
+
+    async def embed_texts_async(self, texts: List[str]) -> Sequence[np.ndarray]:
+        """Async variant; by default runs embed_texts in the shared blocking pool"""
+        return await run_blocking(self.embed_texts, texts)
 
 class OpenAIEmbedder(BaseEmbedder):
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 dimensions: Optional[int] = None):
+        """
+        :param base_url: Alternative API endpoint, e.g. a local stand-in server for tests
+        :param dimensions: Embedding size; EMBEDDING_DIMENSIONS when omitted
+        :param max_concurrency: Maximum number of embedding requests in flight
+        :param requests_per_minute: Client-side request quota
+        :param tokens_per_minute: Client-side token quota
+        """
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url or os.getenv("OPENAI_BASE_URL"))
+        self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url or os.getenv("OPENAI_BASE_URL"))
         self.model = "text-embedding-3-small"
-        self.dimensions = 1536  # Can reduce to 512 for cost savings
-        self.batch_size = 16  # Much smaller batch size to avoid rate limits
+        self.dimensions = dimensions or EMBEDDING_DIMENSIONS
         self.token_limit = 8191  # Max tokens per input for this model
+        self.max_inputs_per_request = 2048  # API limit on inputs per request
+        self.max_tokens_per_request = int(os.getenv("EMBEDDING_MAX_REQUEST_TOKENS", 300_000))  # API limit on tokens per request
+        self.max_concurrency = max_concurrency or int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=requests_per_minute or int(os.getenv("EMBEDDING_RPM", 3000)),
+            tokens_per_minute=tokens_per_minute or int(os.getenv("EMBEDDING_TPM", 1_000_000))
+        )
         # Initialize tiktoken encoder for token counting
         try:
             self.encoder = tiktoken.encoding_for_model(self.model)
@@ -43,72 +84,173 @@ class OpenAIEmbedder(BaseEmbedder):
             
         return chunks
 
-    @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
-    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+    def _split_inputs(self, texts: List[str]) -> Tuple[List[str], List[int], List[int]]:
         """
-        Generate embeddings for a list of texts.
-        
-        This method handles:
-        - Chunking texts that exceed the token limit
-        - Processing in small batches to avoid rate limits
-        - Combining chunk embeddings for long texts
+        Flatten texts into API inputs, splitting those over the per-input token limit.
+        Returns (inputs, owner text index per input, token count per input).
         """
-        result_embeddings = []
-        
-        # Process each text individually
+        inputs, owners, token_counts = [], [], []
         for i, text in enumerate(texts):
             token_count = self._count_tokens(text)
-            
-            # Log progress for larger batches
-            if len(texts) > 10 and i % 10 == 0:
-                logger.info(f"Processing text {i} of {len(texts)}")
-            
-            # For long texts that exceed the token limit
             if token_count > self.token_limit:
                 logger.info(f"Text {i} exceeds token limit ({token_count} > {self.token_limit}). Chunking...")
-                chunks = self._chunk_text(text)
-                chunk_embeddings = []
-                
-                # Process chunks in small batches
-                for j in range(0, len(chunks), self.batch_size):
-                    batch = chunks[j:j + self.batch_size]
-                    try:
-                        response = self.client.embeddings.create(
-                            input=batch,
-                            model=self.model,
-                            dimensions=self.dimensions
-                        )
-                        batch_embeddings = [np.array(data.embedding) for data in response.data]
-                        chunk_embeddings.extend(batch_embeddings)
-                        
-                        # Add a small delay to avoid rate limits
-                        time.sleep(0.2)
-                    except Exception as e:
-                        logger.error(f"OpenAI API error on chunk batch for text {i}: {str(e)}")
-                        raise
-                
-                # Average the chunk embeddings to get a single embedding for the original text
-                if chunk_embeddings:
-                    avg_embedding = np.mean(chunk_embeddings, axis=0)
-                    result_embeddings.append(avg_embedding)
-                else:
-                    logger.error(f"No embeddings generated for text {i}")
-                    result_embeddings.append(np.zeros(self.dimensions))
+                for chunk in self._chunk_text(text):
+                    inputs.append(chunk)
+                    owners.append(i)
+                    token_counts.append(self._count_tokens(chunk))
             else:
-                # For texts within the token limit, process directly
+                inputs.append(text)
+                owners.append(i)
+                token_counts.append(token_count)
+        return inputs, owners, token_counts
+
+    def _pack_batches(self, indices: List[int], token_counts: List[int]) -> List[List[int]]:
+        """Pack the given input indices, in order, into batches within the per-request limits"""
+        batches = []
+        batch: List[int] = []
+        batch_tokens = 0
+        for i in indices:
+            if batch and (len(batch) >= self.max_inputs_per_request or
+                          batch_tokens + token_counts[i] > self.max_tokens_per_request):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += token_counts[i]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @retry(
+        retry=retry_if_exception_type(TRANSIENT_ERRORS),
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(5),
+        reraise=True
+    )
+    def _embed_batch(self, batch: List[str], token_count: int) -> EmbeddingBatch:
+        """Send one embeddings request once the rate limiter admits it, retrying transient failures"""
+        self.rate_limiter.acquire(token_count)
+        response = self.client.embeddings.create(
+            input=batch,
+            model=self.model,
+            dimensions=self.dimensions
+        )
+        # float32 straight from the response lists, as one matrix for the whole request
+        return EmbeddingBatch(np.array(
+            [data.embedding for data in sorted(response.data, key=lambda data: data.index)], dtype=np.float32
+        ))
+
+    @retry(
+        retry=retry_if_exception_type(TRANSIENT_ERRORS),
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(5),
+        reraise=True
+    )
+    async def _embed_batch_async(self, batch: List[str], token_count: int) -> EmbeddingBatch:
+        """Async counterpart of _embed_batch"""
+        await run_blocking(self.rate_limiter.acquire, token_count)
+        response = await self.async_client.embeddings.create(
+            input=batch,
+            model=self.model,
+            dimensions=self.dimensions
+        )
+        # float32 straight from the response lists, as one matrix for the whole request
+        return EmbeddingBatch(np.array(
+            [data.embedding for data in sorted(response.data, key=lambda data: data.index)], dtype=np.float32
+        ))
+
+    async def embed_texts_async(self, texts: List[str]) -> EmbeddingBatch:
+        """
+        Request-path embedding (e.g. a question) through the async client.
+        Anything that needs chunking or more than one request takes the
+        threaded, checkpointed embed_texts path instead.
+        """
+        if not texts:
+            return EmbeddingBatch.from_vectors([], self.dimensions)
+        inputs, _, token_counts = self._split_inputs(texts)
+        if len(inputs) != len(texts) or len(self._pack_batches(range(len(inputs)), token_counts)) > 1:
+            return await super().embed_texts_async(texts)
+        return await self._embed_batch_async(inputs, sum(token_counts))
+
+    def embed_texts(self, texts: List[str]) -> EmbeddingBatch:
+        """
+        Generate embeddings for a list of texts, as one float32 matrix.
+        
+        This method handles:
+        - Chunking texts that exceed the token limit
+        - Packing inputs into as few requests as the API limits allow
+        - Running a bounded number of requests concurrently under the rate limits
+        - Retrying each batch on its own and, for jobs of more than one request,
+          checkpointing it once it succeeds, so a rerun of the same texts
+          resumes instead of starting over
+        - Combining chunk embeddings for long texts
+        Output order always matches input order. If some batches still fail,
+        EmbeddingJobError reports the missing texts along with the embeddings
+        that did succeed.
+        """
+        if not texts:
+            return EmbeddingBatch.from_vectors([], self.dimensions)
+
+        inputs, owners, token_counts = self._split_inputs(texts)
+        batches = self._pack_batches(range(len(inputs)), token_counts)
+        checkpoint = None
+        input_embeddings: List[Optional[np.ndarray]] = [None] * len(inputs)
+        pending = list(range(len(inputs)))
+        # A single request has nothing to resume, so it is not worth a directory and an fsync
+        if len(batches) > 1:
+            EmbeddingCheckpoint.expire()
+            checkpoint = EmbeddingCheckpoint(
+                EmbeddingCheckpoint.job_id(self.model, self.dimensions, inputs),
+                num_inputs=len(inputs)
+            )
+            input_embeddings = checkpoint.load()
+            pending = [i for i, embedding in enumerate(input_embeddings) if embedding is None]
+            batches = self._pack_batches(pending, token_counts)
+        logger.info(f"Embedding {len(texts)} texts as {len(inputs)} inputs: "
+                    f"{len(inputs) - len(pending)} resumed from checkpoint, {len(batches)} requests to send")
+
+        failed_batches = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {
+                pool.submit(self._embed_batch, [inputs[i] for i in batch], sum(token_counts[i] for i in batch)): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
                 try:
-                    response = self.client.embeddings.create(
-                        input=[text],
-                        model=self.model,
-                        dimensions=self.dimensions
-                    )
-                    embedding = np.array(response.data[0].embedding)
-                    result_embeddings.append(embedding)
-                    
-                    # Add a small delay to avoid rate limits
-                    time.sleep(0.1)
+                    embeddings = future.result()
                 except Exception as e:
-                    logger.error(f"OpenAI API error on text {i}: {str(e)}")
-                    raise
-        
-        return result_embeddings
+                    failed_batches += 1
+                    logger.error(f"OpenAI API error on batch starting at input {batch[0]}: {str(e)}")
+                    continue
+                if checkpoint is not None:
+                    checkpoint.save_batch(batch, embeddings)
+                for i, embedding in zip(batch, embeddings):
+                    input_embeddings[i] = embedding
+
+        # Average the chunk embeddings of long texts to get one embedding per original text
+        grouped: List[List[Optional[np.ndarray]]] = [[] for _ in texts]
+        for owner, embedding in zip(owners, input_embeddings):
+            grouped[owner].append(embedding)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        missing = []
+        for i, embeddings in enumerate(grouped):
+            if any(embedding is None for embedding in embeddings):
+                missing.append(i)
+            elif len(embeddings) == 1:
+                matrix[i] = embeddings[0]
+            elif embeddings:
+                matrix[i] = np.mean(embeddings, axis=0)
+            else:
+                logger.error(f"No embeddings generated for text {i}")
+
+        if missing:
+            missing_set = set(missing)
+            raise EmbeddingJobError(
+                f"{failed_batches} embedding batches failed; {len(missing)} of {len(texts)} texts are missing",
+                embeddings=[None if i in missing_set else matrix[i] for i in range(len(texts))],
+                missing=missing
+            )
+
+        if checkpoint is not None:
+            checkpoint.clear()
+        return EmbeddingBatch(matrix)
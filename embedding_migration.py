@@ -0,0 +1,171 @@
+"""
+Move the vectors of the code_embeddings collection to EMBEDDING_DIMENSIONS.
+The app and the workers refuse to start while the sizes differ; run this once
+after changing EMBEDDING_DIMENSIONS (or the embedding model):
+    python embedding_migration.py                  # strategy from EMBEDDING_MIGRATION
+    python embedding_migration.py --strategy reembed
+"""
+import os
+import argparse
+import logging
+from typing import List, Optional
+import numpy as np
+from psycopg2.extras import execute_batch
+from qdrant_client.http import models
+from embedding_batch import EmbeddingBatch
+from embedding_manager import supports_truncation, truncate_embedding
+
+logger = logging.getLogger(__name__)
+
+class DimensionMigrationError(Exception):
+    """The stored vectors cannot be brought to the configured dimensionality"""
+
+class DimensionMigration:
+    """
+    Moves the vectors behind a collection alias to a new dimensionality.
+
+    Points are copied, with their IDs and payloads, from the current collection
+    into a fresh one sized for the new dimensionality; the alias is then
+    switched to it and the old collection dropped, so searches keep working
+    until the switch. Postgres embeddings are rewritten alongside.
+
+    Shrinking the vectors of a text-embedding-3 model truncates and
+    re-normalises them, which needs no API calls. Anything else (growing, or a
+    model without that property) re-embeds the stored chunk content.
+    EMBEDDING_MIGRATION picks the strategy: "auto" (default), "truncate",
+    "reembed", or "off" to refuse and leave the collection untouched.
+    Run through QdrantVectorStore.migrate_dimensions, which makes sure only
+    one migration runs at a time.
+    """
+    def __init__(self, store, source: str, source_size: int, target: str, batch_size: int = 256,
+                 strategy: Optional[str] = None):
+        """
+        :param store: QdrantVectorStore whose collection_config describes the target
+        :param source: Physical collection currently holding the vectors
+        :param target: Physical collection to create for the new dimensionality
+        """
+        self.store = store
+        self.source = source
+        self.source_size = source_size
+        self.target = target
+        self.target_size = store.collection_config.size
+        self.batch_size = batch_size
+        self.strategy = self._resolve_strategy(strategy or os.getenv("EMBEDDING_MIGRATION", "auto"))
+
+    def _resolve_strategy(self, strategy: str) -> str:
+        model = getattr(self.store.embedder, 'model', None)
+        can_truncate = self.target_size < self.source_size and (model is None or supports_truncation(model))
+        if strategy == "auto":
+            strategy = "truncate" if can_truncate else "reembed"
+        if strategy == "off":
+            raise DimensionMigrationError(
+                f"Collection holds {self.source_size}-dimension vectors but {self.target_size} are configured "
+                f"and EMBEDDING_MIGRATION=off"
+            )
+        if strategy == "truncate" and not can_truncate:
+            raise DimensionMigrationError(
+                f"Cannot truncate {self.source_size}-dimension vectors to {self.target_size}"
+            )
+        if strategy == "reembed" and self.store.embedder is None:
+            raise DimensionMigrationError("Re-embedding needs an embedder")
+        if strategy not in ("truncate", "reembed"):
+            raise DimensionMigrationError(f"Unknown EMBEDDING_MIGRATION strategy {strategy!r}")
+        return strategy
+
+    def _convert(self, points: List[models.Record]) -> EmbeddingBatch:
+        if self.strategy == "truncate":
+            return EmbeddingBatch.from_vectors([
+                truncate_embedding(np.asarray(point.vector), self.target_size) for point in points
+            ])
+        return EmbeddingBatch.from_vectors(self.store.embedder.embed_texts([point.payload["content"] for point in points]))
+
+    def run(self) -> int:
+        """Copy, convert and switch over; returns the number of points migrated"""
+        client = self.store.client
+        logger.info(f"Migrating {self.source} ({self.source_size}d) to {self.target} ({self.target_size}d) "
+                    f"by {self.strategy}")
+        # A leftover target from an interrupted run is rebuilt from scratch
+        client.recreate_collection(collection_name=self.target, **self.store.collection_config.create_kwargs())
+
+        migrated = 0
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.source,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=self.strategy == "truncate"
+            )
+            if not points:
+                break
+            vectors = self._convert(points).matrix.tolist()
+            client.upsert(
+                collection_name=self.target,
+                points=models.Batch(
+                    ids=[point.id for point in points],
+                    vectors=vectors,
+                    payloads=[point.payload for point in points]
+                )
+            )
+            with self.store.pg_pool.connection() as conn, conn.cursor() as cur:
+                execute_batch(cur, "UPDATE processed_documents SET embedding = %s WHERE point_id = %s", [
+                    (vector, str(point.id)) for point, vector in zip(points, vectors)
+                ])
+            migrated += len(points)
+            logger.info(f"Migrated {migrated} points")
+            if offset is None:
+                break
+
+        self.store._initialize_payload_indexes(self.target)
+        # Same lock as collection setup, held only for the switch itself
+        with self.store.pg_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.store.collection_name,))
+            self._switch_alias()
+        logger.info(f"Migration to {self.target_size} dimensions finished: {migrated} points")
+        return migrated
+
+    def _switch_alias(self) -> None:
+        client = self.store.client
+        alias = self.store.collection_name
+        if self.source == alias:
+            # Collection created before aliases were used; the name has to be freed first. A crash
+            # before the alias exists is repaired by QdrantVectorStore._initialize_collection.
+            client.delete_collection(self.source)
+            client.update_collection_aliases(change_aliases_operations=[
+                models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=self.target, alias_name=alias))
+            ])
+            return
+        client.update_collection_aliases(change_aliases_operations=[
+            models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)),
+            models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=self.target, alias_name=alias))
+        ])
+        client.delete_collection(self.source)
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategy", choices=["auto", "truncate", "reembed"],
+                        help="Defaults to EMBEDDING_MIGRATION, or auto")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points copied per step")
+    args = parser.parse_args()
+
+    from embedding_cache import CachedEmbedder
+    from embedding_manager import OpenAIEmbedder
+    from qdrant_store import QdrantVectorStore
+    from utils.pg_pool import PostgresPool
+
+    pg_pool = PostgresPool.from_env()
+    store = QdrantVectorStore(embedder=CachedEmbedder(OpenAIEmbedder()), pg_pool=pg_pool, check_dimensions=False)
+    try:
+        migrated = store.migrate_dimensions(strategy=args.strategy, batch_size=args.batch_size)
+        logger.info(f"Done: {migrated} points migrated")
+    finally:
+        store.close()
+        pg_pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -6,45 +6,67 @@ import mermaid from 'mermaid';
 
 interface MermaidDiagramProps {
   code: string;
+  // True while code is still arriving from a stream
+  streaming?: boolean;
 }
 
-export default function MermaidDiagram({ code }: MermaidDiagramProps) {
+let mermaidInitialized = false;
+
+// While streaming, only complete statements (whole lines) are rendered
+function renderableCode(code: string, streaming: boolean): string {
+  if (!streaming) return code.trim();
+  const lastNewline = code.lastIndexOf('\n');
+  return lastNewline === -1 ? '' : code.slice(0, lastNewline).trim();
+}
+
+export default function MermaidDiagram({ code, streaming = false }: MermaidDiagramProps) {
   const containerRef = useRef<HTMLDivElement>(null);
+  const lastAttemptedRef = useRef<string>('');
+  const hasRenderedRef = useRef<boolean>(false);
+  const renderSeqRef = useRef<number>(0);
 
   useEffect(() => {
-    if (containerRef.current && code) {
-      try {
-        // Initialize mermaid
-        mermaid.initialize({
-          startOnLoad: true,
-          theme: 'default',
-        });
-        
-        // Clear previous diagram
-        containerRef.current.innerHTML = '';
-        
-        // Create a unique ID for this diagram
-        const id = `mermaid-${Math.random().toString(36).substring(2, 9)}`;
-        
-        // Create a div for mermaid to render into
-        const element = document.createElement('div');
-        element.id = id;
-        element.className = 'mermaid';
-        element.textContent = code;
-        
-        // Append the div to our container
-        containerRef.current.appendChild(element);
-        
-        // Render the diagram
-        mermaid.contentLoaded();
-      } catch (error) {
+    const text = renderableCode(code, streaming);
+    if (!containerRef.current || !text || text === lastAttemptedRef.current) return;
+    lastAttemptedRef.current = text;
+
+    if (!mermaidInitialized) {
+      // Initialize mermaid
+      mermaid.initialize({
+        startOnLoad: false,
+        theme: 'default',
+      });
+      mermaidInitialized = true;
+    }
+
+    // Renders finish out of order; only the latest one may touch the DOM
+    const seq = ++renderSeqRef.current;
+
+    // Create a unique ID for this diagram
+    const id = `mermaid-${Math.random().toString(36).substring(2, 9)}`;
+
+    mermaid
+      .render(id, text)
+      .then(({ svg }) => {
+        if (seq !== renderSeqRef.current || !containerRef.current) return;
+        containerRef.current.innerHTML = svg;
+        hasRenderedRef.current = true;
+      })
+      .catch((error) => {
+        // Mermaid leaves its scratch element behind when parsing fails
+        document.getElementById(`d${id}`)?.remove();
+        if (streaming) {
+          // A half-written block (e.g. an open subgraph) is expected; keep the last good render
+          return;
+        }
         console.error('Failed to render mermaid diagram:', error);
-        if (containerRef.current) {
-          containerRef.current.innerHTML = `<pre>${code}</pre>`;
+        if (seq === renderSeqRef.current && containerRef.current && !hasRenderedRef.current) {
+          const pre = document.createElement('pre');
+          pre.textContent = code;
+          containerRef.current.replaceChildren(pre);
         }
-      }
-    }
-  }, [code]);
+      });
+  }, [code, streaming]);
 
   return <div ref={containerRef} className="w-full h-full"></div>;
 }
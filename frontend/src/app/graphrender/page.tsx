@@ -1,16 +1,53 @@
-// app/graphrender/page.tsx - Updated with status polling
+// app/graphrender/page.tsx - Streams diagrams in and polls processing status
 'use client';
 
 import { useState, useEffect } from 'react';
 import Link from 'next/link';
 import MermaidDiagram from '@/app/components/MermaidDiagram';
+import { API_BASE, streamDiagram } from '@/app/lib/streamDiagram';
 
 export default function GraphRender() {
   const [diagramCode, setDiagramCode] = useState<string>('');
   const [question, setQuestion] = useState<string>('');
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [processingStatus, setProcessingStatus] = useState<string>('');
+  const [processingStage, setProcessingStage] = useState<string>('');
   const [processingComplete, setProcessingComplete] = useState<boolean>(false);
+  const [isStreaming, setIsStreaming] = useState<boolean>(false);
+  const [streamStage, setStreamStage] = useState<string>('');
+
+  useEffect(() => {
+    // Stream the initial diagram if the home page handed us a URL without one
+    const repoUrl = localStorage.getItem('repoUrl');
+    if (!repoUrl || localStorage.getItem('diagramCode')) return;
+
+    const controller = new AbortController();
+    let latest = '';
+    setIsStreaming(true);
+    streamDiagram(
+      '/generate_diagram/stream',
+      { url: repoUrl },
+      {
+        onText: (text) => {
+          latest = text;
+          setDiagramCode(text);
+        },
+        onStatus: setStreamStage,
+      },
+      controller.signal,
+    )
+      .then(() => localStorage.setItem('diagramCode', latest))
+      .catch((error) => {
+        if (controller.signal.aborted) return;
+        console.error('Error generating diagram:', error);
+        alert('Failed to generate diagram. Please try again.');
+      })
+      .finally(() => {
+        if (!controller.signal.aborted) setIsStreaming(false);
+      });
+
+    return () => controller.abort();
+  }, []);
 
   useEffect(() => {
     // Get the diagram code from localStorage
@@ -30,11 +67,17 @@ const checkStatus = async () => {
     try {
       // Call the status endpoint with URL as a query parameter
       const encodedUrl = encodeURIComponent(repoUrl);
-      const response = await fetch(`http://localhost:8000/processing_status?url=${encodedUrl}`);
+      const response = await fetch(`${API_BASE}/processing_status?url=${encodedUrl}`);
       if (response.ok) {
         const data = await response.json();
         setProcessingStatus(data.status);
-        
+        setProcessingStage(data.stage && data.progress ? `${data.stage} ${Math.round(data.progress[data.stage])}%` : '');
+
+        // An earlier commit's index can already answer questions
+        if (data.indexed) {
+          setProcessingComplete(true);
+        }
+
         // If processing is complete, stop polling
         if (data.status === 'completed') {
           setProcessingComplete(true);
@@ -77,27 +120,25 @@ const checkStatus = async () => {
     }
     
     setIsLoading(true);
+    setIsStreaming(true);
     try {
-      // Call the API to generate a new diagram based on the question
-      const response = await fetch('http://localhost:8000/ask_question', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
+      // Answer from the repository on screen only
+      const repo = localStorage.getItem('repoUrl');
+      // Stream a new diagram based on the question, rendering as it arrives
+      let latest = '';
+      await streamDiagram('/ask_question/stream', { question, repo }, {
+        onText: (text) => {
+          latest = text;
+          setDiagramCode(text);
         },
-        body: JSON.stringify({ question }),
       });
-      
-      if (!response.ok) {
-        throw new Error('Failed to process question');
-      }
-      
-      const data = await response.json();
-      setDiagramCode(data.diagram_code);
+      localStorage.setItem('diagramCode', latest);
     } catch (error) {
       console.error('Error processing question:', error);
       alert('Failed to process your question. Please try again.');
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -106,16 +147,18 @@ const checkStatus = async () => {
       {/* Processing status indicator */}
       {processingStatus && processingStatus !== 'completed' && (
         <div className="bg-blue-100 text-blue-800 p-2 w-full max-w-[80vh] text-center">
-          Repository processing: {processingStatus}
+          Repository processing: {processingStatus}{processingStage && ` (${processingStage})`}
           {!processingComplete && ' (You can view the diagram, but cannot ask questions yet)'}
         </div>
       )}
       
       <div className="w-full max-w-[80vh] h-[80vh] border-2 border-gray-300 flex items-center justify-center overflow-auto">
         {diagramCode ? (
-          <MermaidDiagram code={diagramCode} />
+          <MermaidDiagram code={diagramCode} streaming={isStreaming} />
         ) : (
-          <p className="text-gray-400">Diagram will appear here</p>
+          <p className="text-gray-400">
+            {isStreaming && streamStage === 'mapping' ? 'Mapping repository...' : isStreaming ? 'Generating diagram...' : 'Diagram will appear here'}
+          </p>
         )}
       </div>
       
@@ -0,0 +1,75 @@
+// lib/streamDiagram.ts - Reads the backend's server-sent diagram stream
+export const API_BASE = 'http://localhost:8000';
+
+export interface StreamHandlers {
+  // Called with the full diagram text received so far
+  onText: (text: string) => void;
+  onStatus?: (stage: string) => void;
+}
+
+// POSTs to a streaming endpoint and resolves with the `done` event's data
+export async function streamDiagram(
+  path: string,
+  body: Record<string, unknown>,
+  { onText, onStatus }: StreamHandlers,
+  signal?: AbortSignal,
+): Promise<Record<string, unknown>> {
+  const response = await fetch(`${API_BASE}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify(body),
+    signal,
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let text = '';
+
+  try {
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line; keep any partial event for the next read
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        let data = '';
+        for (const line of rawEvent.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        const payload = data ? JSON.parse(data) : {};
+
+        if (event === 'delta') {
+          text += payload.text;
+          onText(text);
+        } else if (event === 'status') {
+          onStatus?.(payload.stage);
+        } else if (event === 'error') {
+          throw new Error(payload.detail || 'Diagram generation failed');
+        } else if (event === 'done') {
+          return payload;
+        }
+      }
+    }
+  } finally {
+    // Stop reading if we bailed out early (error event or caller abort)
+    reader.cancel().catch(() => {});
+  }
+
+  throw new Error('Stream ended before the diagram was complete');
+}
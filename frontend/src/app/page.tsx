@@ -1,4 +1,4 @@
-// page.tsx - Updated with processing status handling
+// page.tsx - Hands the URL to the graph page, which streams the diagram
 'use client';
 
 import { useState } from 'react';
@@ -15,34 +15,13 @@ export default function Home() {
     if (!url) return;
     
     setIsLoading(true);
-    try {
-      // Call the API to generate the diagram
-      const response = await fetch('http://localhost:8000/generate_diagram', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ url }),
-      });
-      
-      if (!response.ok) {
-        throw new Error('Failed to generate diagram');
-      }
-      
-      const data = await response.json();
-      
-      // Store the diagram code and repository URL in localStorage
-      localStorage.setItem('diagramCode', data.diagram_code);
-      localStorage.setItem('repoUrl', url); // Store URL for status checks
-      
-      // Navigate to the graph render page
-      router.push('/graphrender');
-    } catch (error) {
-      console.error('Error generating diagram:', error);
-      alert('Failed to generate diagram. Please try again.');
-    } finally {
-      setIsLoading(false);
-    }
+
+    // The diagram page streams the diagram in as it is generated
+    localStorage.removeItem('diagramCode');
+    localStorage.setItem('repoUrl', url); // Store URL for generation and status checks
+
+    // Navigate to the graph render page
+    router.push('/graphrender');
   };
 
   return (
@@ -1,45 +1,126 @@
-import io
 import os
-from typing import Dict, List
+import tempfile
+from typing import IO, TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 import zipfile
 
 import requests
 
-def fetch_github_files(repo_url: str, gh_token: str = None) -> List[Dict]:
-    """Fetch files from a GitHub repository"""
-    headers = {'Authorization': f'token {gh_token}'} if gh_token else {}
-    
+if TYPE_CHECKING:
+    from snapshot_cache import SnapshotCache
+
+# Files above this size are almost always generated, vendored or data blobs
+MAX_FILE_SIZE = int(os.getenv("GITHUB_MAX_FILE_SIZE", 1024 * 1024))
+# Zipballs smaller than this stay in memory, larger ones spill to a temp file
+SPOOL_MAX_SIZE = int(os.getenv("GITHUB_SPOOL_MAX_SIZE", 16 * 1024 * 1024))
+# Number of leading bytes inspected when sniffing for binary content
+BINARY_SNIFF_BYTES = 8192
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def repo_slug(repo_url: str) -> str:
+    """Normalise a GitHub URL to its 'owner/repo' identifier"""
+    path = urlparse(repo_url).path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-4]
+    parts = path.split('/')
+    if len(parts) < 2 or not all(parts[:2]):
+        raise ValueError(f"Not a GitHub repository URL: {repo_url}")
+    return f"{parts[0]}/{parts[1]}".lower()
+
+def _api_base(repo_url: str) -> str:
+    return f"https://api.github.com/repos/{repo_slug(repo_url)}"
+
+def _auth_headers(gh_token: str = None) -> Dict[str, str]:
+    return {'Authorization': f'token {gh_token}'} if gh_token else {}
+
+def resolve_commit(repo_url: str, gh_token: str = None) -> Tuple[str, str]:
+    """
+    Resolve the repository's branch head to a commit SHA.
+    Returns (branch, sha). This is a single small API call, so it is cheap enough
+    to run on every request to decide whether a cached snapshot is still current.
+    """
+    headers = _auth_headers(gh_token)
+    headers['Accept'] = 'application/vnd.github.sha'
+
     # Try both main and master branches
     branches = ['main', 'master']
-    files = []
-    
+
     for branch in branches:
         try:
-            # Convert github.com URL to api.github.com
-            zip_url = repo_url.replace('github.com', 'api.github.com/repos')
-            zip_url = f"{zip_url}/zipball/{branch}"
-            
-            response = requests.get(zip_url, headers=headers, allow_redirects=True)
+            response = requests.get(f"{_api_base(repo_url)}/commits/{branch}", headers=headers, timeout=10)
             if response.status_code == 200:
-                with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
-                    for file_info in zip_file.filelist:
-                        try:
-                            with zip_file.open(file_info) as file:
-                                content = file.read().decode('utf-8')
-                                files.append({
-                                    'name': file_info.filename.split('/', 1)[1],
-                                    'content': content,
-                                    'branch': branch,
-                                    'size': file_info.file_size
-                                })
-                        except (UnicodeDecodeError, IndexError):
-                            continue
-                return files
-                
+                return branch, response.text.strip()
         except Exception as e:
             if branch == branches[-1]:  # Only raise error if both branches fail
                 raise Exception(f"Failed to fetch repository: {str(e)}")
             continue
-            
-    return files
\ No newline at end of file
+
+    raise Exception(f"Failed to fetch repository: no main or master branch found for {repo_url}")
+
+def download_zipball(repo_url: str, ref: str, dest: IO[bytes], gh_token: str = None) -> None:
+    """Stream the zipball for a ref (branch or commit SHA) into a writable file object"""
+    zip_url = f"{_api_base(repo_url)}/zipball/{ref}"
+    with requests.get(zip_url, headers=_auth_headers(gh_token), allow_redirects=True, stream=True) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch repository: zipball request returned {response.status_code}")
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            dest.write(chunk)
+
+def looks_binary(sample: bytes) -> bool:
+    """Heuristic used by git itself: a NUL byte in the first block means binary"""
+    return b'\0' in sample
+
+def iter_zip_files(archive: IO[bytes], branch: str, max_file_size: int = MAX_FILE_SIZE,
+                   commit: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Lazily yield text file records from a GitHub zipball.
+    Directories, oversized entries and binary entries are skipped before decoding.
+    """
+    with zipfile.ZipFile(archive) as zip_file:
+        for file_info in zip_file.infolist():
+            if file_info.is_dir() or file_info.file_size > max_file_size:
+                continue
+            try:
+                name = file_info.filename.split('/', 1)[1]
+                with zip_file.open(file_info) as file:
+                    head = file.read(BINARY_SNIFF_BYTES)
+                    if looks_binary(head):
+                        continue
+                    content = (head + file.read()).decode('utf-8')
+            except (UnicodeDecodeError, IndexError):
+                continue
+            yield {
+                'name': name,
+                'content': content,
+                'branch': branch,
+                'commit': commit,
+                'size': file_info.file_size
+            }
+
+def iter_github_files(repo_url: str, gh_token: str = None, max_file_size: int = MAX_FILE_SIZE,
+                      cache: Optional['SnapshotCache'] = None,
+                      revision: Optional[Tuple[str, str]] = None) -> Iterator[Dict]:
+    """
+    Stream files from a GitHub repository one record at a time.
+    Peak memory is bounded by the spool size and the largest accepted file.
+    When a snapshot cache is given, the zipball is only downloaded if the
+    branch head has moved since it was last cached.
+    :param revision: (branch, sha) to read instead of the current branch head
+    """
+    branch, sha = revision or resolve_commit(repo_url, gh_token)
+    if cache is not None:
+        archive = open(cache.get_archive(repo_url, sha, gh_token), 'rb')
+    else:
+        archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            download_zipball(repo_url, sha, archive, gh_token)
+        except Exception:
+            archive.close()
+            raise
+        archive.seek(0)
+    with archive:
+        yield from iter_zip_files(archive, branch, max_file_size, commit=sha)
+
+def fetch_github_files(repo_url: str, gh_token: str = None, cache: Optional['SnapshotCache'] = None) -> List[Dict]:
+    """Fetch files from a GitHub repository"""
+    return list(iter_github_files(repo_url, gh_token, cache=cache))
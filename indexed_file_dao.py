@@ -0,0 +1,89 @@
+from sqlalchemy import Column, Integer, String, JSON, DateTime, UniqueConstraint
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+
+from database import Base, SessionLocal, engine
+
+class IndexedFileDAO(Base):
+    """
+    Per-file index state for a repository: the content hash the file had when it
+    was last indexed and the vector point IDs its chunks were stored under. Every
+    row of a repository carries the commit the repository was last indexed at.
+    """
+    __tablename__ = 'indexed_files'
+    __table_args__ = (UniqueConstraint('repo_id', 'file_name', name='indexed_files_repo_file_key'),)
+
+    id = Column(Integer, primary_key=True)
+    repo_id = Column(String, index=True, nullable=False)
+    file_name = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    point_ids = Column(JSON, nullable=False)
+    commit = Column(String)
+    updated_at = Column(DateTime)
+
+    _table_ready = False
+
+    @classmethod
+    def _ensure_table(cls) -> None:
+        if not cls._table_ready:
+            Base.metadata.create_all(engine, tables=[cls.__table__])
+            cls._table_ready = True
+
+    @classmethod
+    def get_repo_state(cls, repo_id: str) -> Dict[str, Dict]:
+        """Return {file_name: {'content_hash': ..., 'point_ids': [...]}} for a repository"""
+        cls._ensure_table()
+        db = SessionLocal()
+        try:
+            rows = db.query(cls.file_name, cls.content_hash, cls.point_ids).filter(cls.repo_id == repo_id).all()
+            return {
+                row.file_name: {'content_hash': row.content_hash, 'point_ids': row.point_ids}
+                for row in rows
+            }
+        finally:
+            db.close()
+
+    @classmethod
+    def get_repo_commit(cls, repo_id: str) -> Optional[str]:
+        """The commit a repository was last indexed at, if it was recorded"""
+        cls._ensure_table()
+        db = SessionLocal()
+        try:
+            row = db.query(cls.commit).filter(cls.repo_id == repo_id).order_by(cls.updated_at.desc()).first()
+            return row.commit if row else None
+        finally:
+            db.close()
+
+    @classmethod
+    def save_repo_state(cls, repo_id: str, files: Dict[str, Tuple[str, List[str]]],
+                        removed: Iterable[str] = (), commit: Optional[str] = None) -> None:
+        """
+        Record the new state of changed files and forget removed ones.
+        :param files: file_name -> (content_hash, point_ids)
+        """
+        cls._ensure_table()
+        names = list(files) + list(removed)
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            if names:
+                db.query(cls).filter(cls.repo_id == repo_id, cls.file_name.in_(names)).delete(synchronize_session=False)
+            db.bulk_save_objects([
+                cls(
+                    repo_id=repo_id,
+                    file_name=file_name,
+                    content_hash=file_hash,
+                    point_ids=point_ids,
+                    commit=commit,
+                    updated_at=now
+                )
+                for file_name, (file_hash, point_ids) in files.items()
+            ])
+            if commit is not None:
+                # Unchanged files are now part of this commit too
+                db.query(cls).filter(cls.repo_id == repo_id, cls.commit.is_distinct_from(commit)).update(
+                    {cls.commit: commit, cls.updated_at: now}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,210 @@
+import os
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from ingestor import FileIngestor
+from processor import GitHubProcessor
+from processed_document import ProcessedDocument
+from raw_document import RawDocument
+from raw_document_dao import RawDocumentDAO
+from indexed_file_dao import IndexedFileDAO
+from processed_document_dao import point_id_for
+from utils.hashing import content_hash
+from utils.pipeline import Stage, batched, close_all
+
+logger = logging.getLogger(__name__)
+
+# Files read ahead of the chunker, and batches queued between chunking, embedding and storing.
+# Together with batch_size these bound how much of a repository is in memory at once.
+FILE_QUEUE_SIZE = int(os.getenv("PIPELINE_FILE_QUEUE", "64"))
+BATCH_QUEUE_SIZE = int(os.getenv("PIPELINE_BATCH_QUEUE", "2"))
+# How long a failed run waits for stage threads still inside a call to wind down
+STAGE_JOIN_TIMEOUT = float(os.getenv("PIPELINE_JOIN_TIMEOUT", "60"))
+
+class RepoIndexer:
+    """
+    Indexes a repository into the vector store, re-doing only what changed.
+
+    The content hash of every file and the point IDs of its chunks are kept in
+    indexed_files. On the next run only files whose hash changed are chunked,
+    only chunks whose content is new are embedded, and points and raw documents
+    of chunks that no longer exist are deleted. Files that fail to chunk keep
+    their previous state and are retried on the next run. Point IDs are derived from chunk content, so a
+    run that is interrupted and repeated simply upserts the same points again.
+
+    Fetching, chunking, embedding and storing run concurrently, each on its own
+    thread, connected by bounded queues: the first batch is embedded while later
+    files are still downloading, and a full queue holds the stage before it back.
+    """
+    def __init__(self, ingestor: FileIngestor, processor: GitHubProcessor, incremental: bool = True,
+                 progress: Optional[Callable[[str, float], None]] = None, batch_size: int = 1000):
+        """
+        :param progress: Called with (stage, percent) for the fetch, chunk, embed and store stages;
+            until fetching finishes, percentages are of the work discovered so far
+        :param batch_size: Chunks embedded and stored per step; bounds memory and paces progress updates
+        """
+        self.ingestor = ingestor
+        self.processor = processor
+        self.incremental = incremental
+        self.progress = progress or (lambda stage, percent: None)
+        self.batch_size = batch_size
+
+    def _report(self, stage: str, done: int, seen: int, final: bool) -> None:
+        """Progress of a stage that has handled done of the seen items its input has produced so far"""
+        percent = 100.0 * done / max(seen, 1)
+        self.progress(stage, percent if final else min(percent, 99.0))
+
+    def run(self) -> Dict[str, Any]:
+        repo_id = self.ingestor.repo_id
+        previous = IndexedFileDAO.get_repo_state(repo_id)
+        previous_commit = IndexedFileDAO.get_repo_commit(repo_id) if self.incremental else None
+        document_dao = self.processor.processed_document_dao
+        # Repositories indexed before the lexical index existed are added to it once, from PostgreSQL
+        backfill_lexical_index = bool(previous) and not document_dao.lexical_index.has_repo(repo_id)
+        previous_point_ids = {name: set(state['point_ids']) for name, state in previous.items()}
+
+        file_hashes: Dict[str, str] = {}
+        new_point_ids: Dict[str, List[str]] = {}
+        new_chunk_hashes: Dict[str, List[str]] = {}
+        # Line ranges of unchanged chunks in changed files, which may have moved within the file
+        carried_ranges: List[Tuple[str, str, int, int, int]] = []
+        failed_files: Set[str] = set()
+        stored_point_ids: Set[str] = set()
+        counts = {"changed": 0, "chunked": 0, "pending": 0, "embedded": 0, "stored": 0}
+        finished: Set[str] = set()
+        commit = None
+
+        def changed_files() -> Iterator[Dict]:
+            """1. Diff each file of the current snapshot against the last indexed one as it arrives"""
+            nonlocal commit
+            for file_info in self.ingestor.iter_files():
+                file_hash = content_hash(file_info['content'])
+                file_hashes[file_info['name']] = file_hash
+                commit = commit or file_info.get('commit')
+                known = previous.get(file_info['name'])
+                if not self.incremental or known is None or known['content_hash'] != file_hash:
+                    new_point_ids[file_info['name']] = []
+                    new_chunk_hashes[file_info['name']] = []
+                    counts["changed"] += 1
+                    yield file_info
+            finished.add('fetch')
+            self.progress('fetch', 100)
+
+        def pending_documents(file_documents: Iterator[List[RawDocument]]) -> Iterator[RawDocument]:
+            """2. Keep only chunks that are not stored yet"""
+            try:
+                for documents in file_documents:
+                    for doc in documents:
+                        point_id = point_id_for(repo_id, doc.original_file, doc.chunk_metadata['content_hash'])
+                        file_point_ids = new_point_ids[doc.original_file]
+                        if point_id in file_point_ids:
+                            continue  # Identical chunk repeated within the same file
+                        file_point_ids.append(point_id)
+                        new_chunk_hashes[doc.original_file].append(doc.chunk_metadata['content_hash'])
+                        if self.incremental and point_id in previous_point_ids.get(doc.original_file, ()):
+                            metadata = doc.chunk_metadata
+                            carried_ranges.append((doc.original_file, metadata['content_hash'], metadata['chunk_index'],
+                                                   metadata['start_line'], metadata['end_line']))
+                            continue
+                        counts["pending"] += 1
+                        yield doc
+                    counts["chunked"] += 1
+                    self._report('chunk', counts["chunked"], counts["changed"], 'fetch' in finished)
+                finished.add('chunk')
+            finally:
+                # Closes iter_documents, and with it the chunking pool, as soon as the stage stops
+                file_documents.close()
+
+        Embedded = Tuple[List[RawDocument], List[ProcessedDocument]]
+
+        def embedded_batches(batches: Iterable[List[RawDocument]]) -> Iterator[Embedded]:
+            """3. Embed new chunks a batch at a time"""
+            for batch in batches:
+                processed_docs = self.processor.process(batch, save_to_db=False)
+                counts["embedded"] += len(batch)
+                self._report('embed', counts["embedded"], counts["pending"], 'chunk' in finished)
+                yield batch, processed_docs
+
+        def stored_batches(batches: Iterable[Embedded]) -> Iterator[int]:
+            """4. Store each embedded batch while the next one is being embedded"""
+            for batch, processed_docs in batches:
+                RawDocumentDAO.batch_save(batch)
+                document_dao.batch_save(processed_docs)
+                stored_point_ids.update(
+                    point_id_for(repo_id, doc.original_file, doc.chunk_metadata['content_hash']) for doc in batch
+                )
+                counts["stored"] += len(batch)
+                self._report('store', counts["stored"], counts["pending"], 'chunk' in finished)
+                yield len(batch)
+
+        for stage in ('fetch', 'chunk', 'embed', 'store'):
+            self.progress(stage, 0)
+        fetch = Stage('fetch', changed_files(), maxsize=FILE_QUEUE_SIZE)
+        chunk = Stage('chunk', batched(pending_documents(self.ingestor.iter_documents(fetch, on_failure=failed_files.add)), self.batch_size),
+                      maxsize=BATCH_QUEUE_SIZE, size=len)
+        embed = Stage('embed', embedded_batches(chunk), maxsize=BATCH_QUEUE_SIZE, size=lambda item: len(item[0]))
+        store = Stage('store', stored_batches(embed), maxsize=BATCH_QUEUE_SIZE, size=lambda stored: stored)
+        stages = (fetch, chunk, embed, store)
+        try:
+            for _ in store:
+                pass
+        finally:
+            close_all(stages, timeout=STAGE_JOIN_TIMEOUT)
+        removed_files = [name for name in previous if name not in file_hashes]
+        # Files that could not be chunked keep their previous points and state, and are retried next run
+        for file_name in failed_files:
+            del new_point_ids[file_name], new_chunk_hashes[file_name]
+
+        # 5. Drop points and raw documents of chunks that were rewritten or whose file disappeared,
+        #    and move the raw documents of unchanged chunks to their new lines
+        stale_point_ids = []
+        for file_name in list(new_point_ids) + removed_files:
+            known = previous.get(file_name)
+            if known is None:
+                continue
+            current = set(new_point_ids.get(file_name, ()))
+            stale_point_ids.extend(point_id for point_id in known['point_ids'] if point_id not in current)
+        document_dao.delete_points(stale_point_ids, repo_id=repo_id)
+        RawDocumentDAO.delete_stale(repo_id, {
+            **{file_name: new_chunk_hashes[file_name] for file_name in new_point_ids if file_name in previous},
+            **{file_name: [] for file_name in removed_files}
+        })
+        RawDocumentDAO.update_line_ranges(repo_id, carried_ranges)
+
+        # 6. Points carried over unchanged still carry the commit they were first stored at
+        if previous_commit is None or backfill_lexical_index:
+            # State from before commits were recorded, or before the lexical index: tag carried points by ID
+            carried_point_ids: Dict[str, List[str]] = {}
+            for file_name in file_hashes:
+                point_ids = new_point_ids.get(file_name)
+                if point_ids is None:
+                    if file_name not in previous:
+                        continue  # New file that failed to chunk
+                    point_ids = previous[file_name]['point_ids']
+                carried = [point_id for point_id in point_ids if point_id not in stored_point_ids]
+                if carried:
+                    carried_point_ids.setdefault(self.ingestor.language_of(file_name), []).extend(carried)
+            document_dao.tag_points(repo_id, commit, carried_point_ids, backfill_lexical_index=backfill_lexical_index)
+        elif commit != previous_commit:
+            document_dao.tag_repo(repo_id, commit)
+
+        IndexedFileDAO.save_repo_state(
+            repo_id,
+            {name: (file_hashes[name], point_ids) for name, point_ids in new_point_ids.items()},
+            removed=removed_files,
+            commit=commit
+        )
+
+        stats = {
+            "files": len(file_hashes),
+            "changed_files": counts["changed"],
+            "removed_files": len(removed_files),
+            "failed_files": len(failed_files),
+            "embedded_chunks": counts["stored"],
+            "deleted_chunks": len(stale_point_ids),
+            # Files fetched and chunks chunked, embedded and stored, with each stage's throughput
+            "stages": {stage.name: stage.stats.as_dict() for stage in stages}
+        }
+        self.progress('embed', 100)
+        self.progress('store', 100)
+        logger.info(f"Indexed {repo_id}: {stats}")
+        return stats
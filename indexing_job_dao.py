@@ -0,0 +1,267 @@
+import os
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Text, UniqueConstraint, func, or_, text
+from sqlalchemy.orm import aliased
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+
+from database import Base, SessionLocal, engine
+
+# Stages of an indexing run, in order, each reported as a percentage
+STAGES = ('fetch', 'chunk', 'embed', 'store')
+
+# A running job whose worker has not written a heartbeat for this long is reclaimed
+STALE_AFTER = timedelta(seconds=int(os.getenv("INDEX_JOB_STALE_SECONDS", "300")))
+MAX_ATTEMPTS = int(os.getenv("INDEX_JOB_MAX_ATTEMPTS", "3"))
+# A failed attempt is retried after this delay, doubled for every further attempt
+RETRY_DELAY = timedelta(seconds=int(os.getenv("INDEX_JOB_RETRY_SECONDS", "30")))
+
+class IndexingJobDAO(Base):
+    """
+    Durable queue of repository indexing jobs.
+
+    There is one row per (repo_id, commit), so asking to index a commit that is
+    already queued, running or indexed returns the existing job instead of
+    starting another, and queuing a newer commit supersedes older queued ones.
+    Workers claim jobs with FOR UPDATE SKIP LOCKED, never for a repository that
+    another worker is indexing, keep a heartbeat while they run, and record
+    per-stage progress. Failed attempts are retried with exponential backoff.
+    """
+    __tablename__ = 'indexing_jobs'
+    __table_args__ = (UniqueConstraint('repo_id', 'commit', name='indexing_jobs_repo_commit_key'),)
+
+    id = Column(Integer, primary_key=True)
+    repo_id = Column(String, index=True, nullable=False)
+    repo_url = Column(String, nullable=False)
+    branch = Column(String)
+    commit = Column(String, nullable=False)
+    status = Column(String, index=True, nullable=False, default='queued')  # queued, running, completed, failed, superseded
+    stage = Column(String)
+    progress = Column(JSON, nullable=False)
+    stats = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    run_after = Column(DateTime)  # queued jobs are not claimed before this
+
+    _table_ready = False
+
+    @classmethod
+    def _ensure_table(cls) -> None:
+        if not cls._table_ready:
+            Base.metadata.create_all(engine, tables=[cls.__table__])
+            with engine.begin() as conn:
+                # Tables created before retries had a backoff
+                conn.execute(text("ALTER TABLE indexing_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP"))
+            cls._table_ready = True
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "repo_id": self.repo_id,
+            "commit": self.commit,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "stats": self.stats,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    @classmethod
+    def enqueue(cls, repo_id: str, repo_url: str, branch: str, commit: str) -> Dict:
+        """Queue a commit for indexing, or return the job that already covers it"""
+        cls._ensure_table()
+        db = SessionLocal()
+        try:
+            job = db.query(cls).filter(cls.repo_id == repo_id, cls.commit == commit).with_for_update().first()
+            if job is None:
+                job = cls(
+                    repo_id=repo_id,
+                    repo_url=repo_url,
+                    branch=branch,
+                    commit=commit,
+                    status='queued',
+                    progress={stage: 0 for stage in STAGES},
+                    attempts=0,
+                    created_at=datetime.utcnow()
+                )
+                db.add(job)
+            elif job.status in ('failed', 'superseded'):
+                # An explicit request retries the commit from scratch
+                job.status = 'queued'
+                job.error = None
+                job.attempts = 0
+                job.run_after = None
+                job.progress = {stage: 0 for stage in STAGES}
+                job.created_at = datetime.utcnow()
+            db.flush()
+            if job.status == 'queued':
+                # Indexing this commit covers any older one still waiting
+                db.query(cls).filter(
+                    cls.repo_id == repo_id, cls.status == 'queued', cls.id != job.id
+                ).update({cls.status: 'superseded'}, synchronize_session=False)
+            db.commit()
+            return job.to_dict()
+        except Exception:
+            db.rollback()
+            # Lost a race to insert the same (repo_id, commit); the other row is the job
+            existing = db.query(cls).filter(cls.repo_id == repo_id, cls.commit == commit).first()
+            if existing is None:
+                raise
+            return existing.to_dict()
+        finally:
+            db.close()
+
+    @classmethod
+    def claim(cls, worker_id: str) -> Optional[Dict]:
+        """
+        Take the oldest runnable job: queued and past its retry delay, or running
+        with a stale heartbeat (its worker died). Concurrent workers skip rows
+        another has locked, and a transaction-level advisory lock per repository
+        keeps two workers from claiming jobs of the same repository at once.
+        Jobs that used up their attempts are failed on the way.
+        """
+        cls._ensure_table()
+        db = SessionLocal()
+        try:
+            skipped = []
+            while True:
+                now = datetime.utcnow()
+                other = aliased(cls)
+                repo_busy = db.query(other.id).filter(
+                    other.repo_id == cls.repo_id,
+                    other.id != cls.id,
+                    other.status == 'running',
+                    other.heartbeat_at >= now - STALE_AFTER
+                ).exists()
+                job = (
+                    db.query(cls)
+                    .filter(or_(
+                        (cls.status == 'queued') & or_(cls.run_after.is_(None), cls.run_after <= now),
+                        (cls.status == 'running') & (cls.heartbeat_at < now - STALE_AFTER)
+                    ))
+                    .filter(~repo_busy, cls.id.notin_(skipped))
+                    .order_by(cls.created_at)
+                    .with_for_update(skip_locked=True)
+                    .first()
+                )
+                if job is None:
+                    db.rollback()
+                    return None
+                # Held until commit, by which time the claim is visible to the next worker's check
+                locked = db.execute(
+                    text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                    {"key": f"indexing_jobs:{job.repo_id}"}
+                ).scalar()
+                # The NOT EXISTS above ran before the lock; only a fresh check counts
+                busy = db.query(cls.id).filter(
+                    cls.repo_id == job.repo_id,
+                    cls.id != job.id,
+                    cls.status == 'running',
+                    cls.heartbeat_at >= now - STALE_AFTER
+                ).first()
+                if not locked or busy is not None:
+                    skipped.append(job.id)
+                    continue
+                if job.attempts >= MAX_ATTEMPTS:
+                    job.status = 'failed'
+                    job.error = job.error or f"Gave up after {job.attempts} attempts"
+                    job.finished_at = now
+                    db.commit()
+                    continue
+                job.status = 'running'
+                job.worker_id = worker_id
+                job.attempts += 1
+                job.started_at = now
+                job.heartbeat_at = now
+                job.run_after = None
+                db.commit()
+                return {**job.to_dict(), "repo_url": job.repo_url, "branch": job.branch}
+        finally:
+            db.close()
+
+    @classmethod
+    def report_progress(cls, job_id: int, stage: str, percent: float) -> None:
+        """Record a stage's progress; doubles as a heartbeat"""
+        db = SessionLocal()
+        try:
+            job = db.query(cls).filter(cls.id == job_id).first()
+            if job is None:
+                return
+            # Reassign so the JSON column is marked dirty
+            job.progress = {**job.progress, stage: round(min(percent, 100.0), 1)}
+            job.stage = stage
+            job.heartbeat_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    @classmethod
+    def heartbeat(cls, job_id: int) -> None:
+        db = SessionLocal()
+        try:
+            db.query(cls).filter(cls.id == job_id, cls.status == 'running').update(
+                {cls.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @classmethod
+    def finish(cls, job_id: int, stats: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        """Mark a job completed, or failed with an error"""
+        db = SessionLocal()
+        try:
+            job = db.query(cls).filter(cls.id == job_id).first()
+            if job is None:
+                return
+            job.finished_at = datetime.utcnow()
+            if error is None:
+                job.status = 'completed'
+                job.stats = stats
+                job.progress = {stage: 100 for stage in STAGES}
+            else:
+                # Failed attempts go back to the queue, after a growing delay, until MAX_ATTEMPTS is reached
+                job.error = error
+                if job.attempts < MAX_ATTEMPTS:
+                    job.status = 'queued'
+                    job.run_after = job.finished_at + RETRY_DELAY * 2 ** max(job.attempts - 1, 0)
+                else:
+                    job.status = 'failed'
+            db.commit()
+        finally:
+            db.close()
+
+    @classmethod
+    def latest_for_repo(cls, repo_id: str) -> Optional[Dict]:
+        """The most recently queued job for a repository"""
+        cls._ensure_table()
+        db = SessionLocal()
+        try:
+            job = db.query(cls).filter(cls.repo_id == repo_id).order_by(cls.created_at.desc()).first()
+            return job.to_dict() if job else None
+        finally:
+            db.close()
+
+    @classmethod
+    def index_version(cls, repo_id: Optional[str] = None) -> Optional[str]:
+        """
+        Version of a repository's index (or of all repositories): when its latest
+        indexing job completed. Caches keyed on it go stale after a re-index.
+        """
+        cls._ensure_table()
+        db = SessionLocal()
+        try:
+            query = db.query(func.max(cls.finished_at)).filter(cls.status == 'completed')
+            if repo_id is not None:
+                query = query.filter(cls.repo_id == repo_id)
+            finished_at = query.scalar()
+            return finished_at.isoformat() if finished_at else None
+        finally:
+            db.close()
@@ -1,11 +1,44 @@
+import io
+import mmap
+import os
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-from github_reader import fetch_github_files
+from collections import deque
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+from github_reader import iter_github_files, iter_zip_files, looks_binary, repo_slug, BINARY_SNIFF_BYTES, MAX_FILE_SIZE
 from raw_document import RawDocument
 from chunking import chunk_file
+from codebase_map import CodebaseMapper
 from datetime import datetime
 from utils.tree_sitter_utils import TreeSitterManager
-from raw_document_dao import RawDocumentDAO
+from snapshot_cache import SnapshotCache
+from utils.hashing import content_hash
+from utils.parallel import default_workers, ordered_map
+
+# Common non-code files that are never worth chunking
+SKIPPED_SUFFIXES = ('.gitignore', 'package-lock.json', 'yarn.lock',
+                    '.dockerignore', '.env', '.pyc', '.log')
+# Directories that only exist in local checkouts, never in GitHub zipballs
+SKIPPED_DIRS = {'.git', '.hg', '.svn'}
+
+# Per-process state of chunking pool workers; each worker owns its TreeSitterManager
+_worker_ts_manager: Optional[TreeSitterManager] = None
+_worker_tagger: Optional[CodebaseMapper] = None
+_worker_chunk_args: Dict[str, int] = {}
+
+def _init_chunk_worker(max_chars: int, coalesce: int) -> None:
+    global _worker_ts_manager, _worker_tagger
+    _worker_ts_manager = TreeSitterManager()
+    _worker_tagger = CodebaseMapper(workers=1, ts_manager=_worker_ts_manager)
+    _worker_chunk_args.update(max_chars=max_chars, coalesce=coalesce)
+
+def _chunk_file_worker(file_info: Dict) -> Optional[List[Dict]]:
+    return chunk_file(
+        file_info=file_info,
+        ts_manager=_worker_ts_manager,
+        tagger=_worker_tagger,
+        **_worker_chunk_args
+    )
 
 class BaseIngestor(ABC):
     """
@@ -20,58 +53,252 @@ class BaseIngestor(ABC):
         """Each source-specific ingestor will implement this method"""
         pass
 
-class GitHubIngestor(BaseIngestor):
-    def __init__(self, url: str, token: Optional[str] = None, max_chars: int = 1500, coalesce: int = 50):
-        self.url = url
-        self.token = token
+class FileIngestor(BaseIngestor):
+    """
+    Base class for ingestors that read whole source files and chunk them.
+    Subclasses only decide where the files come from by implementing iter_files(),
+    which yields the same records as github_reader.iter_github_files.
+    """
+    def __init__(self, repo_id: str, max_chars: int = 1500, coalesce: int = 50, workers: Optional[int] = None):
+        self.repo_id = repo_id
         self.max_chars = max_chars
         self.coalesce = coalesce
+        # Parsing and chunking are CPU-bound, so they scale across processes
+        self.workers = workers or default_workers()
         self.ts_manager = TreeSitterManager()
+        # Chunk symbols come from the same tag queries as the repo map
+        self.tagger = CodebaseMapper(workers=1, ts_manager=self.ts_manager)
 
-    def ingest(self, save_to_db: bool = True) -> List[RawDocument]:
-        # Fetch files from GitHub
-        files = fetch_github_files(
-            repo_url=self.url,
-            gh_token=self.token
+    @abstractmethod
+    def iter_files(self) -> Iterator[Dict]:
+        """Yield file records with 'name', 'content', 'branch', 'commit' and 'size' keys"""
+        pass
+
+    def _chunk_files(self, files: Iterable[Dict]) -> Iterator[Optional[List[Dict]]]:
+        """
+        Chunk files in input order, on a process pool when more than one worker is configured.
+        Files that could not be parsed come back as None.
+        """
+        if self.workers <= 1:
+            for file_info in files:
+                yield chunk_file(
+                    file_info=file_info,
+                    ts_manager=self.ts_manager,
+                    tagger=self.tagger,
+                    max_chars=self.max_chars,
+                    coalesce=self.coalesce
+                )
+            return
+
+        yield from ordered_map(
+            _chunk_file_worker,
+            files,
+            workers=self.workers,
+            initializer=_init_chunk_worker,
+            initargs=(self.max_chars, self.coalesce)
         )
 
-        # Chunk the files
-        chunked_files = []
-        for file_info in files:
+    def language_of(self, file_name: str) -> str:
+        """Language tag stored with each chunk, e.g. 'typescript' for .ts and .tsx"""
+        return self.ts_manager.get_language(file_name).split('.')[0] or 'text'
+
+    def iter_documents(self, files: Iterable[Dict],
+                       on_failure: Optional[Callable[[str], None]] = None) -> Iterator[List[RawDocument]]:
+        """
+        Chunk files lazily and yield the RawDocuments of each file in turn, so a
+        caller can start on the first chunks while later files are still read.
+        :param on_failure: Called with the name of each file that could not be chunked;
+            such files yield an empty list
+        """
+        # Names of the files handed to the chunker, in order, until their chunks come back
+        names = deque()
+
+        def code_files() -> Iterator[Dict]:
             # Skip common non-code files
-            filename = file_info['name'].lower()
-            if (filename.endswith(('.gitignore', 'package-lock.json', 'yarn.lock', 
-                                 '.dockerignore', '.env', '.pyc', '.log'))):
-                continue
-
-            chunks = chunk_file(
-                file_info=file_info,
-                parser=self.ts_manager.parser,
-                max_chars=self.max_chars,
-                coalesce=self.coalesce
-            )
-            chunked_files.extend(chunks)
-
-        # Create RawDocuments from chunks
+            for file_info in files:
+                if not file_info['name'].lower().endswith(SKIPPED_SUFFIXES):
+                    names.append(file_info['name'])
+                    yield file_info
+
+        chunked = self._chunk_files(code_files())
+        try:
+            for chunks in chunked:
+                file_name = names.popleft()
+                if chunks is None:
+                    if on_failure is not None:
+                        on_failure(file_name)
+                    chunks = []
+                timestamp = datetime.utcnow().isoformat()
+                yield [
+                    RawDocument(
+                        content=chunk['content'],
+                        file_name=chunk['file_name'],
+                        file_size=len(chunk['content']),
+                        timestamp=timestamp,
+                        original_file=chunk['original_file'],
+                        chunk_metadata={
+                            "repo_id": self.repo_id,
+                            "commit": chunk.get('commit'),
+                            "language": self.language_of(chunk['original_file']),
+                            "content_hash": content_hash(chunk['content']),
+                            "chunk_index": chunk['chunk_index'],
+                            "start_line": chunk['start_line'],
+                            "end_line": chunk['end_line'],
+                            "symbols": chunk.get('symbols', [])
+                        }
+                    ) for chunk in chunks
+                ]
+        finally:
+            # Releases the chunking pool now rather than whenever the generator is collected
+            chunked.close()
+
+    def documents_from_files(self, files: Iterable[Dict],
+                             progress: Optional[Callable[[float], None]] = None) -> List[RawDocument]:
+        """
+        Chunk the given files and wrap each chunk in a RawDocument.
+        :param progress: Called with the percentage of files chunked so far
+        """
+        if progress is not None:
+            files = [file_info for file_info in files if not file_info['name'].lower().endswith(SKIPPED_SUFFIXES)]
+            total = max(len(files), 1)
+
         documents = []
-        for chunk in chunked_files:
-            documents.append(
-                RawDocument(
-                    content=chunk['content'],
-                    file_name=chunk['file_name'],
-                    file_size=len(chunk['content']),
-                    timestamp=datetime.utcnow().isoformat(),
-                    original_file=chunk['original_file'],
-                    chunk_metadata={
-                        "chunk_index": chunk['chunk_index'],
-                        "start_line": chunk['start_line'],
-                        "end_line": chunk['end_line']
-                    }
-                )
-            )
-        
+        for done, file_documents in enumerate(self.iter_documents(files), 1):
+            documents.extend(file_documents)
+            if progress is not None:
+                progress(100.0 * done / total)
+
+        return documents
+
+    def ingest(self, save_to_db: bool = True) -> List[RawDocument]:
+        documents = self.documents_from_files(self.iter_files())
+
         if save_to_db:
+            # Imported here so offline use (benchmarks, local mirrors) needs no database
+            from raw_document_dao import RawDocumentDAO
+
             # Save all documents in one batch
             RawDocumentDAO.batch_save(documents)
-        
+
         return documents
+
+class GitHubIngestor(FileIngestor):
+    def __init__(self, url: str, token: Optional[str] = None, max_chars: int = 1500, coalesce: int = 50,
+                 cache: Optional[SnapshotCache] = None, workers: Optional[int] = None,
+                 revision: Optional[Tuple[str, str]] = None):
+        super().__init__(repo_id=repo_slug(url), max_chars=max_chars, coalesce=coalesce, workers=workers)
+        self.url = url
+        self.token = token
+        self.cache = cache
+        # (branch, sha) to index; defaults to the branch head at read time
+        self.revision = revision
+
+    def iter_files(self) -> Iterator[Dict]:
+        # Stream files from GitHub
+        return iter_github_files(
+            repo_url=self.url,
+            gh_token=self.token,
+            cache=self.cache,
+            revision=self.revision
+        )
+
+class _MmapReader(io.RawIOBase):
+    """Seekable file object over an mmap, which zipfile cannot use directly"""
+    def __init__(self, mapped: mmap.mmap):
+        self._mapped = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self) -> int:
+        return self._mapped.tell()
+
+class LocalDirectoryIngestor(FileIngestor):
+    """
+    Ingests a checked-out working tree or mirror from local disk.
+    Files are read through mmap so the binary sniff and the size check never
+    copy more than the first block of a file that ends up being skipped.
+    """
+    def __init__(self, path: str, max_chars: int = 1500, coalesce: int = 50,
+                 branch: Optional[str] = None, commit: Optional[str] = None,
+                 max_file_size: int = MAX_FILE_SIZE, repo_id: Optional[str] = None,
+                 workers: Optional[int] = None):
+        self.path = Path(path)
+        super().__init__(repo_id=repo_id or self.path.name, max_chars=max_chars, coalesce=coalesce,
+                         workers=workers)
+        self.branch = branch
+        self.commit = commit
+        self.max_file_size = max_file_size
+
+    def _read_text(self, file_path: Path, size: int) -> Optional[str]:
+        """Return the decoded file, or None if it is binary or not UTF-8"""
+        if size == 0:
+            return ""
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if looks_binary(mapped[:BINARY_SNIFF_BYTES]):
+                return None
+            view = memoryview(mapped)
+            try:
+                return str(view, 'utf-8')
+            except UnicodeDecodeError:
+                return None
+            finally:
+                view.release()
+
+    def iter_files(self) -> Iterator[Dict]:
+        for root, dirs, file_names in os.walk(self.path):
+            # Prune VCS metadata and keep traversal order deterministic
+            dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRS)
+            for file_name in sorted(file_names):
+                file_path = Path(root) / file_name
+                try:
+                    if file_path.is_symlink() or not file_path.is_file():
+                        continue
+                    size = file_path.stat().st_size
+                    if size > self.max_file_size:
+                        continue
+                    content = self._read_text(file_path, size)
+                except OSError:
+                    continue
+                if content is None:
+                    continue
+                yield {
+                    'name': file_path.relative_to(self.path).as_posix(),
+                    'content': content,
+                    'branch': self.branch,
+                    'commit': self.commit,
+                    'size': size
+                }
+
+class ArchiveIngestor(FileIngestor):
+    """
+    Ingests a pre-downloaded GitHub zipball from local disk.
+    The archive is memory-mapped rather than loaded, so only the entries being
+    decoded are ever resident.
+    """
+    def __init__(self, path: str, max_chars: int = 1500, coalesce: int = 50,
+                 branch: Optional[str] = None, commit: Optional[str] = None,
+                 max_file_size: int = MAX_FILE_SIZE, repo_id: Optional[str] = None,
+                 workers: Optional[int] = None):
+        self.path = Path(path)
+        super().__init__(repo_id=repo_id or self.path.stem, max_chars=max_chars, coalesce=coalesce,
+                         workers=workers)
+        self.branch = branch
+        self.commit = commit
+        self.max_file_size = max_file_size
+
+    def iter_files(self) -> Iterator[Dict]:
+        with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from iter_zip_files(_MmapReader(mapped), self.branch, self.max_file_size, commit=self.commit)
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+from vector_store import SearchHit
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+# camelCase / PascalCase / HTTPServer / utf8 pieces of an identifier segment
+_CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+# Identifiers written the way code names things: snake_case, camelCase, PascalCase (HTTPServer),
+# `quoted` or called(). A single capital, as at the start of a sentence, does not count.
+_IDENTIFIER_HINT = re.compile(
+    r"`([^`]+)`|\b([A-Za-z_][A-Za-z0-9_]*)\(\)"
+    r"|\b([A-Za-z]+_[A-Za-z0-9_]+|[a-z]+[A-Z][A-Za-z0-9]*|[A-Z]+[a-z0-9]+[A-Z][A-Za-z0-9]*|[A-Z]{2,}[a-z][A-Za-z0-9]*)\b"
+)
+
+# Question words that match nearly every chunk and would only add noise to BM25
+STOPWORDS = frozenset("""
+    a an and are as at be by can could do does did for from how i if in into is it its me my of on or
+    should so that the their them then there these this to use used uses using was what when where which
+    who why will with work works would you your
+""".split())
+
+def split_identifier(word: str) -> List[str]:
+    """'getHTTPResponse_code' -> ['get', 'http', 'response', 'code']"""
+    return [part.lower() for segment in word.split('_') for part in _CAMEL_PART.findall(segment)]
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased tokens of code or prose: every identifier as a whole, followed by
+    its snake_case / camelCase parts when it has more than one
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word.lower())
+        parts = split_identifier(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+def query_identifiers(question: str) -> Set[str]:
+    """Identifiers a question names explicitly, lower-cased"""
+    names = set()
+    for match in _IDENTIFIER_HINT.finditer(question):
+        name = next(group for group in match.groups() if group)
+        names.update(word.lower() for word in _WORD.findall(name))
+    return names
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk content and the symbols each chunk defines,
+    kept in SQLite FTS5 at LEXICAL_INDEX_PATH and shared by the app and the
+    indexing workers.
+
+    Text is tokenized here rather than by FTS5, so `chunk_file` is indexed as
+    chunk_file, chunk and file, and `getUserName` as getusername, get, user and
+    name; questions are tokenized the same way. Symbol matches are weighted
+    above body matches.
+    """
+    def __init__(self, path: Optional[str] = None, symbol_weight: float = 4.0):
+        self.path = Path(path or os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical.sqlite3"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.symbol_weight = symbol_weight
+        self._lock = threading.Lock()
+        # Autocommit mode; _transaction() issues BEGIN IMMEDIATE itself
+        self._db = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                point_id TEXT NOT NULL UNIQUE,
+                repo_id TEXT,
+                symbols TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_repo_id ON chunks (repo_id)")
+        # Tokens are pre-split by tokenize(); '_' is kept so whole snake_case names stay one token,
+        # and words are stemmed so 'chunks' matches 'chunk'
+        self._db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms
+            USING fts5(symbols, body, tokenize = "porter unicode61 tokenchars '_'")
+        """)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _ids(self, point_ids: Sequence[str]) -> Dict[str, int]:
+        rows = {}
+        for start in range(0, len(point_ids), 500):
+            chunk = list(point_ids[start:start + 500])
+            rows.update(self._db.execute(
+                f"SELECT point_id, id FROM chunks WHERE point_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return rows
+
+    def has_repo(self, repo_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM chunks WHERE repo_id = ? LIMIT 1", (repo_id,)).fetchone() is not None
+
+    def missing(self, point_ids: Sequence[str]) -> List[str]:
+        with self._lock:
+            known = self._ids(point_ids)
+        return [point_id for point_id in point_ids if point_id not in known]
+
+    def add(self, point_ids: Sequence[str], payloads: Sequence[Dict[str, Any]],
+            symbols: Sequence[Sequence[str]]) -> None:
+        """
+        Index chunks by point ID. Point IDs are derived from content, so a chunk
+        already indexed only has its payload refreshed.
+        """
+        with self._transaction():
+            known = self._ids(point_ids)
+            for point_id, payload, names in zip(point_ids, payloads, symbols):
+                if point_id in known:
+                    stored = json.dumps(payload)
+                    self._db.execute("UPDATE chunks SET payload = ? WHERE id = ? AND payload != ?",
+                                     (stored, known[point_id], stored))
+                    continue
+                rowid = self._db.execute(
+                    "INSERT INTO chunks (point_id, repo_id, symbols, payload) VALUES (?, ?, ?, ?)",
+                    (point_id, payload.get("repo_id"), " ".join(names), json.dumps(payload))
+                ).lastrowid
+                self._db.execute(
+                    "INSERT INTO chunk_terms (rowid, symbols, body) VALUES (?, ?, ?)",
+                    (rowid, " ".join(token for name in names for token in tokenize(name)),
+                     " ".join(tokenize(payload.get("content", ""))))
+                )
+                known[point_id] = rowid
+
+    def set_repo_payload(self, repo_id: str, payload: Dict[str, Any]) -> None:
+        """Merge payload into the stored payload of a repository's chunks that do not carry it yet"""
+        merged = "json_set(payload, " + ", ".join(f"'$.{key}', ?" for key in payload) + ")"
+        with self._transaction():
+            self._db.execute(
+                f"UPDATE chunks SET payload = {merged} WHERE repo_id = ? AND payload != {merged}",
+                list(payload.values()) + [repo_id] + list(payload.values())
+            )
+
+    def delete(self, point_ids: Sequence[str]) -> None:
+        with self._transaction():
+            rowids = [(rowid,) for rowid in self._ids(point_ids).values()]
+            self._db.executemany("DELETE FROM chunk_terms WHERE rowid = ?", rowids)
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", rowids)
+
+    def reset(self) -> None:
+        with self._transaction():
+            self._db.execute("DELETE FROM chunk_terms")
+            self._db.execute("DELETE FROM chunks")
+
+    def search(self, question: str, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """
+        Best BM25 matches for a question, highest score first. Hits carry the
+        stored payload plus the chunk's 'symbols'; their score is the positive BM25.
+        """
+        terms = [token for token in dict.fromkeys(tokenize(question)) if token not in STOPWORDS]
+        if not terms:
+            return []
+        filters = dict(filters or {})
+        repo_id = filters.pop("repo_id", None)
+        match = " OR ".join(f'"{term}"' for term in terms)
+        query = f"""
+            SELECT c.point_id, c.symbols, c.payload, -bm25(chunk_terms, ?, 1.0) AS score
+            FROM chunk_terms JOIN chunks c ON c.id = chunk_terms.rowid
+            WHERE chunk_terms MATCH ? {"AND c.repo_id = ?" if repo_id else ""}
+            ORDER BY bm25(chunk_terms, ?, 1.0)
+            LIMIT ?
+        """
+        params = [self.symbol_weight, match] + ([repo_id] if repo_id else []) + [self.symbol_weight]
+        # Other filters are applied to the payload, so fetch a little more than needed
+        params.append(top_k * 4 if filters else top_k)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        hits = []
+        for point_id, symbols, payload, score in rows:
+            payload = json.loads(payload)
+            if any(payload.get(key) != value for key, value in filters.items()):
+                continue
+            hits.append(SearchHit(id=point_id, score=score, payload={**payload, "symbols": symbols.split()}))
+        return hits[:top_k]
+
+def names_defined_symbol(question: str, hits: List[SearchHit]) -> bool:
+    """Whether the question names an identifier that one of the hits defines"""
+    names = query_identifiers(question)
+    if not names:
+        return False
+    return any(symbol.lower() in names for hit in hits for symbol in hit.payload.get("symbols", ()))
@@ -1,14 +1,41 @@
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
 import logging
 import os
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from utils.prompts import GENERATE_DIAGRAM_PROMPT, INITIAL_DIAGRAM_PROMPT, QUESTION_DIAGRAM_PROMPT
 from processed_document import ProcessedDocument
 
 logger = logging.getLogger(__name__)
 
-# Initialize Anthropic client
+# Initialize Anthropic clients; the async one serves the request path without blocking the event loop
 client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+async_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+def _request_args(prompt: str) -> Dict[str, Any]:
+    """Model settings shared by every diagram request"""
+    return dict(
+        model="claude-3-5-sonnet-20241022",
+        system=GENERATE_DIAGRAM_PROMPT,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=5000,
+        temperature=0.3,
+    )
+
+def _initial_prompt(codebase_map: str) -> str:
+    # Create the prompt with the codebase map
+    return INITIAL_DIAGRAM_PROMPT.format(codebase_map=codebase_map)
+
+def _question_prompt(question: str, relevant_docs: List[ProcessedDocument]) -> str:
+    # Extract content from relevant documents
+    code_context = "\n\n".join([f"File: {doc.file_name}\n{doc.content}" for doc in relevant_docs])
+
+    # Create the prompt with the question and code context
+    return QUESTION_DIAGRAM_PROMPT.format(
+        question=question,
+        code_context=code_context
+    )
 
 def generate_initial_diagram(codebase_map: str) -> str:
     """
@@ -16,18 +43,7 @@ def generate_initial_diagram(codebase_map: str) -> str:
     based on the codebase map.
     """
     try:
-        # Create the prompt with the codebase map
-        prompt = INITIAL_DIAGRAM_PROMPT.format(codebase_map=codebase_map)
-        
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            system=GENERATE_DIAGRAM_PROMPT,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=5000,
-            temperature=0.3,
-        )
+        response = client.messages.create(**_request_args(_initial_prompt(codebase_map)))
         
         # Extract Mermaid code from response
         full_response = response.content[0].text
@@ -43,24 +59,7 @@ def generate_question_diagram(question: str, relevant_docs: List[ProcessedDocume
     using relevant code context.
     """
     try:
-        # Extract content from relevant documents
-        code_context = "\n\n".join([f"File: {doc.file_name}\n{doc.content}" for doc in relevant_docs])
-        
-        # Create the prompt with the question and code context
-        prompt = QUESTION_DIAGRAM_PROMPT.format(
-            question=question,
-            code_context=code_context
-        )
-        
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            system=GENERATE_DIAGRAM_PROMPT,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=5000,
-            temperature=0.3,
-        )
+        response = client.messages.create(**_request_args(_question_prompt(question, relevant_docs)))
         
         # Extract Mermaid code from response
         full_response = response.content[0].text
@@ -69,3 +68,44 @@ def generate_question_diagram(question: str, relevant_docs: List[ProcessedDocume
     except Exception as e:
         logger.error(f"Error calling LLM for question diagram: {str(e)}")
         raise
+
+async def generate_initial_diagram_async(codebase_map: str) -> str:
+    """Async variant of generate_initial_diagram"""
+    try:
+        response = await async_client.messages.create(**_request_args(_initial_prompt(codebase_map)))
+        return response.content[0].text
+    except Exception as e:
+        logger.error(f"Error calling LLM for initial diagram: {str(e)}")
+        raise
+
+async def generate_question_diagram_async(question: str, relevant_docs: List[ProcessedDocument]) -> str:
+    """Async variant of generate_question_diagram"""
+    try:
+        response = await async_client.messages.create(**_request_args(_question_prompt(question, relevant_docs)))
+        return response.content[0].text
+    except Exception as e:
+        logger.error(f"Error calling LLM for question diagram: {str(e)}")
+        raise
+
+async def _stream_text(prompt: str) -> AsyncIterator[str]:
+    async with async_client.messages.stream(**_request_args(prompt)) as stream:
+        async for text in stream.text_stream:
+            yield text
+
+async def stream_initial_diagram(codebase_map: str) -> AsyncIterator[str]:
+    """Yields the initial diagram's Mermaid code as the model generates it"""
+    try:
+        async for text in _stream_text(_initial_prompt(codebase_map)):
+            yield text
+    except Exception as e:
+        logger.error(f"Error streaming LLM initial diagram: {str(e)}")
+        raise
+
+async def stream_question_diagram(question: str, relevant_docs: List[ProcessedDocument]) -> AsyncIterator[str]:
+    """Yields the question diagram's Mermaid code as the model generates it"""
+    try:
+        async for text in _stream_text(_question_prompt(question, relevant_docs)):
+            yield text
+    except Exception as e:
+        logger.error(f"Error streaming LLM question diagram: {str(e)}")
+        raise
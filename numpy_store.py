@@ -0,0 +1,446 @@
+import os
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote
+import numpy as np
+from embedding_manager import EMBEDDING_DIMENSIONS
+from vector_store import SearchHit, VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Partition for points stored without a repo_id
+UNSCOPED = "_unscoped"
+
+class _RepoIndex:
+    """
+    One repository's points: a float32 matrix of unit vectors in a memory-mapped
+    .npy file, and a SQLite table mapping point IDs to rows with their payloads.
+
+    Rows are only ever appended, so a search never sees a row change under it.
+    Deleted points leave a dead row behind that searches mask out; once dead
+    rows outnumber live ones the matrix is compacted into a new file. Growing,
+    compacting and resizing all write the matrix to a new file named after the
+    next generation, which is recorded in meta in the same transaction as the
+    rows that refer to it. Readers map the file of the generation their read
+    transaction sees, so rows and vectors always match; the superseded file is
+    only unlinked once the new generation has committed. Writes run under
+    SQLite's write lock, so worker processes can share the directory with the app.
+    """
+    initial_capacity = 1024
+
+    def __init__(self, path: Path, dimensions: int):
+        self.path = path
+        self.dimensions = dimensions
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # Autocommit mode; _transaction() and _snapshot() issue BEGIN themselves
+        self._db = sqlite3.connect(self.path / "points.sqlite3", timeout=60,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS points (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                "commit" TEXT,
+                language TEXT,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('rows', 0), ('version', 0), ('generation', 0)")
+        self._vectors: Optional[np.ndarray] = None
+        self._generation: Optional[int] = None
+        # Files replaced by the open write transaction; None outside one
+        self._superseded: Optional[List[Path]] = None
+        self._live: Tuple[int, Optional[np.ndarray]] = (-1, None)
+        self._check_dimensions()
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Write transaction; files superseded inside it are unlinked once it commits"""
+        with self._lock:
+            self._superseded = []
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                self._db.execute("ROLLBACK")
+                # The committed generation is still the one on disk; drop the uncommitted mapping
+                self._vectors = self._generation = None
+                raise
+            else:
+                self._db.execute("COMMIT")
+                for old_path in self._superseded:
+                    old_path.unlink(missing_ok=True)
+            finally:
+                self._superseded = None
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[None]:
+        """Read transaction, so meta, points and the mapped file all belong to one committed state"""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                yield
+            finally:
+                self._db.execute("COMMIT")
+
+    def _meta(self) -> Tuple[int, int]:
+        """(rows in use, including dead ones; version, bumped whenever the set of live rows changes)"""
+        values = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        return values["rows"], values["version"]
+
+    def _set_meta(self, rows: int, version: int) -> None:
+        self._db.executemany("UPDATE meta SET value = ? WHERE key = ?", [(rows, "rows"), (version, "version")])
+
+    def _vectors_path(self, generation: int) -> Path:
+        # Generation 0 keeps the name used before files were versioned
+        return self.path / ("vectors.npy" if generation == 0 else f"vectors-{generation}.npy")
+
+    def _current_generation(self) -> int:
+        return self._db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def _map(self) -> np.ndarray:
+        """
+        The vector file of the generation the current transaction sees. A missing
+        file means nothing was ever stored; inside a write transaction it is created.
+        """
+        generation = self._current_generation()
+        if self._vectors is None or generation != self._generation:
+            path = self._vectors_path(generation)
+            if not path.exists():
+                if generation != 0:
+                    # Unlinked by a writer after this snapshot began; _read() retries
+                    raise FileNotFoundError(f"{path} is missing")
+                if self._superseded is None:
+                    return np.empty((0, self.dimensions), dtype=np.float32)
+                self._write_file(np.empty((0, self.dimensions), dtype=np.float32), self.initial_capacity, path)
+            self._vectors, self._generation = np.load(path, mmap_mode='r+'), generation
+        return self._vectors
+
+    def _swap_in(self, rows: np.ndarray, capacity: int) -> np.ndarray:
+        """
+        Write rows into the file of the next generation and record it in meta;
+        must run inside _transaction(). Returns the new mapping.
+        """
+        generation = self._current_generation()
+        new_path = self._vectors_path(generation + 1)
+        self._write_file(rows, capacity, new_path)
+        self._db.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (generation + 1,))
+        self._superseded.append(self._vectors_path(generation))
+        self._vectors, self._generation = np.load(new_path, mmap_mode='r+'), generation + 1
+        return self._vectors
+
+    def _write_file(self, rows: np.ndarray, capacity: int, path: Path) -> None:
+        """Write rows into a new vector file of the given capacity at path"""
+        tmp_path = path.with_suffix(".tmp.npy")
+        vectors = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                            shape=(max(capacity, len(rows)), self.dimensions))
+        vectors[:len(rows)] = rows
+        vectors.flush()
+        del vectors
+        os.replace(tmp_path, path)
+
+    def _check_dimensions(self) -> None:
+        """Bring stored vectors to the configured dimensionality, by truncation where that is valid"""
+        stored = self._read(lambda: self._map().shape[1])
+        if stored == self.dimensions:
+            return
+        with self._transaction():
+            vectors = self._map()
+            stored = vectors.shape[1]
+            if stored == self.dimensions:
+                return
+            if stored < self.dimensions:
+                raise ValueError(f"{self.path} holds {stored}-dimension vectors but {self.dimensions} are "
+                                 f"configured; re-index the repository or delete the directory")
+            logger.info(f"Truncating {self.path} from {stored} to {self.dimensions} dimensions")
+            truncated = np.array(vectors[:, :self.dimensions])
+            norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+            truncated /= np.where(norms == 0, 1, norms)
+            self._swap_in(truncated, len(truncated))
+
+    def _live_rows(self, rows: int, version: int) -> Optional[np.ndarray]:
+        """Mask of live rows among the first rows, or None when none are dead; cached per version"""
+        cached_version, mask = self._live
+        if cached_version != version:
+            live = np.fromiter((row for (row,) in self._db.execute("SELECT row FROM points")), dtype=np.int64)
+            mask = None
+            if len(live) < rows:
+                mask = np.zeros(rows, dtype=bool)
+                mask[live[live < rows]] = True
+            self._live = (version, mask)
+        return mask
+
+    def _lookup(self, ids: List[str]) -> Dict[str, int]:
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows.update(self._db.execute(
+                f"SELECT id, row FROM points WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return rows
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        with self._transaction():
+            matrix = self._map()
+            used, version = self._meta()
+            rows = used
+            existing = self._lookup(ids)
+            assigned = []
+            for point_id in ids:
+                if point_id not in existing:
+                    existing[point_id] = rows
+                    rows += 1
+                assigned.append(existing[point_id])
+            if rows > len(matrix):
+                matrix = self._swap_in(matrix[:used], max(rows, 2 * len(matrix), self.initial_capacity))
+            matrix[assigned] = vectors
+            matrix.flush()
+            self._db.executemany(
+                'INSERT OR REPLACE INTO points (id, row, "commit", language, payload) VALUES (?, ?, ?, ?, ?)',
+                [
+                    (point_id, row, payload.get("commit"), payload.get("language"), json.dumps(payload))
+                    for point_id, row, payload in zip(ids, assigned, payloads)
+                ]
+            )
+            self._set_meta(rows, version + 1)
+
+    def delete(self, ids: List[str]) -> int:
+        with self._transaction():
+            deleted = 0
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                deleted += self._db.execute(
+                    f"DELETE FROM points WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).rowcount
+            if not deleted:
+                return 0
+            rows, version = self._meta()
+            live = self._db.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+            if rows - live > max(live, self.initial_capacity):
+                self._compact(rows, version)
+            else:
+                self._set_meta(rows, version + 1)
+            return deleted
+
+    def _compact(self, rows: int, version: int) -> None:
+        """Rewrite the matrix with live rows only, as a new generation committed with the renumbered rows"""
+        matrix = self._map()
+        live = self._db.execute("SELECT id, row FROM points ORDER BY row").fetchall()
+        self._swap_in(matrix[[row for _, row in live]], max(len(live) * 2, self.initial_capacity))
+        # Shift rows past the end first, so the UNIQUE constraint holds while renumbering
+        self._db.execute("UPDATE points SET row = row + ?", (rows,))
+        self._db.executemany("UPDATE points SET row = ? WHERE id = ?",
+                             [(new_row, point_id) for new_row, (point_id, _) in enumerate(live)])
+        self._set_meta(len(live), version + 1)
+        logger.info(f"Compacted {self.path}: {rows} rows to {len(live)}")
+
+    def set_payload(self, ids: List[str], payload: Dict[str, Any]) -> None:
+        with self._transaction():
+            for point_id in ids:
+                stored = self._db.execute("SELECT payload FROM points WHERE id = ?", (point_id,)).fetchone()
+                if stored is None:
+                    continue
+                merged = {**json.loads(stored[0]), **payload}
+                self._db.execute(
+                    'UPDATE points SET payload = ?, "commit" = ?, language = ? WHERE id = ?',
+                    (json.dumps(merged), merged.get("commit"), merged.get("language"), point_id)
+                )
+
+    def set_all_payload(self, payload: Dict[str, Any]) -> None:
+        """Merge payload into every point's payload, leaving points that already carry it untouched"""
+        merged = "json_set(payload, " + ", ".join(f"'$.{key}', ?" for key in payload) + ")"
+        assignments = [f"payload = {merged}"]
+        params = list(payload.values())
+        for column in ("commit", "language"):
+            if column in payload:
+                assignments.append(f'"{column}" = ?')
+                params.append(payload[column])
+        with self._transaction():
+            self._db.execute(
+                f"UPDATE points SET {', '.join(assignments)} WHERE payload != {merged}",
+                params + list(payload.values())
+            )
+
+    def _filtered_rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        clauses, params = [], []
+        for key, value in filters.items():
+            if key in ("commit", "language"):
+                clauses.append(f'"{key}" = ?')
+            else:
+                clauses.append(f"json_extract(payload, '$.{key}') = ?")
+            params.append(value)
+        query = f"SELECT row FROM points WHERE {' AND '.join(clauses)}"
+        return np.fromiter((row for (row,) in self._db.execute(query, params)), dtype=np.int64)
+
+    def _read(self, func, *args):
+        """Run func in a read snapshot, retrying when a writer unlinked the file the snapshot named"""
+        for attempt in range(3):
+            try:
+                with self._snapshot():
+                    return func(*args)
+            except FileNotFoundError:
+                self._vectors = self._generation = None
+                if attempt == 2:
+                    raise
+
+    def search(self, query: np.ndarray, top_k: int, filters: Dict[str, Any]) -> List[SearchHit]:
+        return self._read(self._search, query, top_k, filters)
+
+    def _search(self, query: np.ndarray, top_k: int, filters: Dict[str, Any]) -> List[SearchHit]:
+        rows, version = self._meta()
+        if rows == 0:
+            return []
+        matrix = self._map()
+        if filters:
+            candidates = self._filtered_rows(filters)
+            candidates = candidates[candidates < rows]
+            scores = matrix[candidates] @ query
+        else:
+            candidates = None
+            scores = matrix[:rows] @ query
+            live = self._live_rows(rows, version)
+            if live is not None:
+                scores[~live] = -np.inf
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        top_rows = candidates[top] if candidates is not None else top
+        stored = {
+            row: (point_id, payload)
+            for point_id, row, payload in self._db.execute(
+                f"SELECT id, row, payload FROM points WHERE row IN ({','.join('?' * len(top_rows))})",
+                [int(row) for row in top_rows]
+            )
+        }
+        return [
+            SearchHit(id=stored[row][0], score=float(score), payload=json.loads(stored[row][1]),
+                      vector=np.array(matrix[row]))
+            for row, score in zip(top_rows.tolist(), scores[top].tolist()) if row in stored
+        ]
+
+    def _scroll_batch(self, last_row: int, batch_size: int) -> List[Tuple[int, SearchHit]]:
+        matrix = self._map()
+        return [
+            (row, SearchHit(id=point_id, score=0.0, payload=json.loads(payload), vector=np.array(matrix[row])))
+            for point_id, row, payload in self._db.execute(
+                "SELECT id, row, payload FROM points WHERE row > ? ORDER BY row LIMIT ?", (last_row, batch_size)
+            ).fetchall()
+        ]
+
+    def scroll(self, batch_size: int) -> Iterator[List[SearchHit]]:
+        last_row = -1
+        while True:
+            batch = self._read(self._scroll_batch, last_row, batch_size)
+            if not batch:
+                return
+            last_row = batch[-1][0]
+            yield [hit for _, hit in batch]
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store: one memory-mapped float32 matrix per repository
+    under VECTOR_STORE_DIR, searched with a single matrix-vector product and
+    argpartition for the top k. Repositories are opened on first use, and only
+    the pages a search touches are read from disk. With no network hop, search
+    time is the scan itself, which suits small and medium repositories; no
+    vector database service is needed.
+    """
+    def __init__(self, root_dir: Optional[str] = None, dimensions: Optional[int] = None):
+        self.root_dir = Path(root_dir or os.getenv("VECTOR_STORE_DIR", ".cache/vectors"))
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.dimensions = dimensions or EMBEDDING_DIMENSIONS
+        self._repos: Dict[str, _RepoIndex] = {}
+        self._lock = threading.Lock()
+
+    def _repo(self, repo_id: Optional[str], create: bool = True) -> Optional[_RepoIndex]:
+        repo_id = repo_id or UNSCOPED
+        with self._lock:
+            index = self._repos.get(repo_id)
+            if index is None:
+                path = self.root_dir / quote(repo_id, safe='')
+                if not create and not path.exists():
+                    return None
+                index = self._repos[repo_id] = _RepoIndex(path, self.dimensions)
+            return index
+
+    def _all_repos(self) -> List[_RepoIndex]:
+        return [self._repo(unquote(path.name)) for path in sorted(self.root_dir.iterdir()) if path.is_dir()]
+
+    def _normalize(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        if not ids:
+            return
+        matrix = self._normalize(vectors)
+        by_repo: Dict[Optional[str], List[int]] = {}
+        for i, payload in enumerate(payloads):
+            by_repo.setdefault(payload.get("repo_id"), []).append(i)
+        for repo_id, positions in by_repo.items():
+            self._repo(repo_id).upsert([ids[i] for i in positions], matrix[positions], [payloads[i] for i in positions])
+
+    def delete(self, ids: List[str], repo_id: Optional[str] = None) -> None:
+        indexes = [self._repo(repo_id, create=False)] if repo_id else self._all_repos()
+        for index in indexes:
+            if index is not None:
+                index.delete(ids)
+
+    def set_payload(self, ids: List[str], payload: Dict[str, Any], repo_id: Optional[str] = None) -> None:
+        indexes = [self._repo(repo_id, create=False)] if repo_id else self._all_repos()
+        for index in indexes:
+            if index is not None:
+                index.set_payload(ids, payload)
+
+    def set_repo_payload(self, repo_id: str, payload: Dict[str, Any]) -> None:
+        index = self._repo(repo_id, create=False)
+        if index is not None:
+            index.set_all_payload(payload)
+
+    def search(self, vector: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        filters = dict(filters or {})
+        query = self._normalize(vector)[0]
+        if "repo_id" in filters:
+            index = self._repo(filters.pop("repo_id"), create=False)
+            return index.search(query, top_k, filters) if index is not None else []
+        hits = [hit for index in self._all_repos() for hit in index.search(query, top_k, filters)]
+        return sorted(hits, key=lambda hit: hit.score, reverse=True)[:top_k]
+
+    def scroll(self, batch_size: int = 100) -> Iterator[List[SearchHit]]:
+        for index in self._all_repos():
+            yield from index.scroll(batch_size)
+
+    def reset(self) -> None:
+        with self._lock:
+            for index in self._repos.values():
+                index.close()
+            self._repos.clear()
+            shutil.rmtree(self.root_dir, ignore_errors=True)
+            self.root_dir.mkdir(parents=True, exist_ok=True)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"vector_store": {"backend": "numpy", "open_repos": len(self._repos)}}
+
+    def close(self) -> None:
+        with self._lock:
+            for index in self._repos.values():
+                index.close()
+            self._repos.clear()
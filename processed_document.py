@@ -1,13 +1,18 @@
 import ast
 from typing import Any, Optional, Dict, List
+import numpy as np
 
 class ProcessedDocument:
     """
     A class representing a processed document with content. A document object contains a chunk of code from a file. 
     """
-    def __init__(self, content: str, file_name: str, file_size: int, timestamp: Optional[str] = None, original_file: Optional[str] = None, chunk_metadata: Optional[Dict] = None, embedding: Optional[List[float]] = None):
+    # No per-instance __dict__
+    __slots__ = ("content", "file_name", "file_size", "timestamp", "original_file", "embedding", "chunk_metadata")
+
+    def __init__(self, content: str, file_name: str, file_size: int, timestamp: Optional[str] = None, original_file: Optional[str] = None, chunk_metadata: Optional[Dict] = None, embedding: Optional[np.ndarray] = None):
         """
         Initialize the ProcessedDocument with the given content.
+        :param embedding: float32 vector, usually a row view into the EmbeddingBatch of its batch
         """
         self.content = content
         self.file_name = file_name
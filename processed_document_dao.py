@@ -1,55 +1,159 @@
 import os
 import logging
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 import numpy as np
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from qdrant_client.models import PointStruct
+from embedding_batch import EmbeddingBatch
+from lexical_index import LexicalIndex, names_defined_symbol
 from processed_document import ProcessedDocument
+from vector_store import INDEXED_PAYLOAD_FIELDS, SearchHit, VectorStore, create_vector_store
 import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
+from utils.concurrency import run_blocking
+from utils.pg_copy import copy_rows
+from utils.pg_pool import PostgresPool
 
 logger = logging.getLogger(__name__)
 
+# Namespace for content-derived point IDs, so re-indexing the same chunk is an idempotent upsert
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-3b5d-5e8f-9a0b-1c2d3e4f5a6b")
+
+# processed_documents columns written by batch_save, in COPY order
+PG_COLUMNS = ("point_id", "repo_id", "content", "file_name", "file_size", "timestamp", "original_file", "embedding")
+
+def point_id_for(repo_id: str, file_name: str, chunk_hash: str) -> str:
+    """Deterministic point ID for a chunk of a file in a repository"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{repo_id}\0{file_name}\0{chunk_hash}"))
+
+def document_point_id(doc: ProcessedDocument) -> str:
+    """Point ID for a document, falling back to a random one when it carries no content hash"""
+    metadata = doc.chunk_metadata or {}
+    if metadata.get("repo_id") and metadata.get("content_hash"):
+        return point_id_for(metadata["repo_id"], doc.original_file or doc.file_name, metadata["content_hash"])
+    return str(uuid.uuid4())
+
+def copy_processed_documents(cur, point_ids: List[str], documents: List[ProcessedDocument],
+                             table: str = "processed_documents", batch_size: int = 5000) -> None:
+    """
+    Upsert rows by binary COPY into a staging table, a bounded batch at a time,
+    then one INSERT ... ON CONFLICT; all inside the caller's transaction
+    """
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table}_staging "
+                f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    copy_rows(cur, f"{table}_staging", list(PG_COLUMNS), (
+        (
+            point_id,
+            (doc.chunk_metadata or {}).get("repo_id"),
+            doc.content,
+            doc.file_name,
+            doc.file_size,
+            doc.timestamp,
+            doc.original_file,
+            doc.embedding
+        )
+        for point_id, doc in zip(point_ids, documents)
+    ), batch_size=batch_size)
+    columns = ", ".join(f'"{column}"' for column in PG_COLUMNS)
+    # DISTINCT ON: one upsert may not touch the same row twice
+    cur.execute(f"""
+        INSERT INTO {table} ({columns})
+        SELECT DISTINCT ON (point_id) {columns} FROM {table}_staging
+        ON CONFLICT (point_id) DO UPDATE SET
+            content = EXCLUDED.content,
+            file_size = EXCLUDED.file_size,
+            timestamp = EXCLUDED.timestamp,
+            embedding = EXCLUDED.embedding
+    """)
+    cur.execute(f"TRUNCATE {table}_staging")
+
 class ProcessedDocumentDAO:
     #embedder is optional, because document will already have embeddings
-    def __init__(self, embedder: Optional[object] = None):
+    def __init__(self, embedder: Optional[object] = None, pg_pool: Optional[PostgresPool] = None,
+                 client: Optional[object] = None, collection_config: Optional[object] = None,
+                 vector_store: Optional[VectorStore] = None, lexical_index: Optional[LexicalIndex] = None):
         """
-        Initialize Qdrant client with optional embedder
+        Initialize the vector store and Postgres connections with optional embedder
         :param embedder: Object with embed_texts() method
+        :param pg_pool: Shared Postgres pool; one is created (and owned) when omitted
+        :param client: Shared Qdrant client for the Qdrant backend; one is created (and owned) when omitted
+        :param collection_config: Quantization, on-disk and HNSW settings for the Qdrant backend
+        :param vector_store: Where vectors are stored and searched; chosen by VECTOR_STORE when omitted
+        :param lexical_index: BM25 index searched alongside the vectors; opened at LEXICAL_INDEX_PATH when omitted
         """
         self.embedder = embedder
-        # Initialize both Qdrant and Postgres connections
-        self.client = QdrantClient(
-            url=os.getenv("QDRANT_URL", "http://localhost:6333"),
-            #api key needed during production environment
-            api_key=os.getenv("QDRANT_API_KEY")
-        )
-        self.pg_conn = psycopg2.connect(
-            dbname=os.getenv("POSTGRES_DB"),
-            user=os.getenv("POSTGRES_USER"),
-            password=os.getenv("POSTGRES_PASSWORD"),
-            host=os.getenv("POSTGRES_HOST", "localhost")
+        self.pg_batch_size = int(os.getenv("PG_COPY_BATCH_SIZE", "5000"))
+        self._owns_pool = pg_pool is None
+        self.pg_pool = pg_pool or PostgresPool.from_env()
+        self._initialize_schema()
+        self._owns_store = vector_store is None
+        self.vector_store = vector_store or create_vector_store(
+            embedder=embedder, pg_pool=self.pg_pool, client=client, collection_config=collection_config
         )
-        self.collection_name = "code_embeddings"
-        self._initialize_collection()
+        self._owns_lexical_index = lexical_index is None
+        self.lexical_index = lexical_index or LexicalIndex()
+        # Weight of the vector score in hybrid search; the BM25 score gets the rest
+        self.hybrid_alpha = float(os.getenv("HYBRID_ALPHA", "0.5"))
+        self.hybrid_fast_path = os.getenv("HYBRID_FAST_PATH", "true").lower() == "true"
 
-    def _initialize_collection(self):
-        """Create collection if it doesn't exist"""
-        try:
-            self.client.get_collection(self.collection_name)
-        except Exception:
-            self.client.recreate_collection(
-                collection_name=self.collection_name,
-                vectors_config=models.VectorParams(
-                    size=1536,  # OpenAI text-embedding-3-small dimension
-                    distance=models.Distance.COSINE
-                )
-            )
+    def metrics(self) -> dict:
+        return {"postgres_pool": self.pg_pool.metrics(), **self.vector_store.metrics()}
+
+    def close(self) -> None:
+        """Release the connections this DAO created"""
+        if self._owns_pool:
+            self.pg_pool.close()
+        if self._owns_store:
+            self.vector_store.close()
+        if self._owns_lexical_index:
+            self.lexical_index.close()
+
+    async def aclose(self) -> None:
+        """close() plus the vector store's async connections"""
+        if self._owns_pool:
+            self.pg_pool.close()
+        if self._owns_store:
+            await self.vector_store.aclose()
+        if self._owns_lexical_index:
+            self.lexical_index.close()
+
+    def _initialize_schema(self):
+        """
+        Add the columns needed for idempotent upserts to processed_documents, and
+        store embeddings as pgvector vectors (4 bytes per component), or as real[]
+        where the vector extension is not available
+        """
+        with self.pg_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", ("processed_documents",))
+            cur.execute("""
+                ALTER TABLE processed_documents
+                    ADD COLUMN IF NOT EXISTS point_id UUID,
+                    ADD COLUMN IF NOT EXISTS repo_id TEXT
+            """)
+            cur.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS processed_documents_point_id_idx
+                ON processed_documents (point_id)
+            """)
+            cur.execute("SAVEPOINT vector_extension")
+            try:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                embedding_type = "vector"
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT vector_extension")
+                logger.warning(f"pgvector unavailable, storing embeddings as real[]: {str(e)}")
+                embedding_type = "real[]"
+            cur.execute("""
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = 'processed_documents'::regclass AND attname = 'embedding'
+            """)
+            current_type = cur.fetchone()[0]
+            # Unsized vector, so a change of EMBEDDING_DIMENSIONS needs no schema change
+            if current_type != embedding_type:
+                logger.info(f"Converting processed_documents.embedding from {current_type} to {embedding_type}")
+                cur.execute(f"""
+                    ALTER TABLE processed_documents
+                    ALTER COLUMN embedding TYPE {embedding_type} USING embedding::{embedding_type}
+                """)
 
     def batch_save(self, documents: List[ProcessedDocument]):
-        """Store documents in both Qdrant and PostgreSQL"""
+        """Store documents in PostgreSQL, the vector store and the lexical index"""
         try:
             # Generate embeddings if not present
             if self.embedder and any(doc.embedding is None for doc in documents):
@@ -58,123 +162,179 @@ class ProcessedDocumentDAO:
                 for doc, emb in zip(documents, embeddings):
                     doc.embedding = emb
 
+            point_ids = [document_point_id(doc) for doc in documents]
+
             # Save to PostgreSQL
-            with self.pg_conn.cursor() as cur:
-                execute_batch(cur, """
-                    INSERT INTO processed_documents 
-                    (content, file_name, file_size, timestamp, original_file, embedding)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, [
-                    (
-                        doc.content,
-                        doc.file_name,
-                        doc.file_size,
-                        doc.timestamp,
-                        doc.original_file,
-                        doc.embedding.tolist() if doc.embedding is not None else None
-                    )
-                    for doc in documents
-                ])
-            self.pg_conn.commit()
+            with self.pg_pool.connection() as conn, conn.cursor() as cur:
+                copy_processed_documents(cur, point_ids, documents, batch_size=self.pg_batch_size)
             logger.info(f"Inserted {len(documents)} documents into PostgreSQL")
 
-            # Save to Qdrant (keeping vector search capability)
-            points = [
-                PointStruct(
-                    id=str(uuid.uuid4()),
-                    vector=doc.embedding.tolist(),
-                    payload={
-                        "content": doc.content,
-                        "file_name": doc.file_name,
-                        "original_file": doc.original_file
+            # Save to the vector store (keeping vector search capability)
+            stored = [(point_id, doc) for point_id, doc in zip(point_ids, documents) if doc.embedding is not None]
+            payloads = [
+                {
+                    "content": doc.content,
+                    "file_name": doc.file_name,
+                    "original_file": doc.original_file,
+                    **{
+                        field: (doc.chunk_metadata or {}).get(field)
+                        for field in INDEXED_PAYLOAD_FIELDS
                     }
-                ) for doc in documents if doc.embedding is not None
+                } for _, doc in stored
             ]
-            
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
+            # Documents embedded together are rows of one matrix, which is passed on without copying
+            vectors = EmbeddingBatch.from_vectors([doc.embedding for _, doc in stored])
+            self.vector_store.upsert([point_id for point_id, _ in stored], vectors.matrix, payloads)
+            logger.info(f"Inserted {len(stored)} documents into the vector store")
+
+            self.lexical_index.add(
+                [point_id for point_id, _ in stored],
+                payloads,
+                [(doc.chunk_metadata or {}).get("symbols", []) for _, doc in stored]
             )
-            logger.info(f"Inserted {len(points)} documents into Qdrant")
-            
+
         except Exception as e:
             logger.error(f"Batch save failed: {str(e)}")
             raise
 
-    def search(self, query: str, top_k: int = 5, **filters) -> List[ProcessedDocument]:
-        """Search similar documents with optional filters"""
+    def delete_points(self, point_ids: List[str], repo_id: Optional[str] = None) -> None:
+        """Delete points by ID from both the vector store and PostgreSQL"""
+        if not point_ids:
+            return
         try:
-            # Generate query embedding
-            query_embedding = self.embedder.embed_texts([query])[0]
-            
-            # Build Qdrant filter
-            qdrant_filter = self._build_filter(filters) if filters else None
-            
-            # Execute search
-            results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding.tolist(),
-                query_filter=qdrant_filter,
-                limit=top_k
+            self.vector_store.delete(point_ids, repo_id=repo_id)
+            self.lexical_index.delete(point_ids)
+            with self.pg_pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM processed_documents WHERE point_id = ANY(%s::uuid[])",
+                    (point_ids,)
+                )
+            logger.info(f"Deleted {len(point_ids)} stale documents")
+        except Exception as e:
+            logger.error(f"Delete failed: {str(e)}")
+            raise
+
+    def tag_points(self, repo_id: str, commit: Optional[str], point_ids_by_language: Dict[str, List[str]],
+                   batch_size: int = 1000, backfill_lexical_index: bool = False) -> None:
+        """
+        Stamp repo_id, commit and language on existing points. Chunks that did not
+        change between commits are never re-upserted, so this keeps their payload
+        pointing at the commit that was indexed.
+        :param backfill_lexical_index: Add points the lexical index does not know yet (indexed
+            before it existed) from PostgreSQL; only needed while it has nothing for the repository
+        """
+        for language, point_ids in point_ids_by_language.items():
+            for start in range(0, len(point_ids), batch_size):
+                batch = point_ids[start:start + batch_size]
+                payload = {"repo_id": repo_id, "commit": commit, "language": language}
+                self.vector_store.set_payload(batch, payload, repo_id=repo_id)
+                if backfill_lexical_index:
+                    self._backfill_lexical_index(self.lexical_index.missing(batch), payload)
+        self.lexical_index.set_repo_payload(repo_id, {"commit": commit})
+
+    def tag_repo(self, repo_id: str, commit: Optional[str]) -> None:
+        """
+        Stamp commit on every point of a repository with one filtered update, for
+        runs where the carried points already have their repo_id and language
+        """
+        self.vector_store.set_repo_payload(repo_id, {"commit": commit})
+        self.lexical_index.set_repo_payload(repo_id, {"commit": commit})
+
+    def _backfill_lexical_index(self, point_ids: List[str], payload: Dict) -> None:
+        """Index stored chunks by content alone; their symbols come back on the next re-chunk"""
+        if not point_ids:
+            return
+        with self.pg_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT point_id, content, file_name, original_file FROM processed_documents "
+                "WHERE point_id = ANY(%s::uuid[])",
+                (point_ids,)
             )
-            
+            rows = cur.fetchall()
+        self.lexical_index.add(
+            [str(point_id) for point_id, _, _, _ in rows],
+            [
+                {"content": content, "file_name": file_name, "original_file": original_file, **payload}
+                for _, content, file_name, original_file in rows
+            ],
+            [[] for _ in rows]
+        )
+        logger.info(f"Added {len(rows)} existing documents to the lexical index")
+
+    def search(self, query: str, top_k: int = 5, query_vector: Optional[np.ndarray] = None, **filters) -> List[ProcessedDocument]:
+        """Search similar documents with optional filters, reusing query_vector when already embedded"""
+        try:
+            # Generate query embedding
+            query_embedding = query_vector if query_vector is not None else self.embedder.embed_texts([query])[0]
+            results = self.vector_store.search(np.asarray(query_embedding), top_k, filters)
             return self._convert_to_processed_docs(results)
             
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
             return []
 
-    def _build_filter(self, filter_dict: dict) -> models.Filter:
-        """Convert filter dict to Qdrant Filter"""
-        return models.Filter(
-            must=[
-                models.FieldCondition(
-                    key=key,
-                    match=models.MatchValue(value=value)
-                ) for key, value in filter_dict.items()
-            ]
-        )
+    async def hybrid_search_async(self, query: str, embed: Callable[[], Awaitable[np.ndarray]], top_k: int = 5,
+                                  **filters) -> List[ProcessedDocument]:
+        """
+        Fuse BM25 and vector search. Each side's candidates are min-max
+        normalised and combined as hybrid_alpha * vector + (1 - hybrid_alpha) * BM25.
+        When the question names an identifier that a top BM25 hit defines, those
+        hits are returned without embedding the question at all.
+        :param embed: Returns the question's embedding; only awaited when the vector side is needed
+        """
+        candidates = top_k * 4
+        try:
+            lexical_hits = await run_blocking(self.lexical_index.search, query, candidates, filters)
+        except Exception as e:
+            logger.error(f"Lexical search failed: {str(e)}")
+            lexical_hits = []
+        if self.hybrid_fast_path and names_defined_symbol(query, lexical_hits[:top_k]):
+            logger.info(f"Answered from the lexical index: {query!r}")
+            return self._convert_to_processed_docs(lexical_hits[:top_k])
 
-    def _convert_to_processed_docs(self, results) -> List[ProcessedDocument]:
-        """Convert Qdrant results to ProcessedDocument objects"""
+        try:
+            vector_hits = await self.vector_store.search_async(np.asarray(await embed()), candidates, filters)
+        except Exception as e:
+            logger.error(f"Search failed: {str(e)}")
+            vector_hits = []
+
+        scores: Dict[str, float] = {}
+        hits: Dict[str, SearchHit] = {}
+        for weight, side in ((self.hybrid_alpha, vector_hits), (1.0 - self.hybrid_alpha, lexical_hits)):
+            if not side:
+                continue
+            low = min(hit.score for hit in side)
+            spread = max(hit.score for hit in side) - low
+            for hit in side:
+                normalised = (hit.score - low) / spread if spread > 0 else 1.0
+                scores[hit.id] = scores.get(hit.id, 0.0) + weight * normalised
+                # Vector hits come first, so a point found by both keeps its vector
+                hits.setdefault(hit.id, hit)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return self._convert_to_processed_docs([hits[point_id] for point_id in ranked])
+
+    def _convert_to_processed_docs(self, results: List[SearchHit]) -> List[ProcessedDocument]:
+        """Convert vector store hits to ProcessedDocument objects"""
         return [
             ProcessedDocument(
                 content=hit.payload["content"],
                 file_name=hit.payload["file_name"],
                 file_size=len(hit.payload["content"]),
-                timestamp="",  # Qdrant doesn't store timestamps
+                timestamp="",  # The vector store doesn't keep timestamps
                 original_file=hit.payload["original_file"],
-                embedding=np.array(hit.vector)
+                embedding=np.array(hit.vector),
+                chunk_metadata={
+                    field: hit.payload[field] for field in INDEXED_PAYLOAD_FIELDS if field in hit.payload
+                }
             ) for hit in results
         ]
 
     def get_all_documents(self, batch_size: int = 100) -> List[ProcessedDocument]:
-        """Fetch all documents from the collection using pagination"""
+        """Fetch all documents from the vector store using pagination"""
         try:
             all_documents = []
-            offset = None
-            
-            while True:
-                results = self.client.scroll(
-                    collection_name=self.collection_name,
-                    limit=batch_size,
-                    offset=offset
-                )
-                
-                # Break if no more results
-                if not results[0]:
-                    break
-                    
-                # Convert to ProcessedDocument objects
-                documents = self._convert_to_processed_docs(results[0])
-                all_documents.extend(documents)
-                
-                # Update offset for next batch
-                offset = results[1]
-                
-                if offset is None:  # No more records
-                    break
-                    
+            for hits in self.vector_store.scroll(batch_size):
+                all_documents.extend(self._convert_to_processed_docs(hits))
             logger.info(f"Retrieved {len(all_documents)} documents")
             return all_documents
             
@@ -183,16 +343,10 @@ class ProcessedDocumentDAO:
             return []
 
     def delete_all_documents(self) -> bool:
-        """Delete all documents from the collection"""
+        """Delete all documents from the vector store and the lexical index"""
         try:
-            # Recreate the collection (faster than deleting all points)
-            self.client.recreate_collection(
-                collection_name=self.collection_name,
-                vectors_config=models.VectorParams(
-                    size=1536,  # OpenAI text-embedding-3-small dimension
-                    distance=models.Distance.COSINE
-                )
-            )
+            self.vector_store.reset()
+            self.lexical_index.reset()
             logger.info("All documents deleted successfully")
             return True
             
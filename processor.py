@@ -1,11 +1,15 @@
+import logging
 from abc import ABC, abstractmethod
 from typing import List, Optional
 from processed_document import ProcessedDocument
 from raw_document import RawDocument
 from datetime import datetime
 from embedding_manager import OpenAIEmbedder
+from embedding_job import EmbeddingJobError
 from processed_document_dao import ProcessedDocumentDAO
 
+logger = logging.getLogger(__name__)
+
 class BaseProcessor(ABC):
     """
     Base class for all processors.
@@ -20,10 +24,11 @@ class BaseProcessor(ABC):
         pass
 
 class GitHubProcessor(BaseProcessor):
-    def __init__(self, embedder=None):
+    def __init__(self, embedder=None, processed_document_dao: Optional[ProcessedDocumentDAO] = None):
         # Initialize with any embedder that has embed_texts() method
         self.embedder = embedder or OpenAIEmbedder()
-        self.processed_document_dao = ProcessedDocumentDAO(embedder=self.embedder)
+        # Reuse the app's DAO (and its connection pools) when given one
+        self.processed_document_dao = processed_document_dao or ProcessedDocumentDAO(embedder=self.embedder)
 
     def process(self, raw_documents: List[RawDocument], save_to_db: bool = True) -> List[ProcessedDocument]:
         # Convert raw to processed docs (1:1 mapping)
@@ -41,7 +46,21 @@ class GitHubProcessor(BaseProcessor):
 
         # Generate embeddings for all documents
         texts = [doc.content for doc in processed_docs]
-        embeddings = self.embedder.embed_texts(texts)
+        try:
+            embeddings = self.embedder.embed_texts(texts)
+        except EmbeddingJobError as e:
+            # Keep what was embedded; the checkpoint lets a rerun fetch only the rest
+            embedded_docs = []
+            for doc, embedding in zip(processed_docs, e.embeddings):
+                if embedding is not None:
+                    doc.embedding = embedding
+                    embedded_docs.append(doc)
+            missing_files = sorted({processed_docs[i].original_file or processed_docs[i].file_name for i in e.missing})
+            logger.error(f"{len(e.missing)} chunks still missing embeddings in {len(missing_files)} files: "
+                         f"{', '.join(missing_files[:20])}")
+            if save_to_db and embedded_docs:
+                self.processed_document_dao.batch_save(embedded_docs)
+            raise
         
         # Assign embeddings to processed documents
         for doc, embedding in zip(processed_docs, embeddings):
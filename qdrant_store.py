@@ -0,0 +1,282 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+from collection_config import CollectionConfig
+from embedding_migration import DimensionMigration, DimensionMigrationError
+from utils.pg_pool import PostgresPool
+from vector_store import INDEXED_PAYLOAD_FIELDS, SearchHit, VectorStore
+
+logger = logging.getLogger(__name__)
+
+class QdrantVectorStore(VectorStore):
+    """Points in the code_embeddings Qdrant collection"""
+    def __init__(self, embedder: Optional[object], pg_pool: PostgresPool, client: Optional[QdrantClient] = None,
+                 collection_config: Optional[CollectionConfig] = None, check_dimensions: bool = True):
+        """
+        :param embedder: Used to re-embed stored chunks when the dimensionality changes
+        :param pg_pool: Postgres pool, for the setup lock and for rewriting embeddings during a migration
+        :param client: Shared Qdrant client; one is created (and owned) when omitted
+        :param collection_config: Quantization, on-disk and HNSW settings; read from the environment when omitted
+        :param check_dimensions: Refuse to start when the collection holds vectors of another size;
+            only the embedding_migration command, which fixes that, turns this off
+        """
+        self.embedder = embedder
+        self.pg_pool = pg_pool
+        self.collection_config = collection_config or CollectionConfig.from_env()
+        # The collection is always sized for the vectors the embedder produces
+        if getattr(embedder, 'dimensions', None):
+            self.collection_config.size = embedder.dimensions
+        self.upsert_batch_size = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+        self.upsert_parallel = int(os.getenv("QDRANT_UPSERT_PARALLEL", "4"))
+        qdrant_settings = dict(
+            url=os.getenv("QDRANT_URL", "http://localhost:6333"),
+            #api key needed during production environment
+            api_key=os.getenv("QDRANT_API_KEY"),
+            grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+            prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+        )
+        self._owns_client = client is None
+        self.client = client or QdrantClient(**qdrant_settings)
+        # Created by the first search_async, so workers and the migration command never open one
+        self._qdrant_settings = qdrant_settings
+        self._async_client: Optional[AsyncQdrantClient] = None
+        self.collection_name = "code_embeddings"
+        self._initialize_collection(check_dimensions)
+
+    @property
+    def async_client(self) -> AsyncQdrantClient:
+        if self._async_client is None:
+            self._async_client = AsyncQdrantClient(**self._qdrant_settings)
+        return self._async_client
+
+    def close(self) -> None:
+        if self._owns_client:
+            self.client.close()
+        if self._async_client is not None:
+            async_client, self._async_client = self._async_client, None
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                asyncio.run(async_client.close())
+            else:
+                # Inside an event loop the caller should have used aclose(); close it in the background
+                asyncio.ensure_future(async_client.close())
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            self.client.close()
+        if self._async_client is not None:
+            async_client, self._async_client = self._async_client, None
+            await async_client.close()
+
+    def _physical_collection(self) -> Optional[str]:
+        """
+        Collection behind the code_embeddings alias, or code_embeddings itself
+        for a collection created before aliases were used; None if neither exists
+        """
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == self.collection_name:
+                return alias.collection_name
+        if self.client.collection_exists(self.collection_name):
+            return self.collection_name
+        return None
+
+    def _initialize_collection(self, check_dimensions: bool = True):
+        """
+        Create the collection if it doesn't exist and apply the configured storage
+        and index settings. Collections are named after their dimensionality and
+        reached through the code_embeddings alias. A collection holding vectors
+        of another size is left alone: migrating it re-embeds or rewrites every
+        point, so it is done by the embedding_migration command, not at startup.
+        An advisory lock keeps the app and workers from initializing at the same time.
+        """
+        size = self.collection_config.size
+        target = f"{self.collection_name}_{size}d"
+        with self.pg_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.collection_name,))
+            current = self._physical_collection()
+            if current is None and self.client.collection_exists(target):
+                # Left without an alias by a migration interrupted during the switch
+                logger.warning(f"Restoring the {self.collection_name} alias to {target}")
+                self._create_alias(target)
+                current = target
+            if current is None:
+                self.client.create_collection(collection_name=target, **self.collection_config.create_kwargs())
+                self._create_alias(target)
+                current = target
+            else:
+                current_size = self.client.get_collection(current).config.params.vectors.size
+                if current_size != size:
+                    message = (f"Collection {current} holds {current_size}-dimension vectors but {size} are "
+                               f"configured; run `python embedding_migration.py` to migrate it")
+                    if check_dimensions:
+                        raise DimensionMigrationError(message)
+                    logger.warning(message)
+                    return
+                try:
+                    self.client.update_collection(
+                        collection_name=current,
+                        **self.collection_config.update_kwargs()
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not update collection settings: {str(e)}")
+            self._initialize_payload_indexes(current)
+
+    def _create_alias(self, collection_name: str) -> None:
+        self.client.update_collection_aliases(change_aliases_operations=[
+            models.CreateAliasOperation(
+                create_alias=models.CreateAlias(collection_name=collection_name, alias_name=self.collection_name)
+            )
+        ])
+
+    def migrate_dimensions(self, strategy: Optional[str] = None, batch_size: int = 256) -> int:
+        """
+        Move the collection to the configured dimensionality, for the
+        embedding_migration command. Returns the number of points migrated.
+        Searches keep using the old collection until the final alias switch.
+        """
+        size = self.collection_config.size
+        current = self._physical_collection()
+        if current is None:
+            return 0
+        current_size = self.client.get_collection(current).config.params.vectors.size
+        if current_size == size:
+            logger.info(f"{current} already holds {size}-dimension vectors")
+            return 0
+        with self.pg_pool.connection() as conn, conn.cursor() as cur:
+            # Session lock without an open transaction, so only one migration runs at a time
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"{self.collection_name}:migration",))
+            if not cur.fetchone()[0]:
+                raise DimensionMigrationError("Another dimension migration is running")
+            conn.commit()
+            try:
+                return DimensionMigration(self, source=current, source_size=current_size,
+                                          target=f"{self.collection_name}_{size}d",
+                                          batch_size=batch_size, strategy=strategy).run()
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f"{self.collection_name}:migration",))
+
+    def _initialize_payload_indexes(self, collection_name: str):
+        """Keyword indexes on the fields searches are scoped by; creating an existing index is a no-op"""
+        for field_name in INDEXED_PAYLOAD_FIELDS:
+            if field_name == "repo_id":
+                # Nearly every search targets one repository, so points are laid out per tenant
+                field_schema = models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+            else:
+                field_schema = models.PayloadSchemaType.KEYWORD
+            try:
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+            except Exception as e:
+                logger.warning(f"Could not create payload index on {field_name}: {str(e)}")
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        """
+        Upsert in bounded batches, several in flight at once, so no single request
+        grows with the input. Each batch is sent column-wise, and its slice of the
+        matrix is only converted to lists when that batch goes out.
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        starts = range(0, len(ids), self.upsert_batch_size)
+
+        def send(start: int) -> None:
+            end = start + self.upsert_batch_size
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=models.Batch(ids=ids[start:end], vectors=matrix[start:end].tolist(), payloads=payloads[start:end])
+            )
+
+        if len(starts) <= 1 or self.upsert_parallel <= 1:
+            for start in starts:
+                send(start)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.upsert_parallel, len(starts))) as pool:
+            # list() surfaces the first failed batch
+            list(pool.map(send, starts))
+
+    def delete(self, ids: List[str], repo_id: Optional[str] = None) -> None:
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.PointIdsList(points=ids)
+        )
+
+    def set_payload(self, ids: List[str], payload: Dict[str, Any], repo_id: Optional[str] = None) -> None:
+        self.client.set_payload(collection_name=self.collection_name, payload=payload, points=ids)
+
+    def set_repo_payload(self, repo_id: str, payload: Dict[str, Any]) -> None:
+        # One request for the whole repository; Qdrant resolves the filter server-side
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload=payload,
+            points=models.FilterSelector(filter=self._build_filter({"repo_id": repo_id}))
+        )
+
+    def _build_filter(self, filter_dict: dict) -> models.Filter:
+        """Convert filter dict to Qdrant Filter"""
+        return models.Filter(
+            must=[
+                models.FieldCondition(
+                    key=key,
+                    match=models.MatchValue(value=value)
+                ) for key, value in filter_dict.items()
+            ]
+        )
+
+    @staticmethod
+    def _to_hits(points) -> List[SearchHit]:
+        return [
+            SearchHit(id=str(point.id), score=getattr(point, 'score', 0.0), payload=point.payload,
+                      vector=np.array(point.vector) if point.vector is not None else None)
+            for point in points
+        ]
+
+    def search(self, vector: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            query=np.asarray(vector).tolist(),
+            query_filter=self._build_filter(filters) if filters else None,
+            search_params=self.collection_config.search_params(),
+            limit=top_k
+        )
+        return self._to_hits(response.points)
+
+    async def search_async(self, vector: np.ndarray, top_k: int,
+                           filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        response = await self.async_client.query_points(
+            collection_name=self.collection_name,
+            query=np.asarray(vector).tolist(),
+            query_filter=self._build_filter(filters) if filters else None,
+            search_params=self.collection_config.search_params(),
+            limit=top_k
+        )
+        return self._to_hits(response.points)
+
+    def scroll(self, batch_size: int = 100) -> Iterator[List[SearchHit]]:
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset
+            )
+            if points:
+                yield self._to_hits(points)
+            if not points or offset is None:
+                return
+
+    def reset(self) -> None:
+        # Recreate the collection behind the alias (faster than deleting all points)
+        current = self._physical_collection() or self.collection_name
+        self.client.recreate_collection(
+            collection_name=current,
+            **self.collection_config.create_kwargs()
+        )
+        self._initialize_payload_indexes(current)
@@ -4,7 +4,10 @@ from typing import Any, Optional
 class RawDocument:
     """
     A class representing a raw document with content. A document object contains a chunk of code from a file. 
+    Slotted, since a large repository produces tens of thousands of them.
     """
+    __slots__ = ("content", "file_name", "file_size", "timestamp", "original_file", "chunk_metadata")
+
     def __init__(self, content: str, file_name: str, file_size: int, timestamp: str, original_file: str, chunk_metadata: Optional[dict] = None):
         """
         Initialize the RawDocument with the given content.
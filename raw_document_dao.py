@@ -1,13 +1,14 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from typing import List
+from sqlalchemy import Column, Integer, String, JSON, DateTime
+from typing import Dict, List, Tuple
 from datetime import datetime
 
+from database import Base, SessionLocal, engine
 from raw_document import RawDocument
+from utils.pg_copy import copy_rows
 
-Base = declarative_base()
+# Rows per COPY batch; bounds the encoded buffer, not the transaction
+COPY_BATCH_SIZE = int(os.getenv("PG_COPY_BATCH_SIZE", "5000"))
 
 class RawDocumentDAO(Base):
     __tablename__ = 'raw_documents'
@@ -22,27 +23,94 @@ class RawDocumentDAO(Base):
 
     @classmethod
     def batch_save(cls, documents: List[RawDocument]) -> None:
-        """Batch save RawDocuments to the database"""
-        db = SessionLocal()
+        """Batch save RawDocuments with binary COPY, in bounded batches inside one transaction"""
+        conn = engine.raw_connection()
         try:
-            # Convert RawDocuments to RawDocumentDAOs
-            dao_objects = [
-                cls(
-                    content=doc.content,
-                    file_name=doc.file_name,
-                    file_size=doc.file_size,
-                    timestamp=datetime.fromisoformat(doc.timestamp),
-                    original_file=doc.original_file,
-                    chunk_metadata=doc.chunk_metadata
-                )
-                for doc in documents
-            ]
-            
-            # Bulk save
-            db.bulk_save_objects(dao_objects)
-            db.commit()
+            with conn.cursor() as cur:
+                copy_rows(cur, cls.__tablename__,
+                          ["content", "file_name", "file_size", "timestamp", "original_file", "chunk_metadata"], (
+                    (
+                        doc.content,
+                        doc.file_name,
+                        doc.file_size,
+                        datetime.fromisoformat(doc.timestamp),
+                        doc.original_file,
+                        doc.chunk_metadata
+                    )
+                    for doc in documents
+                ), batch_size=COPY_BATCH_SIZE)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         finally:
-            db.close()
+            conn.close()
+
+    @classmethod
+    def delete_stale(cls, repo_id: str, current_hashes: Dict[str, List[str]]) -> int:
+        """
+        Delete a repository's chunks of the given files whose content hash is not
+        among the file's current ones; a file mapped to [] loses all of its chunks.
+        """
+        if not current_hashes:
+            return 0
+        keep = [(file_name, chunk_hash) for file_name, hashes in current_hashes.items() for chunk_hash in hashes]
+        conn = engine.raw_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM raw_documents r
+                    WHERE r.chunk_metadata->>'repo_id' = %s
+                      AND r.original_file = ANY(%s)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM unnest(%s::text[], %s::text[]) AS keep(file_name, content_hash)
+                          WHERE keep.file_name = r.original_file
+                            AND keep.content_hash = r.chunk_metadata->>'content_hash'
+                      )
+                """, (repo_id, list(current_hashes), [name for name, _ in keep], [chunk_hash for _, chunk_hash in keep]))
+                deleted = cur.rowcount
+            conn.commit()
+            return deleted
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @classmethod
+    def update_line_ranges(cls, repo_id: str, ranges: List[Tuple[str, str, int, int, int]]) -> int:
+        """
+        Move chunks that were carried over unchanged to where they now sit in their file.
+        :param ranges: (original_file, content_hash, chunk_index, start_line, end_line) per chunk
+        """
+        if not ranges:
+            return 0
+        conn = engine.raw_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE raw_documents r
+                    SET chunk_metadata = (r.chunk_metadata::jsonb || jsonb_build_object(
+                        'chunk_index', u.chunk_index, 'start_line', u.start_line, 'end_line', u.end_line
+                    ))::json
+                    FROM unnest(%s::text[], %s::text[], %s::int[], %s::int[], %s::int[])
+                        AS u(file_name, content_hash, chunk_index, start_line, end_line)
+                    WHERE r.chunk_metadata->>'repo_id' = %s
+                      AND r.original_file = u.file_name
+                      AND r.chunk_metadata->>'content_hash' = u.content_hash
+                      AND (r.chunk_metadata->>'start_line' IS DISTINCT FROM u.start_line::text
+                           OR r.chunk_metadata->>'end_line' IS DISTINCT FROM u.end_line::text
+                           OR r.chunk_metadata->>'chunk_index' IS DISTINCT FROM u.chunk_index::text)
+                """, ([item[0] for item in ranges], [item[1] for item in ranges], [item[2] for item in ranges],
+                      [item[3] for item in ranges], [item[4] for item in ranges], repo_id))
+                updated = cur.rowcount
+            conn.commit()
+            return updated
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
     @classmethod
     def get_documents_by_timestamp(cls, start_time: str = None, end_time: str = None) -> List[RawDocument]:
@@ -77,9 +145,3 @@ class RawDocumentDAO(Base):
         
         finally:
             db.close()
-
-# Use the same credentials as in docker-compose.yml
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
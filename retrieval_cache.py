@@ -0,0 +1,72 @@
+import os
+import logging
+from typing import Callable, Dict, Hashable, List, Optional
+import numpy as np
+from processed_document import ProcessedDocument
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Scope for searches that are not restricted to one repository
+ALL_REPOS = "*"
+
+_MISSING = object()
+
+class RetrievalCache:
+    """
+    Short-lived caches for /ask_question: question embeddings, and top-k search
+    results keyed by repository and that repository's index version.
+
+    The index version comes from version_source (the indexing job table), so a
+    re-index finished by any worker process changes the key and results cached
+    against the old index are never served again; they simply age out. The
+    version itself is memoized for a few seconds to keep lookups off the database.
+    """
+    def __init__(self, maxsize: Optional[int] = None, ttl: Optional[float] = None,
+                 version_source: Optional[Callable[[Optional[str]], Hashable]] = None):
+        maxsize = maxsize or int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+        ttl = ttl or float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+        self.embeddings = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.version_source = version_source
+        self._source_versions = TTLCache(maxsize=maxsize, ttl=float(os.getenv("RETRIEVAL_VERSION_TTL", "5")))
+
+    @staticmethod
+    def _normalize(question: str) -> str:
+        return " ".join(question.split())
+
+    def version(self, repo_id: str = ALL_REPOS) -> Hashable:
+        if self.version_source is None:
+            return None
+        source_version = self._source_versions.get(repo_id, _MISSING)
+        if source_version is _MISSING:
+            source_version = self.version_source(None if repo_id == ALL_REPOS else repo_id)
+            self._source_versions.set(repo_id, source_version)
+        return source_version
+
+    def get_embedding(self, model: str, dimensions: int, question: str) -> Optional[np.ndarray]:
+        return self.embeddings.get((model, dimensions, self._normalize(question)))
+
+    def set_embedding(self, model: str, dimensions: int, question: str, embedding: np.ndarray) -> None:
+        self.embeddings.set((model, dimensions, self._normalize(question)), embedding)
+
+    def results_key(self, question: str, top_k: int, repo_id: str = ALL_REPOS) -> tuple:
+        """
+        Key for a search against the current index. Take it before searching, so
+        results of a search that raced a re-index are filed under the old version.
+        """
+        return (repo_id, self.version(repo_id), top_k, self._normalize(question))
+
+    def get_results(self, key: tuple) -> Optional[List[ProcessedDocument]]:
+        return self.results.get(key)
+
+    def set_results(self, key: tuple, results: List[ProcessedDocument]) -> None:
+        self.results.set(key, results)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "embedding_hits": self.embeddings.hits,
+            "embedding_misses": self.embeddings.misses,
+            "result_hits": self.results.hits,
+            "result_misses": self.results.misses,
+        }
@@ -0,0 +1,84 @@
+import os
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+from github_reader import download_zipball, repo_slug
+
+logger = logging.getLogger(__name__)
+
+class SnapshotCache:
+    """
+    On-disk cache of repository zipballs keyed by resolved commit SHA.
+    Snapshots are immutable, so a cached archive is valid for as long as the
+    branch head still resolves to the same SHA. The cache is bounded in bytes
+    and evicts the least recently used snapshots first.
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or os.getenv("SNAPSHOT_CACHE_DIR", ".cache/snapshots"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("SNAPSHOT_CACHE_MAX_BYTES", 2 * 1024 ** 3)
+        )
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _snapshot_path(self, repo_url: str, sha: str) -> Path:
+        return self.cache_dir / repo_slug(repo_url).replace('/', '__') / f"{sha}.zip"
+
+    def get_archive(self, repo_url: str, sha: str, gh_token: Optional[str] = None) -> Path:
+        """Return the path of the zipball for this commit, downloading it on a miss"""
+        path = self._snapshot_path(repo_url, sha)
+        if path.exists():
+            try:
+                # mtime doubles as the LRU timestamp
+                os.utime(path)
+                self.hits += 1
+                logger.info(f"Snapshot cache hit for {repo_url}@{sha[:12]}")
+                return path
+            except FileNotFoundError:
+                pass  # Evicted between the check and the touch
+
+        self.misses += 1
+        logger.info(f"Snapshot cache miss for {repo_url}@{sha[:12]}, downloading")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Download to a private temp file so concurrent readers never see a partial archive
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                download_zipball(repo_url, sha, tmp, gh_token)
+            os.replace(tmp_name, path)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: Path) -> None:
+        """Drop least recently used snapshots until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for snapshot in self.cache_dir.glob("*/*.zip"):
+                try:
+                    stat = snapshot.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, snapshot))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, snapshot in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                if snapshot == keep:
+                    continue
+                try:
+                    # Open handles keep working after unlink on POSIX
+                    snapshot.unlink()
+                    total -= size
+                    logger.info(f"Evicted snapshot {snapshot}")
+                except FileNotFoundError:
+                    continue
@@ -0,0 +1,41 @@
+import pytest
+from lexical_index import LexicalIndex, query_identifiers
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(path=str(tmp_path / "lexical.sqlite3"))
+    yield index
+    index.close()
+
+def add(index, point_id, repo_id, content, symbols=()):
+    index.add([point_id], [{"repo_id": repo_id, "commit": "c1", "content": content}], [list(symbols)])
+
+@pytest.mark.parametrize("question, expected", [
+    ("what is HTTPServer?", {"httpserver"}),
+    ("where is UserName set", {"username"}),
+    ("what does chunk_file do", {"chunk_file"}),
+    ("who calls getUser", {"getuser"}),
+    ("what does `run` return", {"run"}),
+    ("Server starts slowly", set()),
+])
+def test_query_identifiers(question, expected):
+    assert query_identifiers(question) == expected
+
+def test_search_prefers_defining_chunk(index):
+    add(index, "a", "owner/repo", "server = HTTPServer(address)")
+    add(index, "b", "owner/repo", "class HTTPServer:\n    pass", symbols=["HTTPServer"])
+
+    hits = index.search("what is HTTPServer?", top_k=2)
+
+    assert [hit.id for hit in hits] == ["b", "a"]
+    assert hits[0].payload["symbols"] == ["HTTPServer"]
+
+def test_set_repo_payload(index):
+    add(index, "a", "owner/repo", "def handler(): pass")
+    add(index, "b", "other/repo", "def handler(): pass")
+    assert index.has_repo("owner/repo") and not index.has_repo("missing/repo")
+
+    index.set_repo_payload("owner/repo", {"commit": "c2"})
+
+    commits = {hit.id: hit.payload["commit"] for hit in index.search("handler", top_k=5)}
+    assert commits == {"a": "c2", "b": "c1"}
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from numpy_store import NumpyVectorStore, _RepoIndex
+
+DIMENSIONS = 8
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def points(count: int, repo_id: str = "owner/repo", language: str = "python", seed: int = 0):
+    vectors = unit(np.random.default_rng(seed).standard_normal((count, DIMENSIONS)).astype(np.float32))
+    ids = [f"{repo_id}-{i}" for i in range(count)]
+    payloads = [
+        {"content": f"chunk {i}", "file_name": f"f{i}.py", "original_file": f"f{i}.py",
+         "repo_id": repo_id, "commit": "c1", "language": language}
+        for i in range(count)
+    ]
+    return ids, vectors, payloads
+
+@pytest.fixture
+def store(tmp_path):
+    store = NumpyVectorStore(root_dir=str(tmp_path), dimensions=DIMENSIONS)
+    yield store
+    store.close()
+
+def test_search_finds_upserted_points(store):
+    ids, vectors, payloads = points(20)
+    store.upsert(ids, vectors, payloads)
+
+    hits = store.search(vectors[7], top_k=3)
+
+    assert [hit.id for hit in hits][0] == ids[7]
+    assert hits[0].score == pytest.approx(1.0, abs=1e-5)
+    assert hits[0].payload["content"] == "chunk 7"
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+def test_search_filters(store):
+    ids, vectors, payloads = points(10, repo_id="a/one", language="python")
+    other_ids, other_vectors, other_payloads = points(10, repo_id="b/two", language="go", seed=1)
+    store.upsert(ids + other_ids, np.vstack([vectors, other_vectors]), payloads + other_payloads)
+
+    by_repo = store.search(other_vectors[3], top_k=5, filters={"repo_id": "a/one"})
+    assert by_repo and all(hit.payload["repo_id"] == "a/one" for hit in by_repo)
+
+    by_language = store.search(other_vectors[3], top_k=5, filters={"language": "go"})
+    assert by_language[0].id == other_ids[3]
+    assert all(hit.payload["language"] == "go" for hit in by_language)
+
+    assert store.search(vectors[0], top_k=5, filters={"repo_id": "missing/repo"}) == []
+
+def test_set_repo_payload(store):
+    ids, vectors, payloads = points(10, repo_id="a/one")
+    other_ids, other_vectors, other_payloads = points(10, repo_id="b/two", seed=1)
+    store.upsert(ids + other_ids, np.vstack([vectors, other_vectors]), payloads + other_payloads)
+
+    store.set_repo_payload("a/one", {"commit": "c2"})
+
+    assert {hit.payload["commit"] for hit in store.search(vectors[0], top_k=10, filters={"repo_id": "a/one"})} == {"c2"}
+    assert len(store.search(vectors[0], top_k=10, filters={"commit": "c2"})) == 10
+    assert {hit.payload["commit"] for hit in store.search(vectors[0], top_k=10, filters={"repo_id": "b/two"})} == {"c1"}
+
+def test_delete_past_compaction_threshold(store, tmp_path):
+    count = _RepoIndex.initial_capacity + 600
+    ids, vectors, payloads = points(count)
+    store.upsert(ids, vectors, payloads)
+    repo_dir = next(path for path in tmp_path.iterdir() if path.is_dir())
+    files_before = {path.name for path in repo_dir.glob("vectors*.npy")}
+
+    deleted = set(ids[:count - 100])
+    store.delete(list(deleted), repo_id="owner/repo")
+
+    # Compaction wrote a new generation and removed the superseded file
+    files_after = {path.name for path in repo_dir.glob("vectors*.npy")}
+    assert len(files_after) == 1 and files_after != files_before
+    for i in range(count - 100, count, 17):
+        hits = store.search(vectors[i], top_k=1)
+        assert hits[0].id == ids[i]
+        np.testing.assert_allclose(hits[0].vector, vectors[i], atol=1e-6)
+    assert not any(hit.id in deleted for hit in store.search(vectors[0], top_k=100))
+    assert sum(len(batch) for batch in store.scroll(batch_size=30)) == 100
+
+def test_failed_compaction_keeps_rows_and_vectors_consistent(store, monkeypatch):
+    count = _RepoIndex.initial_capacity + 600
+    ids, vectors, payloads = points(count)
+    store.upsert(ids, vectors, payloads)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("crash before commit")
+    monkeypatch.setattr(_RepoIndex, "_set_meta", fail)
+    with pytest.raises(RuntimeError):
+        store.delete(ids[:count - 100], repo_id="owner/repo")
+    monkeypatch.undo()
+
+    reopened = NumpyVectorStore(root_dir=str(store.root_dir), dimensions=DIMENSIONS)
+    try:
+        for i in (0, 500, count - 1):
+            assert reopened.search(vectors[i], top_k=1)[0].id == ids[i]
+    finally:
+        reopened.close()
+
+def test_second_store_sees_writes(store):
+    reader = NumpyVectorStore(root_dir=str(store.root_dir), dimensions=DIMENSIONS)
+    try:
+        ids, vectors, payloads = points(10)
+        store.upsert(ids, vectors, payloads)
+        assert reader.search(vectors[4], top_k=1)[0].id == ids[4]
+
+        # Growing past the initial capacity swaps in a new file the reader has to follow
+        more_ids, more_vectors, more_payloads = points(_RepoIndex.initial_capacity + 10, seed=2)
+        more_ids = [f"more-{point_id}" for point_id in more_ids]
+        store.upsert(more_ids, more_vectors, more_payloads)
+        assert reader.search(more_vectors[-1], top_k=1)[0].id == more_ids[-1]
+        assert reader.search(vectors[4], top_k=1)[0].id == ids[4]
+
+        store.delete(ids[:5], repo_id="owner/repo")
+        assert all(hit.id not in ids[:5] for hit in reader.search(vectors[2], top_k=20))
+    finally:
+        reader.close()
+
+def test_smaller_dimensions_truncate_stored_vectors(store):
+    ids, vectors, payloads = points(10)
+    store.upsert(ids, vectors, payloads)
+    store.close()
+
+    smaller = NumpyVectorStore(root_dir=str(store.root_dir), dimensions=4)
+    try:
+        hits = smaller.search(vectors[6][:4], top_k=1)
+        assert hits[0].id == ids[6]
+        assert hits[0].vector.shape == (4,)
+        assert hits[0].score == pytest.approx(1.0, abs=1e-5)
+    finally:
+        smaller.close()
+
+def test_larger_dimensions_are_refused(store):
+    ids, vectors, payloads = points(3)
+    store.upsert(ids, vectors, payloads)
+    store.close()
+
+    larger = NumpyVectorStore(root_dir=str(store.root_dir), dimensions=16)
+    with pytest.raises(ValueError):
+        larger.search(np.ones(16), top_k=1)
@@ -0,0 +1,43 @@
+import time
+import pytest
+from utils.pipeline import Stage, batched, close_all
+
+def test_stages_hand_over_items_in_order():
+    numbers = Stage('numbers', iter(range(25)), maxsize=2)
+    batches = Stage('batches', batched(numbers, 10), maxsize=1, size=len)
+
+    assert list(batches) == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+    assert batches.stats.items == 25
+
+def test_producer_error_reaches_consumer():
+    def failing():
+        yield 1
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        list(Stage('failing', failing(), maxsize=1))
+
+def test_close_all_stops_threads_and_closes_sources():
+    closed = []
+
+    def source():
+        try:
+            for i in range(1000):
+                yield i
+                time.sleep(0.01)
+        finally:
+            closed.append('source')
+
+    def slow(items):
+        for item in items:
+            time.sleep(0.1)
+            yield item
+
+    first = Stage('first', batched(source(), 5), maxsize=1)
+    second = Stage('second', slow(first), maxsize=1)
+    next(iter(second))
+
+    close_all([first, second], timeout=5)
+
+    assert closed == ['source']
+    assert not first._thread.is_alive() and not second._thread.is_alive()
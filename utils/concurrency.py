@@ -0,0 +1,20 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Bounded pool for blocking work called from the event loop (file fetches, parsing,
+# SQLite lookups), so a burst of requests cannot spawn unbounded threads
+_blocking_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BLOCKING_POOL_SIZE", "16")),
+    thread_name_prefix="blocking"
+)
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call in the shared thread pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_pool, functools.partial(func, *args, **kwargs))
+
+def shutdown_blocking_pool() -> None:
+    _blocking_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,5 @@
+import hashlib
+
+def content_hash(content: str) -> str:
+    """Stable SHA-256 hex digest of a text, used to detect changed files and chunks"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
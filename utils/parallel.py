@@ -0,0 +1,61 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+def default_workers() -> int:
+    """Worker count from PARSE_WORKERS, defaulting to a single in-process worker"""
+    value = os.getenv("PARSE_WORKERS", "1")
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+# Pools are started from processes that already run threads (the blocking pool, pipeline
+# stages, heartbeats); a forked child could inherit a lock one of them held and hang
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+def _batched(items: Iterable, batch_size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _run_batch(func: Callable, batch: List) -> List:
+    return [func(item) for item in batch]
+
+def ordered_map(func: Callable[[Any], Any], items: Iterable, workers: int, batch_size: int = 32,
+                initializer: Optional[Callable] = None, initargs: Tuple = ()) -> Iterator[Any]:
+    """
+    Map func over items on a process pool and yield results in input order.
+
+    Items are shipped in batches to amortise pickling, and at most two batches
+    per worker are in flight, so a lazy input is never fully materialised.
+    func and initializer must be module-level functions; workers are started
+    with forkserver (spawn where that is unavailable), never forked. With one
+    worker the map runs in the calling process and the initializer is called there.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs,
+                             mp_context=multiprocessing.get_context(_START_METHOD)) as pool:
+        pending = deque()
+        try:
+            for batch in _batched(items, batch_size):
+                pending.append(pool.submit(_run_batch, func, batch))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # A consumer that stops early should not wait for batches it will never read
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,112 @@
+import io
+import json
+import struct
+import uuid
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+import numpy as np
+
+# COPY ... WITH (FORMAT binary) stream framing
+_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+_PG_EPOCH = datetime(2000, 1, 1)
+_ARRAY_ELEMENT_OIDS = {"_float4": (700, ">f4"), "_float8": (701, ">f8")}
+
+def _timestamp(value: Any) -> bytes:
+    """Microseconds since 2000-01-01; aware values are stored as UTC, naive ones as given"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _PG_EPOCH
+    return struct.pack(">q", (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+def _float_array(value: Any, type_name: str) -> bytes:
+    oid, dtype = _ARRAY_ELEMENT_OIDS[type_name]
+    values = np.asarray(value, dtype=dtype).ravel()
+    # Each element is a (length, value) pair
+    elements = np.empty(len(values), dtype=[("length", ">i4"), ("value", dtype)])
+    elements["length"] = values.itemsize
+    elements["value"] = values
+    return struct.pack(">iiiii", 1, 0, oid, len(values), 1) + elements.tobytes()
+
+def _vector(value: Any) -> bytes:
+    """pgvector's binary format: dimensions, an unused flag word, then float4 components"""
+    values = np.asarray(value, dtype=">f4").ravel()
+    return struct.pack(">HH", len(values), 0) + values.tobytes()
+
+def _json(value: Any) -> bytes:
+    return (value if isinstance(value, str) else json.dumps(value)).encode("utf-8")
+
+_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "text": lambda value: str(value).encode("utf-8"),
+    "varchar": lambda value: str(value).encode("utf-8"),
+    "bpchar": lambda value: str(value).encode("utf-8"),
+    "int2": lambda value: struct.pack(">h", value),
+    "int4": lambda value: struct.pack(">i", value),
+    "int8": lambda value: struct.pack(">q", value),
+    "float4": lambda value: struct.pack(">f", value),
+    "float8": lambda value: struct.pack(">d", value),
+    "bool": lambda value: b"\x01" if value else b"\x00",
+    "uuid": lambda value: uuid.UUID(str(value)).bytes,
+    "timestamp": _timestamp,
+    "timestamptz": _timestamp,
+    "json": _json,
+    "jsonb": lambda value: b"\x01" + _json(value),  # jsonb binary format version 1
+    "_float4": lambda value: _float_array(value, "_float4"),
+    "_float8": lambda value: _float_array(value, "_float8"),
+    "vector": _vector,
+}
+
+def column_types(cur, table: str) -> Dict[str, str]:
+    """Type name (pg_type.typname, e.g. 'int4', '_float4', 'vector') of each column of a table"""
+    cur.execute("""
+        SELECT a.attname, t.typname
+        FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+    """, (table,))
+    return dict(cur.fetchall())
+
+def encode_rows(rows: Iterable[Sequence], types: List[str]) -> bytes:
+    """Encode rows as one COPY binary stream, header and trailer included"""
+    encoders = []
+    for type_name in types:
+        if type_name not in _ENCODERS:
+            raise ValueError(f"No binary COPY encoder for column type {type_name}")
+        encoders.append(_ENCODERS[type_name])
+    field_count = struct.pack(">h", len(types))
+    buffer = io.BytesIO()
+    buffer.write(_HEADER)
+    for row in rows:
+        buffer.write(field_count)
+        for encoder, value in zip(encoders, row):
+            if value is None:
+                buffer.write(_NULL)
+                continue
+            data = encoder(value)
+            buffer.write(struct.pack(">i", len(data)))
+            buffer.write(data)
+    buffer.write(_TRAILER)
+    return buffer.getvalue()
+
+def copy_rows(cur, table: str, columns: List[str], rows: Iterable[Sequence], batch_size: int = 5000) -> int:
+    """
+    Bulk-load rows with COPY ... FROM STDIN in binary format, batch_size rows per
+    COPY so the encoded buffer stays bounded. Values are encoded to match the
+    table's column types. Commit (or not) is up to the caller, so every batch
+    lands in the caller's transaction. Returns the number of rows copied.
+    """
+    table_types = column_types(cur, table)
+    types = [table_types[column] for column in columns]
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    statement = f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT binary)"
+    copied = 0
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return copied
+        cur.copy_expert(statement, io.BytesIO(encode_rows(batch, types)))
+        copied += len(batch)
@@ -0,0 +1,95 @@
+import os
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+class PostgresPool:
+    """
+    Bounded, thread-safe Postgres connection pool.
+
+    psycopg2's ThreadedConnectionPool raises as soon as every connection is
+    checked out; a semaphore in front of it makes callers queue instead, up to
+    timeout seconds. Time spent queueing is recorded so pool pressure shows up
+    in metrics() before it shows up as request latency.
+    """
+    def __init__(self, minconn: int = 1, maxconn: int = 10, timeout: float = 30.0, **connect_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "PostgresPool":
+        return cls(
+            minconn=int(os.getenv("PG_POOL_MIN", "1")),
+            maxconn=int(os.getenv("PG_POOL_MAX", "10")),
+            timeout=float(os.getenv("PG_POOL_TIMEOUT", "30")),
+            dbname=os.getenv("POSTGRES_DB"),
+            user=os.getenv("POSTGRES_USER"),
+            password=os.getenv("POSTGRES_PASSWORD"),
+            host=os.getenv("POSTGRES_HOST", "localhost"),
+            port=os.getenv("POSTGRES_PORT", "5432")
+        )
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """Check out a connection; commits on success, rolls back on error"""
+        start = time.perf_counter()
+        waited = not self._slots.acquire(blocking=False)
+        if waited and not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError(f"No Postgres connection available within {self.timeout}s")
+        wait = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            if waited:
+                self._waits += 1
+                self._wait_seconds += wait
+                self._max_wait_seconds = max(self._max_wait_seconds, wait)
+
+        conn = None
+        try:
+            conn = self._pool.getconn()
+            yield conn
+            conn.commit()
+        except Exception:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if conn is not None:
+                # Broken connections are discarded rather than handed out again
+                self._pool.putconn(conn, close=bool(conn.closed))
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "max_connections": self.maxconn,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": round(self._wait_seconds, 6),
+                "wait_seconds_max": round(self._max_wait_seconds, 6),
+            }
+
+    def close(self) -> None:
+        self._pool.closeall()
+        logger.info("Postgres pool closed")
@@ -0,0 +1,141 @@
+import logging
+import queue
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+# How often a blocked producer or consumer checks whether the stage was closed
+_PUT_TIMEOUT = 0.5
+
+class StageStats:
+    """Items a pipeline stage produced and where its time went"""
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        # Time spent waiting on a full output queue, i.e. on the next stage
+        self.blocked = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        busy = max(self.elapsed - self.blocked, 1e-9)
+        return {
+            "items": self.items,
+            "seconds": round(self.elapsed, 3),
+            "blocked_seconds": round(self.blocked, 3),
+            "items_per_second": round(self.items / busy, 1)
+        }
+
+class Stage:
+    """
+    Runs a generator on its own thread and hands its items over through a
+    bounded queue. The producer blocks once maxsize items are waiting, so a fast
+    stage can never run further ahead of a slow one than its queue allows and
+    memory stays flat however large the input is.
+
+    Iterate the stage to consume it. An exception in the producer is re-raised
+    in the consumer. A consumer that stops early (or fails) should call close(),
+    which stops the producer at its next item and ends iteration, so stages
+    chained on top of it wind down too, and then join() so that no producer is
+    still inside a long call once the consumer has moved on.
+    """
+    def __init__(self, name: str, items: Iterable, maxsize: int, size: Optional[Callable[[Any], int]] = None):
+        """
+        :param maxsize: Items the stage may produce ahead of its consumer
+        :param size: How many units an item counts as in the stats, e.g. len for batches; 1 when omitted
+        """
+        self.name = name
+        self._size = size
+        self.stats = StageStats(name)
+        self._items = items
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name=f"pipeline-{name}", daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        started = time.monotonic()
+        try:
+            while not self._closed.is_set():
+                try:
+                    self._queue.put(item, timeout=_PUT_TIMEOUT)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.stats.blocked += time.monotonic() - started
+
+    def _produce(self) -> None:
+        try:
+            for item in self._items:
+                if not self._put(item):
+                    return
+                self.stats.items += self._size(item) if self._size else 1
+            self.stats.finished = time.monotonic()
+            self._put(_DONE)
+        except BaseException as e:
+            self.stats.finished = time.monotonic()
+            self._put(e)
+        finally:
+            # Lets generator stages release what they hold (e.g. process pools)
+            close = getattr(self._items, 'close', None)
+            if close is not None:
+                close()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            try:
+                item = self._queue.get(timeout=_PUT_TIMEOUT)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+            if item is _DONE:
+                logger.info(f"Stage {self.name}: {self.stats.as_dict()}")
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the producer thread to exit; False if it is still running after timeout"""
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Stage {self.name} still running {timeout}s after close")
+            return False
+        return True
+
+def close_all(stages: Iterable[Stage], timeout: float) -> None:
+    """Close stages, then wait up to timeout seconds in total for their threads to exit"""
+    stages = list(stages)
+    for stage in stages:
+        stage.close()
+    deadline = time.monotonic() + timeout
+    for stage in stages:
+        stage.join(max(deadline - time.monotonic(), 0.0))
+
+def batched(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Lists of up to batch_size consecutive items; closes items when done or closed itself"""
+    iterator = iter(items)
+    try:
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield batch
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
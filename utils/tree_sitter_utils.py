@@ -1,7 +1,8 @@
 import logging
+import threading
 from pathlib import Path
-from typing import Dict
-from tree_sitter import Language, Parser
+from typing import Dict, Optional
+from tree_sitter import Language, Parser, Tree
 import warnings
 
 logger = logging.getLogger(__name__)
@@ -9,13 +10,9 @@ warnings.filterwarnings("ignore", category=UserWarning)
 
 class TreeSitterManager:
     def __init__(self):
-        self.parser = Parser()
         self.language_map = self._load_languages()
-        
-        # Set a default language (e.g., javascript) if available
-        if self.language_map:
-            default_lang = next(iter(self.language_map.values()))
-            self.parser.set_language(default_lang)
+        # Parsers are stateful, so each thread gets its own parser per language
+        self._local = threading.local()
         
         logger.debug(f"Loaded languages: {list(self.language_map.keys())}")
 
@@ -78,14 +75,29 @@ class TreeSitterManager:
         logger.debug(f"Detected language {detected_lang} for file {file_path}")
         return detected_lang
 
-    def set_language(self, lang_name: str) -> None:
-        """Set the parser's language"""
+    def supports(self, lang_name: str) -> bool:
+        return lang_name in self.language_map
+
+    def get_parser(self, lang_name: str) -> Parser:
+        """Return this thread's parser for a language, creating it on first use"""
         if lang_name not in self.language_map:
             raise ValueError(f"No parser available for language {lang_name}")
-        self.parser.set_language(self.language_map[lang_name])
+        parsers = getattr(self._local, 'parsers', None)
+        if parsers is None:
+            parsers = self._local.parsers = {}
+        parser = parsers.get(lang_name)
+        if parser is None:
+            parser = Parser()
+            parser.set_language(self.language_map[lang_name])
+            parsers[lang_name] = parser
+        return parser
+
+    def get_file_parser(self, file_path: str) -> Optional[Parser]:
+        """Parser matching the file's extension, or None for unsupported languages"""
+        lang_name = self.get_language(file_path)
+        return self.get_parser(lang_name) if self.supports(lang_name) else None
 
-    def parse_file(self, file_path: str, content: str) -> Parser:
+    def parse_file(self, file_path: str, content: str) -> Tree:
         """Parse file content with appropriate language parser"""
         lang_name = self.get_language(file_path)
-        self.set_language(lang_name)  # Use the new set_language method
-        return self.parser.parse(bytes(content, "utf8"))
\ No newline at end of file
+        return self.get_parser(lang_name).parse(bytes(content, "utf8"))
@@ -0,0 +1,81 @@
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+from utils.concurrency import run_blocking
+
+# Payload fields every point carries and searches filter on; stores index them
+INDEXED_PAYLOAD_FIELDS = ("repo_id", "commit", "language")
+
+@dataclass
+class SearchHit:
+    """A stored point as returned by a vector store"""
+    id: str
+    score: float
+    payload: Dict[str, Any]
+    vector: Optional[np.ndarray] = None
+
+class VectorStore(ABC):
+    """
+    Where chunk embeddings live and are searched. Points have a string ID, a
+    vector and a payload (content, file names, repo_id, commit, language);
+    filters match payload fields exactly. Similarity is cosine.
+    """
+    @abstractmethod
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        """Insert or replace points; vectors is an (n, dimensions) float32 matrix, row i for ids[i]"""
+
+    @abstractmethod
+    def delete(self, ids: List[str], repo_id: Optional[str] = None) -> None:
+        """Delete points; repo_id, when known, narrows where a store has to look"""
+
+    @abstractmethod
+    def set_payload(self, ids: List[str], payload: Dict[str, Any], repo_id: Optional[str] = None) -> None:
+        """Merge payload into the payload of existing points"""
+
+    @abstractmethod
+    def set_repo_payload(self, repo_id: str, payload: Dict[str, Any]) -> None:
+        """Merge payload into the payload of every point of a repository"""
+
+    @abstractmethod
+    def search(self, vector: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        pass
+
+    async def search_async(self, vector: np.ndarray, top_k: int,
+                           filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """Async variant; by default runs search in the shared blocking pool"""
+        return await run_blocking(self.search, vector, top_k, filters)
+
+    @abstractmethod
+    def scroll(self, batch_size: int = 100) -> Iterator[List[SearchHit]]:
+        """Yield every stored point, a batch at a time"""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Delete every point"""
+
+    def metrics(self) -> dict:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self.close()
+
+def create_vector_store(embedder: Optional[object] = None, pg_pool=None, client=None,
+                        collection_config=None, backend: Optional[str] = None) -> VectorStore:
+    """
+    Vector store selected by VECTOR_STORE: "qdrant" (default), or "numpy" for
+    the in-process memory-mapped store, which needs no vector database service
+    """
+    backend = (backend or os.getenv("VECTOR_STORE", "qdrant")).lower()
+    if backend == "qdrant":
+        from qdrant_store import QdrantVectorStore
+        return QdrantVectorStore(embedder=embedder, pg_pool=pg_pool, client=client,
+                                 collection_config=collection_config)
+    if backend == "numpy":
+        from numpy_store import NumpyVectorStore
+        return NumpyVectorStore(dimensions=getattr(embedder, 'dimensions', None))
+    raise ValueError(f"Unknown VECTOR_STORE backend {backend!r}, expected 'qdrant' or 'numpy'")
@@ -0,0 +1,129 @@
+"""
+Indexing worker pool. Claims jobs from the indexing_jobs table and runs them
+outside the API process, so any number of API workers can queue jobs and a
+restart only delays them.
+
+Run next to the API:
+    python worker.py                # INDEX_WORKERS processes (default 2)
+"""
+import os
+import logging
+import multiprocessing
+from multiprocessing.synchronize import Event as ProcessEvent
+import signal
+import socket
+import threading
+import time
+from typing import Dict
+from dotenv import load_dotenv
+
+logger = logging.getLogger("worker")
+
+POLL_INTERVAL = float(os.getenv("INDEX_JOB_POLL_SECONDS", "2"))
+HEARTBEAT_INTERVAL = float(os.getenv("INDEX_JOB_HEARTBEAT_SECONDS", "30"))
+# Minimum time between progress writes for one stage
+PROGRESS_INTERVAL = 2.0
+
+class ProgressReporter:
+    """Writes stage progress to the job row, throttled so large runs do not flood Postgres"""
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._last_write: Dict[str, float] = {}
+
+    def __call__(self, stage: str, percent: float) -> None:
+        from indexing_job_dao import IndexingJobDAO
+
+        now = time.monotonic()
+        if percent not in (0, 100) and now - self._last_write.get(stage, 0.0) < PROGRESS_INTERVAL:
+            return
+        self._last_write[stage] = now
+        IndexingJobDAO.report_progress(self.job_id, stage, percent)
+
+def _heartbeat(job_id: int, done: threading.Event) -> None:
+    from indexing_job_dao import IndexingJobDAO
+
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            IndexingJobDAO.heartbeat(job_id)
+        except Exception as e:
+            logger.warning(f"Heartbeat for job {job_id} failed: {str(e)}")
+
+def worker_loop(stop: ProcessEvent, worker_index: int) -> None:
+    """Claim and run jobs until stop is set; finishes the current job first"""
+    # Imported here so each spawned process sets up its own clients and connections
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [indexer-{worker_index}] %(name)s: %(message)s")
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides when to stop
+    from embedding_manager import OpenAIEmbedder
+    from embedding_cache import CachedEmbedder
+    from indexer import RepoIndexer
+    from indexing_job_dao import IndexingJobDAO
+    from ingestor import GitHubIngestor
+    from processed_document_dao import ProcessedDocumentDAO
+    from processor import GitHubProcessor
+    from snapshot_cache import SnapshotCache
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    embedder = CachedEmbedder(OpenAIEmbedder())
+    document_dao = ProcessedDocumentDAO(embedder=embedder)
+    snapshot_cache = SnapshotCache()
+
+    try:
+        while not stop.is_set():
+            try:
+                job = IndexingJobDAO.claim(worker_id)
+            except Exception as e:
+                logger.error(f"Claiming a job failed: {str(e)}")
+                job = None
+            if job is None:
+                stop.wait(POLL_INTERVAL)
+                continue
+
+            logger.info(f"Indexing {job['repo_id']}@{job['commit'][:12]} (job {job['id']}, attempt {job['attempts']})")
+            done = threading.Event()
+            threading.Thread(target=_heartbeat, args=(job['id'], done), daemon=True).start()
+            try:
+                ingestor = GitHubIngestor(
+                    url=job['repo_url'],
+                    cache=snapshot_cache,
+                    revision=(job['branch'], job['commit'])
+                )
+                processor = GitHubProcessor(embedder=embedder, processed_document_dao=document_dao)
+                stats = RepoIndexer(ingestor, processor, progress=ProgressReporter(job['id'])).run()
+                IndexingJobDAO.finish(job['id'], stats=stats)
+                logger.info(f"Job {job['id']} completed; embedding cache: {embedder.cache.stats()}")
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                IndexingJobDAO.finish(job['id'], error=str(e))
+            finally:
+                done.set()
+    finally:
+        document_dao.close()
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    workers = int(os.getenv("INDEX_WORKERS", "2"))
+
+    # spawn: each worker builds its own connections; not daemonic, so workers may run chunking pools
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    processes = [
+        context.Process(target=worker_loop, args=(stop, index), name=f"indexer-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {workers} indexing workers")
+
+    def request_stop(signum, frame):
+        logger.info("Stopping after current jobs")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()